@@ -0,0 +1,163 @@
+import os
+import glob
+import time
+import sqlite3
+import logging
+import threading
+import multiprocessing
+from datetime import date, timedelta
+from concurrent.futures import ProcessPoolExecutor
+
+import db_manager
+
+# Configuración
+UMBRAL_BASES_PARALELO = 16   # a partir de aquí las BD pendientes se reparten entre procesos
+MAX_PROCESOS_ANALITICA = int(os.getenv("STOCKAI_PROCESOS_ANALITICA", str(min(4, os.cpu_count() or 1))))
+DIAS_RECIENTES = 30          # ventana del gasto y del volumen de ingesta recientes
+MAX_INTERVALOS_SIN_COMPRA = 3  # un producto sin compras en más de 3 intervalos se considera descatalogado
+VERSION_ESQUEMA_MINIMA = 5   # las consultas del resumen usan la fecha ISO y las incidencias del esquema v5
+
+# Vista de administración sobre todas las BD de empresa. Cada BD se resume por separado (en un pool de
+# procesos si hay muchas pendientes) y el resumen se guarda en memoria con la firma de sus ficheros
+# (tamaño y fecha de modificación de .db y -wal): en la siguiente llamada solo se recalculan las BD que han
+# cambiado. Las alertas dependen también del día, que forma parte de la clave.
+
+
+def _firma(db_path):
+    firma = []
+    for ruta in (db_path, f"{db_path}-wal"):
+        try:
+            estado = os.stat(ruta)
+        except FileNotFoundError:
+            firma.append(None)
+            continue
+        # Un -wal vacío es lo mismo que no tenerlo (SQLite lo crea y lo borra al abrir y cerrar conexiones)
+        firma.append((estado.st_mtime_ns, estado.st_size) if estado.st_size else None)
+    return tuple(firma)
+
+def resumir_empresa(db_path, hoy, tiempo_reposicion):
+    """
+    Resumen de una BD de empresa: facturas, líneas, gasto total y reciente, incidencias y alertas de pedido.
+    Una alerta es un producto comprado con regularidad cuyo próximo pedido toca antes de que llegue la
+    reposición: días desde la última compra + tiempo de reposición >= intervalo medio entre compras.
+    Se ejecuta en los procesos del pool: solo recibe y devuelve tipos simples. Es de solo lectura: las BD con
+    un esquema anterior a VERSION_ESQUEMA_MINIMA no se migran aquí, se devuelven con un error (se migran al
+    abrirlas desde la aplicación o al ingestar una factura).
+    """
+    desde = (date.fromisoformat(hoy) - timedelta(days=DIAS_RECIENTES)).isoformat()
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < VERSION_ESQUEMA_MINIMA:
+            return {"error": f"esquema v{version} pendiente de migrar (se necesita v{VERSION_ESQUEMA_MINIMA})"}
+        facturas, gasto_total, gasto_reciente, facturas_recientes, ultima_factura = conn.execute("""
+            SELECT COUNT(*), COALESCE(SUM(total_factura), 0),
+                   COALESCE(SUM(CASE WHEN fecha >= :desde THEN total_factura END), 0),
+                   COUNT(CASE WHEN fecha >= :desde THEN 1 END), MAX(fecha)
+            FROM cabeceras_factura
+        """, {"desde": desde}).fetchone()
+        lineas, incidencias = conn.execute("""
+            SELECT COUNT(*), COUNT(CASE WHEN l.incidencias IS NOT NULL OR c.incidencias IS NOT NULL THEN 1 END)
+            FROM lineas_factura l JOIN cabeceras_factura c ON c.id = l.factura_id
+        """).fetchone()
+        alertas = conn.execute("""
+            SELECT nombre, ultima_fecha, ROUND(total_unidades / dias_historial, 2), ROUND(intervalo, 1), dias_sin_compra
+            FROM (
+                SELECT p.nombre, d.ultima_fecha, d.total_unidades,
+                       julianday(d.ultima_fecha) - julianday(d.primera_fecha) AS dias_historial,
+                       (julianday(d.ultima_fecha) - julianday(d.primera_fecha)) / (d.dias_con_compra - 1) AS intervalo,
+                       CAST(julianday(:hoy) - julianday(d.ultima_fecha) AS INTEGER) AS dias_sin_compra
+                FROM demanda_producto d JOIN productos p ON p.id = d.producto_id
+                WHERE d.dias_con_compra >= 2 AND d.ultima_fecha > d.primera_fecha
+            )
+            WHERE dias_sin_compra + :reposicion >= intervalo AND dias_sin_compra <= :max_intervalos * intervalo
+            ORDER BY dias_sin_compra - intervalo DESC
+        """, {"hoy": hoy, "reposicion": tiempo_reposicion, "max_intervalos": MAX_INTERVALOS_SIN_COMPRA}).fetchall()
+    finally:
+        conn.close()
+    return {
+        "facturas": facturas, "lineas": lineas, "incidencias": incidencias,
+        "gasto_total": round(gasto_total, 2), "gasto_reciente": round(gasto_reciente, 2),
+        "facturas_recientes": facturas_recientes, "ultima_factura": ultima_factura,
+        "alertas": [dict(zip(("producto", "ultima_compra", "demanda_diaria", "intervalo_dias", "dias_sin_compra"), fila))
+                    for fila in alertas],
+    }
+
+def _resumir_empresa_seguro(db_path, hoy, tiempo_reposicion):
+    try:
+        return resumir_empresa(db_path, hoy, tiempo_reposicion)
+    except sqlite3.Error as e:
+        return {"error": str(e)}
+
+_pool_procesos = None
+_pool_lock = threading.Lock()
+
+def _obtener_pool():
+    # "spawn": el pool se crea desde los hilos de Streamlit, y un fork copiaría los locks que tuvieran tomados
+    global _pool_procesos
+    with _pool_lock:
+        if _pool_procesos is None:
+            _pool_procesos = ProcessPoolExecutor(max_workers=MAX_PROCESOS_ANALITICA,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return _pool_procesos
+
+_cache = {}        # ruta de la BD -> (firma, hoy, tiempo_reposicion, resumen)
+_cache_lock = threading.Lock()
+
+def resumen_global(tiempo_reposicion=None, hoy=None, carpeta=None):
+    """
+    Resumen de todas las BD de empresa: {'empresas': [...], 'alertas': [...], 'ingesta_diaria': [...],
+    'totales': {...}, 'recalculadas': n}. Solo se recalculan las BD nuevas o modificadas desde la llamada
+    anterior (ver _firma). El volumen de ingesta sale del registro de documentos procesados.
+    """
+    from registro_procesados import obtener_registro
+
+    if tiempo_reposicion is None:
+        from punto_pedido import TIEMPO_REPOSICION_DIAS as tiempo_reposicion
+    hoy = hoy or date.today().isoformat()
+    rutas = sorted(glob.glob(os.path.join(carpeta or db_manager.CARPETA_BASES_DATOS, "*.db")))
+
+    firmas = {ruta: _firma(ruta) for ruta in rutas}
+    with _cache_lock:
+        pendientes = [ruta for ruta in rutas
+                      if _cache.get(ruta, (None,))[:3] != (firmas[ruta], hoy, tiempo_reposicion)]
+    if len(pendientes) >= UMBRAL_BASES_PARALELO and MAX_PROCESOS_ANALITICA > 1:
+        tamano = max(1, len(pendientes) // (MAX_PROCESOS_ANALITICA * 4))
+        resumenes = list(_obtener_pool().map(
+            _resumir_empresa_seguro, pendientes, [hoy] * len(pendientes), [tiempo_reposicion] * len(pendientes),
+            chunksize=tamano))
+    else:
+        resumenes = [_resumir_empresa_seguro(ruta, hoy, tiempo_reposicion) for ruta in pendientes]
+    with _cache_lock:
+        for ruta, resumen in zip(pendientes, resumenes):
+            _cache[ruta] = (firmas[ruta], hoy, tiempo_reposicion, resumen)
+        for ruta in set(_cache) - set(rutas):
+            del _cache[ruta]
+        actuales = {ruta: _cache[ruta][3] for ruta in rutas}
+    if pendientes:
+        logging.info(f"🌐 Analítica global: {len(pendientes)} de {len(rutas)} BD recalculadas.")
+
+    ingesta_diaria = [{"dia": dia, "empresa": empresa, "facturas": n} for dia, empresa, n in
+                      obtener_registro().ingestas_por_dia(time.time() - DIAS_RECIENTES * 86400)]
+    ingestadas = {}
+    for fila in ingesta_diaria:
+        ingestadas[fila["empresa"]] = ingestadas.get(fila["empresa"], 0) + fila["facturas"]
+
+    empresas, alertas = [], []
+    for ruta, resumen in actuales.items():
+        empresa = os.path.splitext(os.path.basename(ruta))[0]
+        if "error" in resumen:
+            logging.warning(f"⚠️ No se pudo resumir la BD de '{empresa}': {resumen['error']}")
+            empresas.append({"empresa": empresa, "error": resumen["error"]})
+            continue
+        empresas.append({"empresa": empresa, **{k: v for k, v in resumen.items() if k != "alertas"},
+                         "alertas": len(resumen["alertas"]), "ingestadas_recientes": ingestadas.get(empresa, 0)})
+        alertas += [{"empresa": empresa, **alerta} for alerta in resumen["alertas"]]
+
+    validas = [e for e in empresas if "error" not in e]
+    totales = {campo: sum(e[campo] for e in validas)
+               for campo in ("facturas", "lineas", "incidencias", "gasto_total", "gasto_reciente", "facturas_recientes",
+                             "alertas", "ingestadas_recientes")}
+    totales["empresas"] = len(empresas)
+    return {"empresas": empresas, "alertas": alertas, "ingesta_diaria": ingesta_diaria, "totales": totales,
+            "recalculadas": len(pendientes)}
@@ -1,98 +1,103 @@
 import streamlit as st
 import sqlite3
+import logging
+import db_manager
+import consultas
+import punto_pedido
+from registro_procesados import obtener_registro, hash_bytes, TIPO_PDF
 import os
 import pandas as pd
 import json
-from datetime import datetime
+from datetime import datetime, date
 import base64 # Importa la librería base64
 
 # --- Configuraciones ---
-CARPETA_BASES_DATOS = "data/bases_datos"
-TIEMPO_REPOSICION_DIAS = 5  # estándar
+CARPETA_BASES_DATOS = db_manager.CARPETA_BASES_DATOS
+TIEMPO_REPOSICION_DIAS = punto_pedido.TIEMPO_REPOSICION_DIAS
 
 # Definir la ruta de la carpeta de facturas para el procesamiento
 CARPETA_FACTURAS_PENDIENTES = "data/facturas"
 CARPETA_FACTURAS_PROCESADAS = "data/facturas_procesadas"
 
-# Importar funciones de procesamiento de facturas desde read_invoice.py
-from read_invoice import procesar_facturas_en_carpeta # Importa la función principal
+# El procesamiento lo hace el trabajador de la cola (python cola_trabajos.py); la app solo encola trabajos.
+# Los módulos de la ingesta (cola, vigilante, métricas) se importan dentro de las páginas del administrador:
+# un usuario de empresa que solo ve su dashboard no los carga nunca. El registro de procesados solo usa la
+# biblioteca estándar y abre su BD en el primer uso.
 
 # --- Funciones de Usuarios ---
-def cargar_usuarios():
-    with open("users.json", "r") as f:
+# users.json se lee una vez y se vuelve a leer solo cuando cambia (la clave de la caché incluye su fecha de modificación)
+@st.cache_data(show_spinner=False, max_entries=4)
+def _leer_usuarios(ruta, modificado):
+    with open(ruta, "r") as f:
         return json.load(f)
 
+def cargar_usuarios(ruta="users.json"):
+    return _leer_usuarios(ruta, os.path.getmtime(ruta))
+
 USUARIOS = cargar_usuarios()
 
 # --- Funciones de datos ---
-def obtener_datos_empresa(nombre_empresa):
-    db_path = os.path.join(CARPETA_BASES_DATOS, f"{nombre_empresa}.db")
-    if not os.path.exists(db_path):
-        return pd.DataFrame()
-    conn = sqlite3.connect(db_path)
-    df = pd.read_sql_query("SELECT * FROM facturas", conn)
-    conn.close()
-    return df
-
-def calcular_punto_pedido(df):
-    if df.empty:
-        return pd.DataFrame()
-
-    df["fecha_emision"] = pd.to_datetime(df["fecha_emision"], errors="coerce")
-    df["cantidad"] = pd.to_numeric(df["cantidad"].str.extract(r"([\d,.]+)")[0].str.replace(".", "").str.replace(",", "."), errors='coerce')
-    df = df.dropna(subset=["fecha_emision", "nombre_producto", "cantidad"])
-
-    df_grouped = df.groupby(["nombre_producto", "fecha_emision"]).agg({"cantidad": "sum"}).reset_index()
-
-    resultados = []
-    for producto, grupo in df_grouped.groupby("nombre_producto"):
-        grupo = grupo.sort_values("fecha_emision")
-        if len(grupo) < 2:
-            continue
-
-        total_dias = (grupo["fecha_emision"].max() - grupo["fecha_emision"].min()).days
-        total_unidades = grupo["cantidad"].sum()
-
-        if total_dias == 0:
-            demanda_diaria = total_unidades
-        else:
-            demanda_diaria = total_unidades / total_dias
+# Las consultas se cachean con st.cache_data. La clave incluye la versión de datos de la BD
+# (consultas.version_datos), que cambia con cada ingesta o eliminación, así que la caché se invalida sola.
+@st.cache_data(show_spinner=False, max_entries=64)
+def obtener_resumen_demanda(nombre_empresa, version):
+    return consultas.resumen_demanda(nombre_empresa)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def obtener_prevision_demanda(nombre_empresa, version):
+    # Solo lectura: el reajuste se hace antes, fuera de la caché (ver mostrar_dashboard_empresa)
+    return consultas.prevision_demanda_empresa(nombre_empresa)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def obtener_resumen_filtros(nombre_empresa, version):
+    return consultas.resumen_filtros(nombre_empresa)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def obtener_num_incidencias(nombre_empresa, version):
+    return consultas.contar_incidencias(nombre_empresa)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def obtener_total_lineas(nombre_empresa, version, desde, hasta, producto):
+    return consultas.contar_lineas(nombre_empresa, desde, hasta, producto)
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def obtener_pagina_facturas(nombre_empresa, version, desde, hasta, producto, pagina, tam_pagina):
+    return consultas.consultar_lineas(nombre_empresa, desde, hasta, producto,
+                                      limite=tam_pagina, desplazamiento=(pagina - 1) * tam_pagina)
 
-        stock_seguridad = demanda_diaria * 7 * 0.2
-        punto_pedido = (demanda_diaria * TIEMPO_REPOSICION_DIAS) + stock_seguridad
-
-        resultados.append({
-            "Producto": producto,
-            "Demanda diaria estimada": round(demanda_diaria, 2),
-            "Stock de seguridad": int(round(stock_seguridad)),
-            "Punto de pedido (unidades)": int(round(punto_pedido))
-        })
+# --- FUNCIÓN DE UTILIDAD: Contar facturas pendientes ---
+# Un único vigilante por proceso de Streamlit: mantiene en memoria el número de PDF pendientes
+# y encola cada PDF nuevo en cuanto termina de escribirse.
+@st.cache_resource
+def obtener_vigilante():
+    import cola_trabajos
+    from vigilante_facturas import VigilanteFacturas
 
-    return pd.DataFrame(resultados)
+    return VigilanteFacturas(CARPETA_FACTURAS_PENDIENTES, al_detectar=cola_trabajos.obtener_cola().encolar).iniciar()
 
-# --- FUNCIÓN DE UTILIDAD: Contar facturas pendientes ---
 def contar_facturas_pendientes():
-    # Asegúrate de que la carpeta exista antes de intentar listar su contenido
-    if not os.path.exists(CARPETA_FACTURAS_PENDIENTES):
-        return 0
-    return len([f for f in os.listdir(CARPETA_FACTURAS_PENDIENTES) if f.endswith(".pdf")])
+    return obtener_vigilante().pendientes
 
 
 # --- FUNCIÓN DE UTILIDAD: Eliminar factura de la base de datos ---
 def eliminar_factura_de_db(nombre_empresa, factura_id):
     db_path = os.path.join(CARPETA_BASES_DATOS, f"{nombre_empresa}.db")
-    conn = None
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM facturas WHERE id = ?", (factura_id,))
-        conn.commit()
-        st.success(f"Factura con ID {factura_id} eliminada de la base de datos.")
+        with db_manager.transaccion(db_path) as conn:
+            fila = conn.execute("SELECT numero_factura FROM facturas WHERE id = ?", (factura_id,)).fetchone()
+            db_manager.eliminar_linea(conn, factura_id)
+            cabecera_eliminada = fila is not None and not db_manager.factura_existe(conn, fila[0])
     except sqlite3.Error as e:
         st.error(f"Error al eliminar factura con ID {factura_id}: {e}")
-    finally:
-        if conn:
-            conn.close()
+        return
+    st.success(f"Factura con ID {factura_id} eliminada de la base de datos.")
+    # Sin líneas, la factura desaparece: su PDF se puede volver a subir. La línea ya está borrada aunque esto falle.
+    if cabecera_eliminada:
+        try:
+            obtener_registro().olvidar(nombre_empresa, fila[0])
+        except sqlite3.Error as e:
+            logging.error(f"❌ No se pudo quitar la factura {fila[0]} de {nombre_empresa} del registro de procesados: {e}")
+            st.warning(f"La factura {fila[0]} se eliminó, pero su PDF seguirá marcado como procesado: {e}")
 
 # --- Login ---
 def login():
@@ -112,50 +117,63 @@ def mostrar_dashboard_empresa(nombre_empresa):
     st.title(f"📦 Stock AI - {nombre_empresa.replace('_', ' ').title()}")
 
     tabs = st.tabs(["📊 Punto de Pedido", "📄 Ver Facturas"])
+    version = consultas.version_datos(nombre_empresa)
 
-    with tabs[0]: # Punto de Pedido
-        df = obtener_datos_empresa(nombre_empresa)
-        if df.empty:
+    with tabs[0]: # Punto de Pedido - previsión de demanda intermitente y stock de seguridad por nivel de servicio
+        resumen = obtener_resumen_demanda(nombre_empresa, version)
+        if resumen.empty:
             st.info("🔍 No hay facturas disponibles. Sube una para comenzar.")
         else:
-            tabla = calcular_punto_pedido(df)
+            # La ingesta ya reajusta la previsión; aquí quedan los productos de facturas eliminadas (o todos,
+            # tras cambiar de modelo). Después de leer `version`: lo guardado en caché nunca es más antiguo que ella
+            consultas.actualizar_prevision_empresa(nombre_empresa)
+            nivel_servicio = st.select_slider("Nivel de servicio", options=[0.90, 0.95, 0.98, 0.99],
+                                              value=punto_pedido.NIVEL_SERVICIO, format_func=lambda v: f"{v:.0%}")
+            tabla = punto_pedido.calcular_desde_prevision(obtener_prevision_demanda(nombre_empresa, version),
+                                                          tiempo_reposicion=TIEMPO_REPOSICION_DIAS,
+                                                          nivel_servicio=nivel_servicio)
             if tabla.empty:
                 st.warning("⚠️ No hay suficiente historial para calcular el punto de pedido.")
             else:
                 st.markdown("<h4 style='color:#4CAF50'>Punto de Pedido Calculado</h4>", unsafe_allow_html=True)
                 st.dataframe(tabla, use_container_width=True)
 
-    with tabs[1]: # Ver Facturas - MODIFICADA para incluir eliminar
-        df = obtener_datos_empresa(nombre_empresa)
-        if df.empty:
+    with tabs[1]: # Ver Facturas - filtros y paginación resueltos en SQL
+        fecha_min, fecha_max, productos = obtener_resumen_filtros(nombre_empresa, version)
+        if not productos:
             st.warning("No hay facturas para mostrar.")
         else:
             st.subheader("📄 Historial de Facturas con Filtros y Eliminación")
 
-            df["fecha_emision"] = pd.to_datetime(df["fecha_emision"], errors="coerce")
-            df["id"] = pd.to_numeric(df["id"], errors="coerce")
-
-            col1, col2 = st.columns(2)
+            col1, col2, col3 = st.columns([2, 2, 1])
             with col1:
-                fecha_min = df["fecha_emision"].min() if not df["fecha_emision"].empty else datetime.now().date()
-                fecha_max = df["fecha_emision"].max() if not df["fecha_emision"].empty else datetime.now().date()
+                # Las fechas ya vienen en ISO desde la BD: no hace falta interpretarlas con pandas
+                fecha_min = date.fromisoformat(fecha_min) if fecha_min else datetime.now().date()
+                fecha_max = date.fromisoformat(fecha_max) if fecha_max else datetime.now().date()
                 if fecha_min == fecha_max:
                     fechas_default = [fecha_min, fecha_max + pd.Timedelta(days=1)]
                 else:
                     fechas_default = [fecha_min, fecha_max]
                 fechas = st.date_input("Rango de fechas", fechas_default)
             with col2:
-                productos = df["nombre_producto"].dropna().unique().tolist()
                 producto_sel = st.selectbox("Producto", ["Todos"] + productos)
+            with col3:
+                tam_pagina = st.selectbox("Filas por página", [50, 100, 500], index=1)
+
+            desde, hasta = (fechas[0].isoformat(), fechas[1].isoformat()) if fechas and len(fechas) == 2 else (None, None)
+            producto = None if producto_sel == "Todos" else producto_sel
 
-            df_filtrado = df.copy()
-            if fechas and len(fechas) == 2:
-                start, end = pd.to_datetime(fechas[0]), pd.to_datetime(fechas[1])
-                df_filtrado = df_filtrado[(df_filtrado["fecha_emision"] >= start) & (df_filtrado["fecha_emision"] <= end)]
-            if producto_sel != "Todos":
-                df_filtrado = df_filtrado[df_filtrado["nombre_producto"] == producto_sel]
+            total = obtener_total_lineas(nombre_empresa, version, desde, hasta, producto)
+            num_paginas = max(1, -(-total // tam_pagina))
+            pagina = st.number_input(f"Página (de {num_paginas})", min_value=1, max_value=num_paginas, value=1, step=1)
+            df_pagina = obtener_pagina_facturas(nombre_empresa, version, desde, hasta, producto, int(pagina), tam_pagina)
 
-            st.dataframe(df_filtrado.sort_values("fecha_emision", ascending=False), use_container_width=True)
+            st.caption(f"{total} línea(s) encontradas.")
+            num_incidencias = obtener_num_incidencias(nombre_empresa, version)
+            if num_incidencias:
+                st.warning(f"⚠️ {num_incidencias} línea(s) con datos no válidos (fecha o importes que no se pudieron interpretar). "
+                           "Se indican en la columna 'incidencias'.")
+            st.dataframe(df_pagina, use_container_width=True)
 
             st.markdown("---")
             st.subheader("Eliminar Factura por ID")
@@ -163,7 +181,7 @@ def mostrar_dashboard_empresa(nombre_empresa):
 
             if st.button("🗑️ Eliminar Factura Seleccionada"):
                 if factura_id_a_eliminar:
-                    if factura_id_a_eliminar in df_filtrado["id"].values:
+                    if consultas.linea_existe(nombre_empresa, factura_id_a_eliminar, desde, hasta, producto):
                         eliminar_factura_de_db(nombre_empresa, int(factura_id_a_eliminar))
                         st.rerun()
                     else:
@@ -174,19 +192,31 @@ def mostrar_dashboard_empresa(nombre_empresa):
 
 # --- NUEVA SECCIÓN: Gestión de Facturas para el Administrador ---
 def mostrar_gestion_facturas_admin():
+    import cola_trabajos
+
     st.title("⚙️ Stock AI - Gestión de Facturas")
 
     st.subheader("Subir y Procesar Facturas Pendientes")
     st.info("Sube aquí las facturas de CUALQUIER empresa. El sistema las identificará y procesará automáticamente.")
 
-    # Subir Factura
+    cola = cola_trabajos.obtener_cola()
+
+    # Subir Factura: se guarda y se encola con prioridad interactiva
     archivo = st.file_uploader("Selecciona un archivo PDF", type="pdf", key="admin_file_uploader")
     if archivo:
-        os.makedirs(CARPETA_FACTURAS_PENDIENTES, exist_ok=True)
-        ruta_destino = os.path.join(CARPETA_FACTURAS_PENDIENTES, archivo.name)
-        with open(ruta_destino, "wb") as f:
-            f.write(archivo.getbuffer())
-        st.success(f"Factura '{archivo.name}' subida correctamente. Pulsa 'Procesar Facturas Ahora' para que se añada a la base de datos.")
+        # getbuffer() es una vista sobre los bytes subidos: se calcula el hash y se escribe sin copiarlos
+        contenido = archivo.getbuffer()
+        previo = obtener_registro().buscar(hash_bytes(contenido), TIPO_PDF)
+        if previo:
+            st.info(f"La factura '{archivo.name}' ya fue procesada anteriormente (empresa '{previo['empresa']}', factura '{previo['numero_factura']}'). No se volverá a procesar.")
+        else:
+            os.makedirs(CARPETA_FACTURAS_PENDIENTES, exist_ok=True)
+            ruta_destino = os.path.join(CARPETA_FACTURAS_PENDIENTES, archivo.name)
+            # La cola es duradera: el trabajador lee el PDF de disco (una sola vez) en otro proceso
+            with open(ruta_destino, "wb") as f:
+                f.write(contenido)
+            cola.encolar(ruta_destino, prioridad=cola_trabajos.PRIORIDAD_INTERACTIVA)
+            st.success(f"Factura '{archivo.name}' subida y añadida a la cola de procesamiento.")
 
     st.markdown("---")
 
@@ -201,34 +231,132 @@ def mostrar_gestion_facturas_admin():
         st.info("No hay facturas pendientes de procesar en este momento.")
 
     if st.button("🚀 Procesar Facturas Ahora", key="process_invoices_admin_button"):
-        with st.spinner("Procesando facturas... Esto puede tomar un momento."):
-            try:
-                resumen_procesamiento = procesar_facturas_en_carpeta()
-                st.success("🎉 ¡Proceso de facturas completado!")
-                st.text(resumen_procesamiento)
-                st.rerun()
-            except Exception as e:
-                st.error(f"❌ Ocurrió un error general al procesar las facturas: {e}")
-        st.info("Para ver los cambios, elije una empresa en el menú lateral y navega a sus pestañas.")
+        archivos = [f for f in os.listdir(CARPETA_FACTURAS_PENDIENTES) if f.endswith(".pdf")] if os.path.exists(CARPETA_FACTURAS_PENDIENTES) else []
+        nuevos = [cola.encolar(os.path.join(CARPETA_FACTURAS_PENDIENTES, f)) for f in archivos]
+        nuevos = [t for t in nuevos if t is not None]
+        st.success(f"🎉 {len(nuevos)} factura(s) añadidas a la cola ({len(archivos) - len(nuevos)} ya estaban en cola).")
+
+    st.markdown("---")
+    mostrar_progreso_cola()
+    st.info("Para ver los cambios, elije una empresa en el menú lateral y navega a sus pestañas.")
+
+def mostrar_progreso_cola():
+    import cola_trabajos
+
+    cola = cola_trabajos.obtener_cola()
+    st.subheader("📋 Cola de Procesamiento")
+    conteo = cola.progreso()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Pendientes", conteo[cola_trabajos.PENDIENTE])
+    col2.metric("En curso", conteo[cola_trabajos.EN_CURSO])
+    col3.metric("Completadas", conteo[cola_trabajos.HECHO])
+    col4.metric("Fallidas", conteo[cola_trabajos.FALLIDO])
+    if conteo[cola_trabajos.PENDIENTE] or conteo[cola_trabajos.EN_CURSO]:
+        st.caption("Las facturas las procesa el trabajador en segundo plano (`python cola_trabajos.py`). Este panel se actualiza solo.")
+
+    recientes = cola.recientes()
+    if recientes:
+        df = pd.DataFrame(recientes)
+        df["archivo"] = df["ruta"].map(os.path.basename)
+        df["actualizado"] = pd.to_datetime(df["actualizado"], unit="s")
+        st.dataframe(df[["id", "archivo", "estado", "intentos", "resultado", "error", "actualizado"]], use_container_width=True)
+
+# Con st.fragment el panel de progreso se refresca solo, sin bloquear ni recargar toda la página
+if hasattr(st, "fragment"):
+    mostrar_progreso_cola = st.fragment(run_every=5)(mostrar_progreso_cola)
+
+
+# --- Métricas de la ingesta (las escriben los trabajadores en data/metricas/) ---
+@st.cache_data(show_spinner=False, ttl=30)
+def obtener_resumen_metricas(dias):
+    import metricas
+
+    return pd.DataFrame(metricas.resumen_por_etapa(metricas.leer_metricas(dias)))
+
+def mostrar_metricas_ingesta():
+    st.title("📈 Stock AI - Rendimiento de la Ingesta")
+    dias = st.selectbox("Periodo", (1, 7, 30), index=1, format_func=lambda d: "Hoy" if d == 1 else f"Últimos {d} días")
+    resumen = obtener_resumen_metricas(dias)
+    if resumen.empty:
+        st.info("Todavía no hay métricas. Se registran al procesar facturas con el trabajador de la cola.")
+        return
+
+    por_etapa = resumen.set_index("etapa")
+    facturas = por_etapa["ejecuciones"].get("procesar_factura", 0)
+    tokens = sum(int(resumen[c].sum()) for c in ("tokens_entrada", "tokens_salida") if c in resumen)
+    aciertos = resumen["aciertos_cache"].sum() if "aciertos_cache" in resumen else 0
+    fallos = resumen["fallos_cache"].sum() if "fallos_cache" in resumen else 0
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Facturas procesadas", int(facturas))
+    col2.metric("Tokens de OpenAI", f"{tokens:,}".replace(",", "."))
+    col3.metric("Aciertos de caché", f"{aciertos / (aciertos + fallos):.0%}" if aciertos + fallos else "-")
+
+    st.subheader("Tiempo por etapa")
+    columnas = ["etapa", "ejecuciones", "errores", "p50_s", "p95_s", "total_s"]
+    columnas += [c for c in ("llamadas_ia", "tokens_entrada", "tokens_salida", "aciertos_cache", "fallos_cache", "filas") if c in resumen]
+    st.dataframe(resumen[columnas].fillna(0), use_container_width=True, hide_index=True)
+    st.bar_chart(por_etapa[["p50_s", "p95_s"]])
+
+
+# --- Vista global: todas las empresas a la vez (analitica_global.py recalcula solo las BD que cambian) ---
+def mostrar_vista_global():
+    import analitica_global
+
+    st.title("🌐 Stock AI - Vista Global")
+    resumen = analitica_global.resumen_global(tiempo_reposicion=TIEMPO_REPOSICION_DIAS)
+    totales = resumen["totales"]
+    if not totales["empresas"]:
+        st.info("Todavía no hay bases de datos de empresa.")
+        return
+
+    dias = analitica_global.DIAS_RECIENTES
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Empresas", totales["empresas"])
+    col2.metric("Gasto total", f"{totales['gasto_total']:,.0f} €".replace(",", "."))
+    col3.metric(f"Gasto últimos {dias} días", f"{totales['gasto_reciente']:,.0f} €".replace(",", "."))
+    col4.metric("Alertas de pedido", totales["alertas"])
+
+    st.subheader("🏢 Empresas")
+    st.dataframe(pd.DataFrame(resumen["empresas"]), use_container_width=True, hide_index=True)
+
+    st.subheader("⚠️ Alertas de pedido")
+    if resumen["alertas"]:
+        st.caption(f"Productos cuyo próximo pedido toca antes de que llegue la reposición ({TIEMPO_REPOSICION_DIAS} días), "
+                   "según el intervalo medio entre compras.")
+        st.dataframe(pd.DataFrame(resumen["alertas"]), use_container_width=True, hide_index=True)
+    else:
+        st.success("No hay productos pendientes de pedir.")
+
+    st.subheader(f"📥 Facturas ingestadas (últimos {dias} días)")
+    if resumen["ingesta_diaria"]:
+        ingesta = pd.DataFrame(resumen["ingesta_diaria"]).pivot_table(index="dia", columns="empresa", values="facturas", aggfunc="sum")
+        st.bar_chart(ingesta)
+    else:
+        st.info(f"No se han procesado facturas en los últimos {dias} días.")
 
 
 # --- Función para convertir imagen a Base64 ---
+# La codificación se cachea por ruta y fecha de modificación: no se repite en cada rerun de Streamlit
+@st.cache_data(show_spinner=False, max_entries=4)
+def _codificar_imagen(image_path, modificado):
+    with open(image_path, "rb") as img_file:
+        # Detectar el tipo de imagen para el prefijo Base64 (puedes ajustar según tu logo)
+        # Para PNG: data:image/png;base64,
+        # Para JPG: data:image/jpeg;base64,
+        # Se asume PNG por defecto si el nombre es logo.png
+        if image_path.lower().endswith(".png"):
+            mime_type = "image/png"
+        elif image_path.lower().endswith((".jpg", ".jpeg")):
+            mime_type = "image/jpeg"
+        else:
+            mime_type = "image/x-icon" # Para .ico o tipos desconocidos, o puedes ajustar
+
+        encoded_string = base64.b64encode(img_file.read()).decode()
+        return f"data:{mime_type};base64,{encoded_string}"
+
 def get_base64_image(image_path):
     try:
-        with open(image_path, "rb") as img_file:
-            # Detectar el tipo de imagen para el prefijo Base64 (puedes ajustar según tu logo)
-            # Para PNG: data:image/png;base64,
-            # Para JPG: data:image/jpeg;base64,
-            # Se asume PNG por defecto si el nombre es logo.png
-            if image_path.lower().endswith(".png"):
-                mime_type = "image/png"
-            elif image_path.lower().endswith((".jpg", ".jpeg")):
-                mime_type = "image/jpeg"
-            else:
-                mime_type = "image/x-icon" # Para .ico o tipos desconocidos, o puedes ajustar
-
-            encoded_string = base64.b64encode(img_file.read()).decode()
-            return f"data:{mime_type};base64,{encoded_string}"
+        return _codificar_imagen(image_path, os.path.getmtime(image_path))
     except FileNotFoundError:
         st.error(f"Error: No se encontró el archivo de logo en la ruta: {image_path}")
         return None
@@ -290,10 +418,12 @@ else:
         st.sidebar.subheader("Opciones de Administrador")
         opcion_admin = st.sidebar.radio(
             "Selecciona una acción:",
-            ("Ver Dashboards de Empresas", "Gestionar Carga de Facturas")
+            ("Ver Dashboards de Empresas", "Vista Global", "Gestionar Carga de Facturas", "Métricas de Ingesta")
         )
 
-        if opcion_admin == "Ver Dashboards de Empresas":
+        if opcion_admin == "Vista Global":
+            mostrar_vista_global()
+        elif opcion_admin == "Ver Dashboards de Empresas":
             empresas_disponibles = [u for u in USUARIOS if USUARIOS[u]["rol"] == "empresa"]
             if empresas_disponibles:
                 empresa_seleccionada = st.sidebar.selectbox("Seleccionar empresa", empresas_disponibles, key="admin_empresa_select")
@@ -304,6 +434,8 @@ else:
                 st.info("No hay empresas configuradas. Por favor, añada usuarios con rol 'empresa' en `users.json`.")
         elif opcion_admin == "Gestionar Carga de Facturas":
             mostrar_gestion_facturas_admin()
+        elif opcion_admin == "Métricas de Ingesta":
+            mostrar_metricas_ingesta()
 
     else: # Rol "empresa"
         mostrar_dashboard_empresa(usuario)
@@ -0,0 +1,66 @@
+"""
+Benchmark de la vista global del administrador (analitica_global.resumen_global) con cientos de empresas:
+tiempo en frío (todas las BD se resumen), en caliente (nada ha cambiado) y tras modificar unas pocas BD.
+
+Uso:
+    python benchmarks/bench_analitica.py --empresas 100 300 --lineas 2000
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+from comun import RAIZ_REPOSITORIO, guardar_resultados
+from bench_consultas import generar_bd
+import db_manager
+import analitica_global
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--empresas", type=int, nargs="+", default=[100, 300])
+    parser.add_argument("--lineas", type=int, default=2000, help="Líneas de factura por empresa.")
+    parser.add_argument("--modificadas", type=int, default=5, help="BD modificadas antes de la medición incremental.")
+    parser.add_argument("--salida", default=None, help="Archivo JSON de resultados (por defecto en benchmarks/resultados/).")
+    args = parser.parse_args()
+    salida = os.path.abspath(args.salida) if args.salida else None
+
+    resultados = []
+    print(f"{'empresas':>9} {'frío (s)':>9} {'caliente (s)':>13} {'incremental (s)':>16} {'alertas':>8}")
+    for num_empresas in args.empresas:
+        carpeta_trabajo = tempfile.mkdtemp(prefix="stockai_bench_")
+        os.chdir(carpeta_trabajo)
+        for n in range(num_empresas):
+            generar_bd(db_manager.ruta_bd_empresa(f"empresa_{n:04d}"), args.lineas, num_productos=50, semilla=n)
+        db_manager.cerrar_conexiones()
+        analitica_global._cache.clear()
+
+        hoy = "2025-01-15"
+        inicio = time.perf_counter()
+        resumen = analitica_global.resumen_global(hoy=hoy)
+        t_frio = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        analitica_global.resumen_global(hoy=hoy)
+        t_caliente = time.perf_counter() - inicio
+
+        for n in range(args.modificadas):
+            with db_manager.transaccion(db_manager.ruta_bd_empresa(f"empresa_{n:04d}")) as conn:
+                db_manager.insertar_factura(conn, f"NUEVA-{n}", "10/01/2025", 10.0, [("Producto 00001", 5.0, 2.0, 10.0)])
+        inicio = time.perf_counter()
+        recalculo = analitica_global.resumen_global(hoy=hoy)
+        t_incremental = time.perf_counter() - inicio
+
+        db_manager.cerrar_conexiones()
+        os.chdir(RAIZ_REPOSITORIO)
+        shutil.rmtree(carpeta_trabajo, ignore_errors=True)
+        resultados.append({"empresas": num_empresas, "frio_s": round(t_frio, 3), "caliente_s": round(t_caliente, 4),
+                           "incremental_s": round(t_incremental, 4), "recalculadas": recalculo["recalculadas"],
+                           "alertas": resumen["totales"]["alertas"]})
+        print(f"{num_empresas:>9} {t_frio:>9.3f} {t_caliente:>13.4f} {t_incremental:>16.4f} {resumen['totales']['alertas']:>8}")
+
+    guardar_resultados("analitica", vars(args), resultados, salida)
+
+
+if __name__ == "__main__":
+    main()
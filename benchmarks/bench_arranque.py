@@ -0,0 +1,83 @@
+"""
+Benchmark del arranque en frío: tiempo de importación de cada conjunto de módulos en un intérprete nuevo y
+qué dependencias pesadas arrastra. Cada medición se repite en un proceso y una carpeta de trabajo nuevos,
+y comprueba también que importar no crea carpetas ni configura logging.
+
+- dashboard: lo que carga app.py para un usuario de empresa (consultas, punto de pedido y registro de procesados);
+- administracion: lo que cargan además las páginas del administrador (cola, vigilante, métricas);
+- ingesta: read_invoice, que solo usan el trabajador y la línea de comandos.
+
+Uso:
+    python benchmarks/bench_arranque.py --repeticiones 5
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+from comun import RAIZ_REPOSITORIO, guardar_resultados
+
+CONJUNTOS = {
+    "dashboard": ["db_manager", "consultas", "punto_pedido", "registro_procesados"],
+    "administracion": ["cola_trabajos", "vigilante_facturas", "metricas"],
+    "ingesta": ["read_invoice"],
+}
+DEPENDENCIAS_PESADAS = ["pandas", "numpy", "openai", "fitz", "dotenv", "streamlit"]
+
+_MEDIR = """
+import os, sys, json, time, logging, importlib
+inicio = time.perf_counter()
+for modulo in {modulos!r}:
+    importlib.import_module(modulo)
+segundos = time.perf_counter() - inicio
+print(json.dumps({{
+    "segundos": segundos,
+    "dependencias": [m for m in {pesadas!r} if m in sys.modules],
+    "carpetas_creadas": sorted(os.listdir(".")),
+    "logging_configurado": bool(logging.getLogger().handlers),
+}}))
+"""
+
+
+def medir_importacion(modulos):
+    """Importa `modulos` en un intérprete nuevo, en una carpeta vacía. Devuelve el dict que imprime el hijo."""
+    with tempfile.TemporaryDirectory(prefix="stockai_bench_") as carpeta:
+        proceso = subprocess.run(
+            [sys.executable, "-c", _MEDIR.format(modulos=modulos, pesadas=DEPENDENCIAS_PESADAS)],
+            cwd=carpeta, capture_output=True, text=True, env={**os.environ, "PYTHONPATH": RAIZ_REPOSITORIO},
+        )
+    if proceso.returncode != 0:
+        raise RuntimeError(proceso.stderr.strip().splitlines()[-1])
+    return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--salida", default=None, help="Archivo JSON de resultados (por defecto en benchmarks/resultados/).")
+    args = parser.parse_args()
+
+    resultados = []
+    print(f"{'conjunto':>15} {'mediana (ms)':>13} {'mín (ms)':>9}  dependencias pesadas / efectos")
+    for nombre, modulos in CONJUNTOS.items():
+        try:
+            mediciones = [medir_importacion(modulos) for _ in range(args.repeticiones)]
+        except RuntimeError as e:
+            print(f"{nombre:>15}  no se puede importar aquí: {e}")
+            continue
+        tiempos = [m["segundos"] * 1000 for m in mediciones]
+        ultima = mediciones[-1]
+        efectos = ([f"carpetas {ultima['carpetas_creadas']}"] if ultima["carpetas_creadas"] else []) + \
+                  (["logging configurado"] if ultima["logging_configurado"] else [])
+        resultados.append({"conjunto": nombre, "modulos": modulos, "mediana_ms": round(statistics.median(tiempos), 1),
+                           "minimo_ms": round(min(tiempos), 1), **ultima})
+        print(f"{nombre:>15} {statistics.median(tiempos):>13.1f} {min(tiempos):>9.1f}  "
+              f"{', '.join(ultima['dependencias']) or '-'}{' ⚠️ ' + '; '.join(efectos) if efectos else ''}")
+
+    guardar_resultados("arranque", vars(args), resultados, args.salida)
+
+
+if __name__ == "__main__":
+    main()
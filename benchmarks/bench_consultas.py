@@ -0,0 +1,88 @@
+"""
+Benchmark de lectura sobre BD de empresa de distintos tamaños (10k–10M líneas): tiempo de carga de
+consultas.obtener_datos_empresa (todas las columnas y solo las del punto de pedido), memoria del DataFrame
+y tiempo del punto de pedido calculado desde las líneas y desde los agregados de la ingesta.
+
+Uso:
+    python benchmarks/bench_consultas.py --lineas 10000 100000 1000000
+    python benchmarks/bench_consultas.py --lineas 10000000 --repeticiones 1
+"""
+import os
+import shutil
+import random
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+from comun import RAIZ_REPOSITORIO, guardar_resultados, cronometrar
+import db_manager
+import consultas
+import punto_pedido
+
+EMPRESA = "empresa_benchmark"
+COLUMNAS_PUNTO_PEDIDO = ["nombre_producto", "fecha_emision", "cantidad"]
+
+
+def generar_bd(db_path, num_lineas, lineas_por_factura=10, num_productos=500, semilla=42):
+    """Rellena una BD de empresa con `num_lineas` líneas sintéticas repartidas en facturas de 3 años."""
+    rng = random.Random(semilla)
+    inicio = date(2022, 1, 1)
+    num_facturas = max(1, num_lineas // lineas_por_factura)
+    db_manager.asegurar_esquema(db_path)
+    with db_manager.transaccion(db_path) as conn:
+        conn.executemany("INSERT INTO productos (id, nombre) VALUES (?, ?)",
+                         ((i, f"Producto {i:05d}") for i in range(1, num_productos + 1)))
+        conn.executemany(
+            "INSERT INTO cabeceras_factura (id, numero_factura, fecha_emision, fecha, total_factura) VALUES (?, ?, ?, ?, ?)",
+            ((i, f"F-{i:08d}", f"{fecha:%d/%m/%Y}", fecha.isoformat(), 0.0)
+             for i, fecha in ((i, inicio + timedelta(days=rng.randrange(3 * 365))) for i in range(1, num_facturas + 1))))
+        conn.executemany(
+            "INSERT INTO lineas_factura (factura_id, producto_id, cantidad, precio_unitario, total_producto) VALUES (?, ?, ?, ?, ?)",
+            ((min(n // lineas_por_factura + 1, num_facturas), rng.randint(1, num_productos), float(c), 1.5, 1.5 * c)
+             for n, c in ((n, rng.randint(1, 500)) for n in range(num_lineas))))
+        db_manager.reconstruir_agregados(conn)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lineas", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--productos", type=int, default=500)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--salida", default=None, help="Archivo JSON de resultados (por defecto en benchmarks/resultados/).")
+    args = parser.parse_args()
+    salida = os.path.abspath(args.salida) if args.salida else None
+
+    resultados = []
+    print(f"{'líneas':>10} {'generar (s)':>12} {'cargar todo (s)':>16} {'cargar 3 col (s)':>17} {'MB':>8} "
+          f"{'pp líneas (s)':>14} {'pp agregados (s)':>17}")
+    for num_lineas in args.lineas:
+        carpeta_trabajo = tempfile.mkdtemp(prefix="stockai_bench_")
+        os.chdir(carpeta_trabajo)
+        os.makedirs(db_manager.CARPETA_BASES_DATOS, exist_ok=True)
+        db_path = db_manager.ruta_bd_empresa(EMPRESA)
+
+        t_generar, _ = cronometrar(generar_bd, db_path, num_lineas, num_productos=args.productos)
+        t_todo, df = cronometrar(consultas.obtener_datos_empresa, EMPRESA, repeticiones=args.repeticiones)
+        megas = df.memory_usage(deep=True).sum() / 1e6
+        del df
+        t_columnas, df = cronometrar(consultas.obtener_datos_empresa, EMPRESA, COLUMNAS_PUNTO_PEDIDO, repeticiones=args.repeticiones)
+        t_pp_lineas, _ = cronometrar(punto_pedido.calcular_punto_pedido, df, repeticiones=args.repeticiones)
+        del df
+        t_pp_agregados, _ = cronometrar(
+            lambda: punto_pedido.calcular_desde_resumen(consultas.resumen_demanda(EMPRESA)), repeticiones=args.repeticiones)
+        db_manager.cerrar_conexiones()
+        os.chdir(RAIZ_REPOSITORIO)
+        shutil.rmtree(carpeta_trabajo, ignore_errors=True)
+
+        resultados.append({
+            "lineas": num_lineas, "generar_s": round(t_generar, 3), "cargar_todo_s": round(t_todo, 4),
+            "cargar_columnas_s": round(t_columnas, 4), "memoria_mb": round(megas, 1),
+            "punto_pedido_lineas_s": round(t_pp_lineas, 4), "punto_pedido_agregados_s": round(t_pp_agregados, 4),
+        })
+        print(f"{num_lineas:>10} {t_generar:>12.2f} {t_todo:>16.3f} {t_columnas:>17.3f} {megas:>8.1f} "
+              f"{t_pp_lineas:>14.3f} {t_pp_agregados:>17.4f}")
+
+    guardar_resultados("consultas", vars(args), resultados, salida)
+
+
+if __name__ == "__main__":
+    main()
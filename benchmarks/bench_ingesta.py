@@ -0,0 +1,104 @@
+"""
+Benchmark de la ingesta de principio a fin, sin llamadas reales a OpenAI: genera facturas PDF sintéticas,
+arranca el servidor OpenAI falso y procesa la carpeta con read_invoice.procesar_facturas_en_carpeta.
+Cada configuración se ejecuta en un proceso y una carpeta de trabajo nuevos (cachés, plantillas y BD vacías).
+
+Uso:
+    python benchmarks/bench_ingesta.py --facturas 50 --concurrencia 1 4 8 --latencia 0.8
+    python benchmarks/bench_ingesta.py --facturas 200 --sin-plantillas --tasa-error 0.05
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+
+from comun import RAIZ_REPOSITORIO, guardar_resultados
+
+
+def _ejecutar_configuracion(parametros):
+    """Proceso hijo: una ingesta completa en una carpeta de trabajo temporal. Devuelve un dict de resultados."""
+    from generar_facturas import generar_carpeta
+    from servidor_openai_falso import ServidorOpenAIFalso
+
+    carpeta_trabajo = tempfile.mkdtemp(prefix="stockai_bench_")
+    os.chdir(carpeta_trabajo)
+    servidor = ServidorOpenAIFalso(latencia=parametros["latencia"], tasa_error=parametros["tasa_error"], semilla=1).iniciar()
+    os.environ.update(OPENAI_BASE_URL=servidor.url, OPENAI_API_KEY="falsa")
+    if parametros["sin_plantillas"]:
+        os.environ["STOCKAI_PLANTILLAS"] = "0"
+    generar_carpeta("data/facturas", parametros["facturas"], parametros["lineas"], parametros["paginas"])
+
+    # Se importa después de preparar el entorno y la carpeta de trabajo (rutas relativas, variables de entorno)
+    import read_invoice
+    import metricas
+    from planificador_llm import obtener_planificador
+
+    inicio = time.perf_counter()
+    read_invoice.procesar_facturas_en_carpeta(parametros["concurrencia"])
+    segundos = time.perf_counter() - inicio
+
+    lineas = 0
+    carpeta_bd = read_invoice.CARPETA_BASES_DATOS
+    for nombre in os.listdir(carpeta_bd):
+        if nombre.endswith(".db"):
+            with sqlite3.connect(os.path.join(carpeta_bd, nombre)) as conn:
+                lineas += conn.execute("SELECT COUNT(*) FROM lineas_factura").fetchone()[0]
+    servidor.detener()
+    etapas = metricas.resumen_por_etapa(metricas.leer_metricas(1))
+    os.chdir(RAIZ_REPOSITORIO)
+    shutil.rmtree(carpeta_trabajo, ignore_errors=True)
+    return {
+        **parametros,
+        "segundos": round(segundos, 3),
+        "facturas_por_minuto": round(parametros["facturas"] * 60 / segundos, 1),
+        "lineas_guardadas": lineas,
+        "peticiones_servidor": servidor.peticiones,
+        "errores_simulados": servidor.errores,
+        "planificador": obtener_planificador().estadisticas(),
+        "etapas": etapas,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--facturas", type=int, default=50)
+    parser.add_argument("--lineas", type=int, default=20)
+    parser.add_argument("--paginas", type=int, default=None)
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--latencia", type=float, default=0.5, help="Latencia media del servidor falso (s).")
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    parser.add_argument("--sin-plantillas", action="store_true", help="Extraer todas las facturas con la IA.")
+    parser.add_argument("--salida", default=None, help="Archivo JSON de resultados (por defecto en benchmarks/resultados/).")
+    parser.add_argument("--_configuracion", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._configuracion:
+        print(json.dumps(_ejecutar_configuracion(json.loads(args._configuracion)), default=str))
+        return
+
+    resultados = []
+    print(f"{'hilos':>6} {'facturas':>9} {'segundos':>9} {'facturas/min':>13} {'peticiones IA':>14} {'líneas':>8}")
+    for concurrencia in args.concurrencia:
+        parametros = {"facturas": args.facturas, "lineas": args.lineas, "paginas": args.paginas, "concurrencia": concurrencia,
+                      "latencia": args.latencia, "tasa_error": args.tasa_error, "sin_plantillas": args.sin_plantillas}
+        proceso = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--_configuracion", json.dumps(parametros)],
+            capture_output=True, text=True, env={**os.environ, "PYTHONPATH": RAIZ_REPOSITORIO},
+        )
+        if proceso.returncode != 0:
+            print(proceso.stderr[-2000:], file=sys.stderr)
+            raise SystemExit(f"La configuración con {concurrencia} hilos ha fallado.")
+        resultado = json.loads(proceso.stdout.strip().splitlines()[-1])
+        resultados.append(resultado)
+        print(f"{concurrencia:>6} {args.facturas:>9} {resultado['segundos']:>9.2f} {resultado['facturas_por_minuto']:>13.1f} "
+              f"{resultado['peticiones_servidor']:>14} {resultado['lineas_guardadas']:>8}")
+
+    guardar_resultados("ingesta", vars(args), resultados, args.salida)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark de la carga del historial de una empresa desde SQLite (pd.read_sql_query sobre la vista 'facturas')
+y desde su instantánea Arrow (memory-map y proyección de columnas): tiempo de carga y pico de memoria (RSS)
+del proceso, con todas las columnas y solo con las del punto de pedido. Mide también lo que cuesta generar
+la instantánea entera y añadirle el segmento de una factura nueva.
+
+Cada carga se mide en un proceso nuevo (pandas y pyarrow ya importados), para que el pico de RSS de una
+no se mezcle con el de otra. Necesita pyarrow.
+
+Uso:
+    python benchmarks/bench_instantaneas.py --lineas 100000 1000000
+    python benchmarks/bench_instantaneas.py --lineas 10000000 --repeticiones 1
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from comun import RAIZ_REPOSITORIO, guardar_resultados, cronometrar
+from bench_consultas import generar_bd, EMPRESA, COLUMNAS_PUNTO_PEDIDO
+import db_manager
+import instantaneas
+
+_MEDIR = """
+import os, sys, json, time, resource
+import pandas, pyarrow, pyarrow.ipc
+os.environ["STOCKAI_INSTANTANEAS"] = {activas!r}
+import consultas
+
+def pico_rss_mb():
+    # En Linux ru_maxrss conserva el pico del proceso padre anterior al exec: VmHWM es solo de este proceso
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(l.split()[1]) for l in f if l.startswith("VmHWM")) * 1024 / 1e6
+    except (OSError, StopIteration):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024) / 1e6
+
+base = pico_rss_mb()
+inicio = time.perf_counter()
+df = consultas.obtener_datos_empresa({empresa!r}, {columnas!r})
+segundos = time.perf_counter() - inicio
+pico = pico_rss_mb()
+print(json.dumps({{"segundos": segundos, "filas": len(df), "pico_mb": pico, "incremento_mb": pico - base,
+                  "dataframe_mb": df.memory_usage(deep=True).sum() / 1e6}}))
+"""
+
+
+def medir_carga(carpeta_trabajo, columnas, desde_instantanea):
+    """Carga las líneas en un intérprete nuevo. Devuelve el dict que imprime el hijo."""
+    proceso = subprocess.run(
+        [sys.executable, "-c", _MEDIR.format(activas="1" if desde_instantanea else "0", empresa=EMPRESA, columnas=columnas)],
+        cwd=carpeta_trabajo, capture_output=True, text=True, env={**os.environ, "PYTHONPATH": RAIZ_REPOSITORIO},
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(proceso.stderr.strip().splitlines()[-1])
+    return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lineas", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--productos", type=int, default=500)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--salida", default=None, help="Archivo JSON de resultados (por defecto en benchmarks/resultados/).")
+    args = parser.parse_args()
+    salida = os.path.abspath(args.salida) if args.salida else None
+    if not instantaneas.disponible():
+        raise SystemExit("Este benchmark necesita pyarrow.")
+
+    resultados = []
+    print(f"{'líneas':>10} {'columnas':>9} {'origen':>12} {'carga (s)':>10} {'pico RSS (MB)':>14} "
+          f"{'+RSS (MB)':>10} {'DataFrame (MB)':>15}")
+    for num_lineas in args.lineas:
+        carpeta_trabajo = tempfile.mkdtemp(prefix="stockai_bench_")
+        os.chdir(carpeta_trabajo)
+        db_path = db_manager.ruta_bd_empresa(EMPRESA)
+        generar_bd(db_path, num_lineas, num_productos=args.productos)
+
+        t_generar, _ = cronometrar(instantaneas.actualizar_instantanea, EMPRESA)
+        with db_manager.transaccion(db_path) as conn:
+            db_manager.insertar_factura(conn, "F-NUEVA", "2025-01-15", 10.0, [("Producto 00001", 4.0, 2.5, 10.0)])
+        t_incremental, _ = cronometrar(instantaneas.actualizar_instantanea, EMPRESA)
+        tamano_bd = sum(os.path.getsize(f"{db_path}{sufijo}") for sufijo in ("", "-wal") if os.path.exists(f"{db_path}{sufijo}"))
+        carpeta = instantaneas.carpeta_empresa(EMPRESA)
+        tamano_instantanea = sum(os.path.getsize(os.path.join(carpeta, f)) for f in os.listdir(carpeta))
+        db_manager.cerrar_conexiones()
+
+        resultado = {"lineas": num_lineas, "generar_instantanea_s": round(t_generar, 3),
+                     "actualizar_instantanea_s": round(t_incremental, 4), "bd_mb": round(tamano_bd / 1e6, 1),
+                     "instantanea_mb": round(tamano_instantanea / 1e6, 1), "cargas": []}
+        for nombre_columnas, columnas in (("todas", None), ("punto", COLUMNAS_PUNTO_PEDIDO)):
+            for origen, desde_instantanea in (("sqlite", False), ("instantanea", True)):
+                mediciones = [medir_carga(carpeta_trabajo, columnas, desde_instantanea) for _ in range(args.repeticiones)]
+                mejor = min(mediciones, key=lambda m: m["segundos"])
+                resultado["cargas"].append({"columnas": nombre_columnas, "origen": origen, **{
+                    clave: round(valor, 4) if isinstance(valor, float) else valor for clave, valor in mejor.items()}})
+                print(f"{num_lineas:>10} {nombre_columnas:>9} {origen:>12} {mejor['segundos']:>10.3f} {mejor['pico_mb']:>14.1f} "
+                      f"{mejor['incremento_mb']:>10.1f} {mejor['dataframe_mb']:>15.1f}")
+        print(f"{'':>10} instantánea: {t_generar:.2f} s completa, {t_incremental * 1000:.1f} ms por factura nueva; "
+              f"{resultado['instantanea_mb']} MB frente a {resultado['bd_mb']} MB de la BD")
+        resultados.append(resultado)
+        os.chdir(RAIZ_REPOSITORIO)
+        shutil.rmtree(carpeta_trabajo, ignore_errors=True)
+
+    guardar_resultados("instantaneas", vars(args), resultados, salida)
+
+
+if __name__ == "__main__":
+    main()
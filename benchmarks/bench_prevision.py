@@ -0,0 +1,141 @@
+"""
+Benchmark de la previsión de demanda (prevision_demanda.py) con la que se calcula el punto de pedido.
+
+- Velocidad, sobre BD de empresa sintéticas con muchos productos: ajuste en frío de todo el catálogo, lectura
+  con la caché al día, reajuste después de una factura nueva (solo sus productos) y cálculo de la tabla,
+  frente al punto de pedido anterior (calcular_desde_resumen).
+- Calidad, sobre dos conjuntos de series sintéticas: compras frecuentes con perfil semanal y tendencia, y compras
+  en lotes cada varias semanas (intervalos y tamaños con ruido). Se ajusta con todos los días menos los del plazo
+  de reposición y se compara la previsión con la demanda real de esos días.
+  Se mide el error absoluto medio y la fracción de productos cuya demanda supera el punto de pedido (roturas
+  de stock), que con la previsión debería acercarse a 1 - nivel de servicio.
+
+Uso:
+    python benchmarks/bench_prevision.py --productos 1000 10000 30000
+    python benchmarks/bench_prevision.py --productos 5000 --series 20000 --plazo 7
+"""
+import os
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+from comun import RAIZ_REPOSITORIO, guardar_resultados, cronometrar
+from bench_consultas import generar_bd, EMPRESA
+import db_manager
+import consultas
+import punto_pedido
+import prevision_demanda
+
+
+def generar_series(num_productos, num_dias=365, semilla=7):
+    """Series diarias con perfil semanal, tendencia lineal y compras que no se hacen todos los días."""
+    rng = np.random.default_rng(semilla)
+    dias = np.arange(num_dias)
+    base = rng.gamma(2.0, 5.0, num_productos)[:, None]
+    perfil = rng.dirichlet(np.full(7, 0.7), num_productos) * 7           # peso de cada día de la semana
+    tendencia = 1 + rng.normal(0, 0.5, num_productos)[:, None] * dias[None, :] / num_dias
+    media = base * perfil[:, dias % 7] * np.clip(tendencia, 0.2, None)
+    compra = rng.random((num_productos, num_dias)) < rng.uniform(0.2, 1.0, num_productos)[:, None]
+    return np.where(compra, rng.poisson(media / np.maximum(compra.mean(axis=1, keepdims=True), 1e-9)), 0).astype(float)
+
+def generar_series_lotes(num_productos, num_dias=365, semilla=11):
+    """Series con compras grandes cada 2-8 semanas (±20 % en el intervalo y en el tamaño), desfasadas entre productos."""
+    rng = np.random.default_rng(semilla)
+    series = np.zeros((num_productos, num_dias))
+    intervalo = rng.integers(14, 57, num_productos)
+    tamano = rng.gamma(2.0, 150.0, num_productos)
+    dia = rng.integers(0, intervalo)
+    filas = np.arange(num_productos)
+    while (dia < num_dias).any():
+        activa = dia < num_dias
+        series[filas[activa], dia[activa]] += np.round(tamano[activa] * rng.uniform(0.8, 1.2, activa.sum()))
+        dia = dia + np.maximum(1, np.round(intervalo * rng.uniform(0.8, 1.2, num_productos))).astype(int)
+    return series
+
+def evaluar_calidad(series, plazo, nivel_servicio):
+    """Error y roturas de stock de la previsión y del método anterior en los últimos `plazo` días de cada serie."""
+    entrenamiento, real = series[:, :-plazo], series[:, -plazo:].sum(axis=1)
+    num_dias = entrenamiento.shape[1]
+    # Como en la BD, solo se prevén los productos con compras en al menos dos días
+    validos = (entrenamiento > 0).sum(axis=1) >= 2
+    entrenamiento, real = entrenamiento[validos], real[validos]
+    estado = prevision_demanda.ajustar_series(entrenamiento)
+    prevista = prevision_demanda.prever(estado, np.full(len(entrenamiento), float(plazo)))
+    punto = np.maximum(prevision_demanda.cuantil_plazo(estado, np.full(len(entrenamiento), float(plazo)), nivel_servicio),
+                       prevista)
+
+    # Método anterior: unidades totales / días entre la primera y la última compra, stock de seguridad fijo
+    con_compra = entrenamiento > 0
+    primera = con_compra.argmax(axis=1)
+    ultima = num_dias - 1 - con_compra[:, ::-1].argmax(axis=1)
+    diaria = entrenamiento.sum(axis=1) / np.maximum(ultima - primera, 1)
+    anterior = diaria * plazo
+    punto_anterior = anterior + diaria * punto_pedido.DIAS_COBERTURA_SEGURIDAD * punto_pedido.FACTOR_STOCK_SEGURIDAD
+    return {
+        "mae_prevision": round(float(np.abs(prevista - real).mean()), 3),
+        "mae_anterior": round(float(np.abs(anterior - real).mean()), 3),
+        "roturas_prevision": round(float((real > punto).mean()), 4),
+        "roturas_anterior": round(float((real > punto_anterior).mean()), 4),
+        "stock_medio_prevision": round(float(punto.mean()), 2),
+        "stock_medio_anterior": round(float(punto_anterior.mean()), 2),
+    }
+
+def medir_velocidad(num_productos, compras_por_producto, repeticiones):
+    carpeta_trabajo = tempfile.mkdtemp(prefix="stockai_bench_")
+    os.chdir(carpeta_trabajo)
+    db_path = db_manager.ruta_bd_empresa(EMPRESA)
+    generar_bd(db_path, num_productos * compras_por_producto, num_productos=num_productos)
+
+    t_frio, _ = cronometrar(consultas.actualizar_prevision_empresa, EMPRESA)
+    t_caliente, prevision = cronometrar(consultas.prevision_demanda_empresa, EMPRESA, repeticiones=repeticiones)
+    with db_manager.transaccion(db_path) as conn:
+        db_manager.insertar_factura(conn, "F-NUEVA", "2025-01-15", 100.0,
+                                    [(f"Producto {i:05d}", 5.0, 2.0, 10.0) for i in range(1, 11)])
+    t_incremental, _ = cronometrar(consultas.actualizar_prevision_empresa, EMPRESA)
+    prevision = consultas.prevision_demanda_empresa(EMPRESA)
+    t_tabla, tabla = cronometrar(punto_pedido.calcular_desde_prevision, prevision, repeticiones=repeticiones)
+    t_anterior, _ = cronometrar(lambda: punto_pedido.calcular_desde_resumen(consultas.resumen_demanda(EMPRESA)),
+                                repeticiones=repeticiones)
+    db_manager.cerrar_conexiones()
+    os.chdir(RAIZ_REPOSITORIO)
+    shutil.rmtree(carpeta_trabajo, ignore_errors=True)
+    return {"productos": num_productos, "filas_tabla": len(tabla), "ajuste_frio_s": round(t_frio, 3),
+            "lectura_cache_s": round(t_caliente, 4), "reajuste_factura_s": round(t_incremental, 4),
+            "tabla_s": round(t_tabla, 4), "punto_pedido_anterior_s": round(t_anterior, 4)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--productos", type=int, nargs="+", default=[1_000, 10_000, 30_000])
+    parser.add_argument("--compras-por-producto", type=int, default=20)
+    parser.add_argument("--series", type=int, default=10_000, help="Series sintéticas para medir la calidad.")
+    parser.add_argument("--plazo", type=int, default=punto_pedido.TIEMPO_REPOSICION_DIAS)
+    parser.add_argument("--nivel-servicio", type=float, default=punto_pedido.NIVEL_SERVICIO)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--salida", default=None, help="Archivo JSON de resultados (por defecto en benchmarks/resultados/).")
+    args = parser.parse_args()
+    salida = os.path.abspath(args.salida) if args.salida else None
+
+    velocidad = []
+    print(f"{'productos':>10} {'frío (s)':>9} {'caché (s)':>10} {'1 factura (s)':>14} {'tabla (s)':>10} {'anterior (s)':>13}")
+    for num_productos in args.productos:
+        r = medir_velocidad(num_productos, args.compras_por_producto, args.repeticiones)
+        velocidad.append(r)
+        print(f"{num_productos:>10} {r['ajuste_frio_s']:>9.2f} {r['lectura_cache_s']:>10.3f} {r['reajuste_factura_s']:>14.3f} "
+              f"{r['tabla_s']:>10.3f} {r['punto_pedido_anterior_s']:>13.3f}")
+
+    calidad = {}
+    print(f"\nCalidad en {args.series} series, plazo de {args.plazo} días, nivel de servicio {args.nivel_servicio:.0%}:")
+    print(f"{'series':>8} {'método':>10} {'MAE':>8} {'roturas':>8} {'punto medio':>12}")
+    for nombre, generar in (("diarias", generar_series), ("lotes", generar_series_lotes)):
+        calidad[nombre] = resultado = evaluar_calidad(generar(args.series), args.plazo, args.nivel_servicio)
+        for metodo in ("prevision", "anterior"):
+            print(f"{nombre:>8} {metodo:>10} {resultado['mae_' + metodo]:>8.2f} {resultado['roturas_' + metodo]:>8.1%} "
+                  f"{resultado['stock_medio_' + metodo]:>12.1f}")
+
+    guardar_resultados("prevision", vars(args), {"velocidad": velocidad, "calidad": calidad}, salida)
+
+
+if __name__ == "__main__":
+    main()
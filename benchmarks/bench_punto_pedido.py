@@ -0,0 +1,101 @@
+"""
+Benchmark del cálculo del punto de pedido: implementación vectorizada (punto_pedido.py) frente al bucle
+por producto original. Comprueba además que ambas devuelven exactamente la misma tabla.
+
+Uso:
+    python benchmarks/bench_punto_pedido.py --productos 1000 10000 100000
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import punto_pedido  # noqa: E402
+
+
+def calcular_punto_pedido_bucle(df, tiempo_reposicion=punto_pedido.TIEMPO_REPOSICION_DIAS):
+    """Implementación original (un bucle de Python por producto), como referencia."""
+    if df.empty:
+        return pd.DataFrame()
+
+    df = df.copy()
+    df["fecha_emision"] = pd.to_datetime(df["fecha_emision"], errors="coerce")
+    df["cantidad"] = pd.to_numeric(df["cantidad"].str.extract(r"([\d,.]+)")[0].str.replace(".", "").str.replace(",", "."), errors='coerce')
+    df = df.dropna(subset=["fecha_emision", "nombre_producto", "cantidad"])
+
+    df_grouped = df.groupby(["nombre_producto", "fecha_emision"]).agg({"cantidad": "sum"}).reset_index()
+
+    resultados = []
+    for producto, grupo in df_grouped.groupby("nombre_producto"):
+        grupo = grupo.sort_values("fecha_emision")
+        if len(grupo) < 2:
+            continue
+
+        total_dias = (grupo["fecha_emision"].max() - grupo["fecha_emision"].min()).days
+        total_unidades = grupo["cantidad"].sum()
+
+        if total_dias == 0:
+            demanda_diaria = total_unidades
+        else:
+            demanda_diaria = total_unidades / total_dias
+
+        stock_seguridad = demanda_diaria * 7 * 0.2
+        punto_pedido_unidades = (demanda_diaria * tiempo_reposicion) + stock_seguridad
+
+        resultados.append({
+            "Producto": producto,
+            "Demanda diaria estimada": round(demanda_diaria, 2),
+            "Stock de seguridad": int(round(stock_seguridad)),
+            "Punto de pedido (unidades)": int(round(punto_pedido_unidades))
+        })
+
+    return pd.DataFrame(resultados)
+
+def generar_lineas(num_productos, lineas_por_producto=6, semilla=42):
+    """Líneas de factura sintéticas con la forma de la vista 'facturas' (cantidad como texto, como en el histórico)."""
+    rng = np.random.default_rng(semilla)
+    n = num_productos * lineas_por_producto
+    productos = np.repeat([f"producto {i}" for i in range(num_productos)], lineas_por_producto)
+    fechas = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D")
+    cantidades = rng.integers(1, 500, n)
+    return pd.DataFrame({
+        "nombre_producto": productos,
+        "fecha_emision": fechas.strftime("%Y-%m-%d"),
+        "cantidad": [f"{c} unidades" for c in cantidades],
+    })
+
+def medir(funcion, df, repeticiones):
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(df)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), resultado
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--productos", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--lineas-por-producto", type=int, default=6)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--sin-bucle", action="store_true", help="No ejecutar la implementación original (lenta).")
+    args = parser.parse_args()
+
+    print(f"{'productos':>10} {'líneas':>10} {'vectorizado (s)':>16} {'bucle (s)':>10} {'aceleración':>12} {'idéntico':>9}")
+    for num_productos in args.productos:
+        df = generar_lineas(num_productos, args.lineas_por_producto)
+        t_vector, tabla_vector = medir(punto_pedido.calcular_punto_pedido, df, args.repeticiones)
+        if args.sin_bucle:
+            print(f"{num_productos:>10} {len(df):>10} {t_vector:>16.3f} {'-':>10} {'-':>12} {'-':>9}")
+            continue
+        t_bucle, tabla_bucle = medir(calcular_punto_pedido_bucle, df, 1)
+        identico = tabla_vector.reset_index(drop=True).equals(tabla_bucle.reset_index(drop=True))
+        print(f"{num_productos:>10} {len(df):>10} {t_vector:>16.3f} {t_bucle:>10.3f} {t_bucle / t_vector:>11.1f}x {str(identico):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Utilidades compartidas por los benchmarks: guardar resultados en JSON con los datos del entorno."""
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+from datetime import datetime
+
+RAIZ_REPOSITORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CARPETA_RESULTADOS = os.path.join(RAIZ_REPOSITORIO, "benchmarks", "resultados")
+
+if RAIZ_REPOSITORIO not in sys.path:
+    sys.path.insert(0, RAIZ_REPOSITORIO)
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ_REPOSITORIO,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def entorno():
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_actual(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+def guardar_resultados(nombre, parametros, resultados, ruta=None):
+    """
+    Guarda los resultados en benchmarks/resultados/<nombre>_<fecha>.json (o en `ruta`) junto con los
+    parámetros y el entorno, para comparar ejecuciones entre commits. Devuelve la ruta del archivo.
+    """
+    if ruta is None:
+        os.makedirs(CARPETA_RESULTADOS, exist_ok=True)
+        ruta = os.path.join(CARPETA_RESULTADOS, f"{nombre}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump({"benchmark": nombre, "entorno": entorno(), "parametros": parametros, "resultados": resultados},
+                  f, ensure_ascii=False, indent=2, default=str)
+    print(f"💾 Resultados guardados en {ruta}")
+    return ruta
+
+def cronometrar(funcion, *args, repeticiones=1, **kwargs):
+    """Mejor tiempo (s) de `repeticiones` ejecuciones y el resultado de la última."""
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(*args, **kwargs)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), resultado
@@ -0,0 +1,111 @@
+"""
+Generador de facturas PDF sintéticas para los benchmarks. Imitan el diseño de las facturas reales
+(membrete del proveedor, cliente, tabla de productos, totales con IVA y pie legal en cada página) y son
+reproducibles con la misma semilla. Junto a los PDF se escribe esperado.json con los datos de cada factura.
+
+Uso:
+    python benchmarks/generar_facturas.py --facturas 100 --lineas 25 --salida /tmp/facturas
+    python benchmarks/generar_facturas.py --facturas 5 --paginas 30 --salida /tmp/catalogos
+"""
+import os
+import json
+import random
+import argparse
+from datetime import date, timedelta
+
+import fitz  # PyMuPDF
+
+PROVEEDORES = [
+    ("SUMINISTROS GARCIA SL", "Calle Mayor", "Poligono Industrial Norte"),
+    ("DISTRIBUCIONES MEDICAS DEL SUR SA", "Avenida de Andalucia", "Parque Empresarial Sur"),
+    ("OFIMATICA LEVANTE SL", "Calle Colon", "Centro Comercial Levante"),
+]
+CLIENTES = ["Clinica Dental Sonrisa", "Farmacia Luz", "Hospital San Rafael", "Residencia El Pinar", "Centro Medico Norte"]
+PRODUCTOS = [
+    "Guantes de latex talla M", "Guantes de nitrilo talla L", "Mascarillas FFP2", "Mascarillas quirurgicas IIR",
+    "Batas desechables azules", "Gel hidroalcoholico 500ml", "Gasas esteriles 10x10", "Jeringas 5ml",
+    "Papel camilla 60cm", "Alcohol 96 grados 1L", "Toallitas desinfectantes", "Esparadrapo hipoalergenico",
+    "Lapiz HB Staedtler", "Folios A4 80g", "Toner HP 305A", "Archivador AZ",
+]
+PIE_LEGAL = "Inscrita en el Registro Mercantil, tomo 1234, folio 56, hoja M-78901. Datos protegidos segun el RGPD."
+LINEAS_POR_PAGINA = 50
+FILAS_POR_PAGINA = LINEAS_POR_PAGINA - 11  # menos la cabecera (9 líneas) y el pie (2)
+TIPO_IVA = 0.21
+
+
+def _importe(valor):
+    """Formato español: 1.234,50"""
+    return f"{valor:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+def generar_factura(rng, numero, num_lineas):
+    """Devuelve (paginas, datos): las líneas de texto de cada página y los datos que un extractor debería obtener."""
+    proveedor = rng.choice(PROVEEDORES)
+    cliente = rng.choice(CLIENTES)
+    fecha = date(2022, 1, 1) + timedelta(days=rng.randrange(3 * 365))
+    productos = []
+    for _ in range(num_lineas):
+        cantidad = rng.randint(1, 500)
+        precio = round(rng.uniform(0.05, 80), 2)
+        productos.append({"nombre": rng.choice(PRODUCTOS), "cantidad": cantidad, "precio_unitario": precio,
+                          "total_por_producto": round(cantidad * precio, 2)})
+    base = round(sum(p["total_por_producto"] for p in productos), 2)
+    total = round(base * (1 + TIPO_IVA), 2)
+    numero_factura = f"F-{fecha.year}-{numero:06d}"
+
+    cabecera = [*proveedor, "FACTURA", f"N. factura: {numero_factura} Fecha: {fecha:%d/%m/%Y}", "Cliente:", cliente,
+                "Descripcion Cantidad Precio Total"]
+    filas = [f"{p['nombre']} {p['cantidad']} {_importe(p['precio_unitario'])} {_importe(p['total_por_producto'])}" for p in productos]
+    totales = [f"Base imponible: {_importe(base)}", f"IVA 21%: {_importe(total - base)}", f"Total: {_importe(total)}"]
+
+    bloques = [filas[i:i + FILAS_POR_PAGINA] for i in range(0, len(filas), FILAS_POR_PAGINA)] or [[]]
+    paginas = []
+    for n, bloque in enumerate(bloques, start=1):
+        pie = [PIE_LEGAL, f"Pagina {n} de {len(bloques)}"]
+        paginas.append(cabecera + bloque + (totales if n == len(bloques) else []) + pie)
+
+    datos = {"nombre_empresa": cliente, "numero_factura": numero_factura, "fecha_emision": f"{fecha:%d/%m/%Y}",
+             "total_factura": total, "productos": productos}
+    return paginas, datos
+
+def escribir_pdf(paginas, ruta):
+    doc = fitz.open()
+    for lineas in paginas:
+        pagina = doc.new_page()  # A4
+        y = 40
+        for linea in lineas:
+            pagina.insert_text((40, y), linea, fontsize=9)
+            y += 15
+    doc.save(ruta)
+    doc.close()
+
+def generar_carpeta(carpeta, facturas, lineas, paginas=None, semilla=42):
+    """Genera `facturas` PDF en `carpeta`. Con `paginas`, cada factura tiene líneas suficientes para esas páginas."""
+    os.makedirs(carpeta, exist_ok=True)
+    rng = random.Random(semilla)
+    if paginas:
+        lineas = paginas * FILAS_POR_PAGINA
+    esperado = {}
+    for numero in range(1, facturas + 1):
+        contenido, datos = generar_factura(rng, numero, lineas)
+        nombre = f"factura_{numero:06d}.pdf"
+        escribir_pdf(contenido, os.path.join(carpeta, nombre))
+        esperado[nombre] = datos
+    with open(os.path.join(carpeta, "esperado.json"), "w", encoding="utf-8") as f:
+        json.dump(esperado, f, ensure_ascii=False, indent=1)
+    return esperado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--facturas", type=int, default=100)
+    parser.add_argument("--lineas", type=int, default=20, help="Líneas de producto por factura.")
+    parser.add_argument("--paginas", type=int, default=None, help="Páginas por factura (sustituye a --lineas).")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", default="data/facturas")
+    args = parser.parse_args()
+    generar_carpeta(args.salida, args.facturas, args.lineas, args.paginas, args.semilla)
+    print(f"📄 {args.facturas} facturas generadas en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
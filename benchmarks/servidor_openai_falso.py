@@ -0,0 +1,158 @@
+"""
+Servidor local compatible con la API de chat de OpenAI, para medir el rendimiento sin llamadas reales.
+Responde a POST /v1/chat/completions con una latencia configurable y una tasa de errores transitorios
+(429 con Retry-After o 500). Entiende los dos prompts del proyecto:
+- extracción de facturas: interpreta el texto con el diseño de benchmarks/generar_facturas.py;
+- normalización por lotes (response_format json_object): simplifica cada nombre.
+
+Uso:
+    python benchmarks/servidor_openai_falso.py --puerto 8765 --latencia 0.8 --tasa-error 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=falsa python read_invoice.py
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_PRODUCTO = re.compile(r"^(?P<nombre>.+?) (?P<cantidad>\d+) (?P<precio>[\d.,]+) (?P<total>[\d.,]+)$", re.MULTILINE)
+_PALABRAS_SOBRANTES = {"de", "talla", "m", "l", "iir", "azules", "500ml", "5ml", "1l", "60cm", "10x10", "a4", "80g", "hb",
+                       "staedtler", "hp", "305a", "az", "96", "grados", "ffp2"}
+
+
+def _numero(texto):
+    return float(texto.replace(".", "").replace(",", "."))
+
+def _extraer(texto):
+    """Lo que devolvería el modelo para una factura generada por generar_facturas.py."""
+    def buscar(patron):
+        m = re.search(patron, texto, re.MULTILINE)
+        return m.group(1).strip() if m else ""
+    productos = [{
+        "nombre": m.group("nombre"),
+        "nombre_normalizado": _normalizar(m.group("nombre")),
+        "cantidad": int(m.group("cantidad")),
+        "precio_unitario": _numero(m.group("precio")),
+        "total_por_producto": _numero(m.group("total")),
+    } for m in _PRODUCTO.finditer(texto) if not m.group("nombre").startswith(("Base", "IVA", "Total"))]
+    total = buscar(r"^Total: ([\d.,]+)")
+    return {
+        "nombre_empresa": buscar(r"^Cliente:\s*\n(.+)$"),
+        "numero_factura": buscar(r"factura: (\S+)"),
+        "fecha_emision": buscar(r"Fecha: (\S+)"),
+        "productos": productos,
+        "total_factura": _numero(total) if total else "",
+    }
+
+def _normalizar(nombre):
+    palabras = [p for p in nombre.lower().split() if p not in _PALABRAS_SOBRANTES]
+    singular = [p[:-1] if p.endswith("s") and len(p) > 3 else p for p in palabras]
+    return " ".join(singular).capitalize() or nombre
+
+def _responder_contenido(cuerpo):
+    prompt = cuerpo["messages"][-1]["content"]
+    if cuerpo.get("response_format", {}).get("type") == "json_object":
+        entrada = json.loads(prompt[prompt.index("{"):prompt.rindex("}") + 1])
+        return json.dumps({clave: _normalizar(nombre) for clave, nombre in entrada.items()}, ensure_ascii=False)
+    texto = prompt.split("Texto:", 1)[-1]
+    return json.dumps(_extraer(texto), ensure_ascii=False)
+
+
+class ServidorOpenAIFalso:
+    """Servidor en un hilo de fondo. `url` es la base para OPENAI_BASE_URL."""
+
+    def __init__(self, puerto=0, latencia=0.5, variacion=0.2, tasa_error=0.0, semilla=None):
+        self.latencia = latencia
+        self.variacion = variacion
+        self.tasa_error = tasa_error
+        self.peticiones = 0
+        self.errores = 0
+        self._rng = random.Random(semilla)
+        self._lock = threading.Lock()
+        self._servidor = ThreadingHTTPServer(("127.0.0.1", puerto), self._manejador())
+        self._servidor.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._servidor.server_address[1]}/v1"
+
+    def iniciar(self):
+        threading.Thread(target=self._servidor.serve_forever, name="openai-falso", daemon=True).start()
+        return self
+
+    def detener(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    def _manejador(self):
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                longitud = int(self.headers.get("Content-Length", 0))
+                cuerpo = json.loads(self.rfile.read(longitud) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._enviar(404, {"error": {"message": "Ruta no soportada", "type": "invalid_request_error"}})
+                    return
+                with servidor._lock:
+                    servidor.peticiones += 1
+                    espera = max(0.0, servidor._rng.gauss(servidor.latencia, servidor.variacion * servidor.latencia))
+                    falla = servidor._rng.random() < servidor.tasa_error
+                    codigo = servidor._rng.choice((429, 500)) if falla else 200
+                    servidor.errores += falla
+                time.sleep(espera)
+                if falla:
+                    self._enviar(codigo, {"error": {"message": "Error simulado", "type": "server_error", "code": None}},
+                                 {"Retry-After": "0.2"} if codigo == 429 else None)
+                    return
+
+                contenido = _responder_contenido(cuerpo)
+                tokens_entrada = sum(len(m.get("content") or "") for m in cuerpo.get("messages", [])) // 4
+                self._enviar(200, {
+                    "id": f"chatcmpl-falso-{servidor.peticiones}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": cuerpo.get("model", "falso"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": contenido}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": tokens_entrada, "completion_tokens": len(contenido) // 4,
+                              "total_tokens": tokens_entrada + len(contenido) // 4},
+                })
+
+            def _enviar(self, codigo, datos, cabeceras=None):
+                cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+                self.send_response(codigo)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(cuerpo)))
+                for clave, valor in (cabeceras or {}).items():
+                    self.send_header(clave, valor)
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, formato, *args):
+                pass
+
+        return Manejador
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.5, help="Latencia media por petición, en segundos.")
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="Fracción de peticiones que fallan (429/500).")
+    args = parser.parse_args()
+    servidor = ServidorOpenAIFalso(args.puerto, args.latencia, tasa_error=args.tasa_error).iniciar()
+    print(f"🤖 Servidor OpenAI falso en {servidor.url} (latencia {args.latencia}s, errores {args.tasa_error:.0%}).")
+    print(f"   OPENAI_BASE_URL={servidor.url} OPENAI_API_KEY=falsa")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.detener()
+
+
+if __name__ == "__main__":
+    main()
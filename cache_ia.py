@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+from metricas import anotar
+
+# Configuración
+CARPETA_CACHE = "data/cache"
+RUTA_CACHE_NORMALIZACION = os.path.join(CARPETA_CACHE, "normalizacion_productos.db")
+RUTA_CACHE_EXTRACCIONES = os.path.join(CARPETA_CACHE, "extracciones.db")
+
+CACHE_MAX_MEMORIA = int(os.getenv("STOCKAI_CACHE_MAX_MEMORIA", "4096"))        # entradas en el LRU en memoria
+CACHE_MAX_ENTRADAS = int(os.getenv("STOCKAI_CACHE_MAX_ENTRADAS", "200000"))    # entradas en disco
+CACHE_MAX_EDAD_DIAS = float(os.getenv("STOCKAI_CACHE_MAX_EDAD_DIAS", "180"))   # antigüedad máxima en disco
+
+
+class CacheNormalizacion:
+    """
+    Caché persistente (SQLite) de nombres de producto normalizados por la IA, con una capa LRU en memoria.
+    La clave es el nombre original del producto más la versión del prompt, de modo que cambiar el prompt
+    invalida automáticamente las entradas antiguas. Cada prompt que produce nombres usa su propia versión;
+    obtener_alguna busca un nombre en varias a la vez.
+    """
+
+    def __init__(self, ruta_bd=RUTA_CACHE_NORMALIZACION, max_memoria=CACHE_MAX_MEMORIA,
+                 max_entradas=CACHE_MAX_ENTRADAS, max_edad_dias=CACHE_MAX_EDAD_DIAS):
+        self.ruta_bd = ruta_bd
+        self.max_memoria = max_memoria
+        self.max_entradas = max_entradas
+        self.max_edad_segundos = max_edad_dias * 86400
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._escrituras_desde_purga = 0
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+
+        carpeta = os.path.dirname(ruta_bd)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        self._conn = sqlite3.connect(ruta_bd, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS normalizaciones (
+                nombre TEXT NOT NULL,
+                version TEXT NOT NULL,
+                normalizado TEXT NOT NULL,
+                creado REAL NOT NULL,
+                usado REAL NOT NULL,
+                PRIMARY KEY (nombre, version)
+            );
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_normalizaciones_usado ON normalizaciones(usado);")
+        self._conn.commit()
+        self.purgar()
+
+    def _recordar(self, nombre, versiones):
+        """Guarda en memoria las versiones de un nombre ({versión: normalizado}, todas las que hay en disco)."""
+        self._memoria[nombre] = versiones
+        self._memoria.move_to_end(nombre)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def obtener(self, nombre, version):
+        """Devuelve el nombre normalizado en caché o None si no existe (o ha caducado)."""
+        return self.obtener_alguna(nombre, (version,))
+
+    def obtener_alguna(self, nombre, versiones):
+        """
+        Como obtener, con varias versiones en orden de preferencia (por ejemplo, de prompts distintos):
+        devuelve la primera que esté en caché. Cuenta un solo acierto o fallo.
+        """
+        with self._lock:
+            # En memoria están todas las versiones del nombre: la preferida se elige igual que en disco
+            en_memoria = self._memoria.get(nombre, {})
+            version = next((v for v in versiones if v in en_memoria), None)
+            if version is not None:
+                self._memoria.move_to_end(nombre)
+                self.hits_memoria += 1
+                anotar(aciertos_cache=1)
+                return en_memoria[version]
+
+            ahora = time.time()
+            filas = dict(self._conn.execute(
+                "SELECT version, normalizado FROM normalizaciones WHERE nombre = ? AND creado >= ?",
+                (nombre, ahora - self.max_edad_segundos)
+            ).fetchall())
+            version = next((v for v in versiones if v in filas), None)
+            if version is None:
+                self.misses += 1
+                anotar(fallos_cache=1)
+                return None
+
+            self._conn.execute(
+                "UPDATE normalizaciones SET usado = ? WHERE nombre = ? AND version = ?",
+                (ahora, nombre, version)
+            )
+            self._conn.commit()
+            self._recordar(nombre, filas)
+            self.hits_disco += 1
+            anotar(aciertos_cache=1)
+            return filas[version]
+
+    def guardar(self, nombre, version, normalizado):
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO normalizaciones (nombre, version, normalizado, creado, usado)
+                VALUES (?, ?, ?, ?, ?);
+            """, (nombre, version, normalizado, ahora, ahora))
+            self._conn.commit()
+            if nombre in self._memoria:
+                self._memoria[nombre][version] = normalizado
+                self._memoria.move_to_end(nombre)
+            self._escrituras_desde_purga += 1
+            purgar = self._escrituras_desde_purga >= 1000
+        if purgar:
+            self.purgar()
+
+    def purgar(self):
+        """Aplica la política de expulsión en disco: primero por antigüedad y después por tamaño (LRU)."""
+        with self._lock:
+            self._escrituras_desde_purga = 0
+            limite = time.time() - self.max_edad_segundos
+            borradas = self._conn.execute("DELETE FROM normalizaciones WHERE creado < ?", (limite,)).rowcount
+            total = self._conn.execute("SELECT COUNT(*) FROM normalizaciones").fetchone()[0]
+            if total > self.max_entradas:
+                borradas += self._conn.execute("""
+                    DELETE FROM normalizaciones WHERE rowid IN (
+                        SELECT rowid FROM normalizaciones ORDER BY usado ASC LIMIT ?
+                    );
+                """, (total - self.max_entradas,)).rowcount
+            self._conn.commit()
+        if borradas:
+            logging.info(f"🧹 Caché de normalización: {borradas} entradas expulsadas.")
+        return borradas
+
+    def estadisticas(self):
+        with self._lock:
+            en_disco = self._conn.execute("SELECT COUNT(*) FROM normalizaciones").fetchone()[0]
+            consultas = self.hits_memoria + self.hits_disco + self.misses
+            return {
+                "hits_memoria": self.hits_memoria,
+                "hits_disco": self.hits_disco,
+                "misses": self.misses,
+                "tasa_acierto": (self.hits_memoria + self.hits_disco) / consultas if consultas else 0.0,
+                "entradas_memoria": len(self._memoria),
+                "entradas_disco": en_disco,
+            }
+
+
+class CacheExtracciones:
+    """
+    Caché persistente del JSON estructurado devuelto por la IA para cada factura.
+    La clave es el hash del texto normalizado de la factura más el modelo y la versión del prompt.
+    No tiene expulsión: es la fuente para reconstruir las bases de datos sin volver a llamar a OpenAI.
+    """
+
+    def __init__(self, ruta_bd=RUTA_CACHE_EXTRACCIONES):
+        carpeta = os.path.dirname(ruta_bd)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(ruta_bd, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS extracciones (
+                hash_texto TEXT NOT NULL,
+                modelo TEXT NOT NULL,
+                version TEXT NOT NULL,
+                datos TEXT NOT NULL,
+                creado REAL NOT NULL,
+                PRIMARY KEY (hash_texto, modelo, version)
+            );
+        """)
+        self._conn.commit()
+
+    def obtener(self, hash_texto, modelo, version):
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT datos FROM extracciones WHERE hash_texto = ? AND modelo = ? AND version = ?",
+                (hash_texto, modelo, version)
+            ).fetchone()
+            if fila is None:
+                self.misses += 1
+                anotar(fallos_cache=1)
+                return None
+            self.hits += 1
+            anotar(aciertos_cache=1)
+        return json.loads(fila[0])
+
+    def guardar(self, hash_texto, modelo, version, datos):
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO extracciones (hash_texto, modelo, version, datos, creado)
+                VALUES (?, ?, ?, ?, ?);
+            """, (hash_texto, modelo, version, json.dumps(datos, ensure_ascii=False), time.time()))
+            self._conn.commit()
+
+    def iterar_ultimas(self):
+        """
+        Recorre las extracciones guardadas, una por documento (la más reciente si hay varias versiones
+        del prompt o del modelo), en orden de creación. Devuelve tuplas (hash_texto, datos).
+        """
+        with self._lock:
+            filas = self._conn.execute("""
+                SELECT e.hash_texto, e.datos FROM extracciones e
+                WHERE e.creado = (SELECT MAX(creado) FROM extracciones WHERE hash_texto = e.hash_texto)
+                ORDER BY e.creado;
+            """).fetchall()
+        for hash_valor, datos in filas:
+            yield hash_valor, json.loads(datos)
+
+
+_cache_normalizacion = None
+_cache_normalizacion_lock = threading.Lock()
+
+def obtener_cache_normalizacion():
+    """Devuelve la caché de normalización compartida del proceso (se abre en el primer uso)."""
+    global _cache_normalizacion
+    with _cache_normalizacion_lock:
+        if _cache_normalizacion is None:
+            _cache_normalizacion = CacheNormalizacion()
+        return _cache_normalizacion
+
+
+_cache_extracciones = None
+_cache_extracciones_lock = threading.Lock()
+
+def obtener_cache_extracciones():
+    """Devuelve la caché de extracciones compartida del proceso (se abre en el primer uso)."""
+    global _cache_extracciones
+    with _cache_extracciones_lock:
+        if _cache_extracciones is None:
+            _cache_extracciones = CacheExtracciones()
+        return _cache_extracciones
@@ -0,0 +1,270 @@
+import os
+import time
+import random
+import socket
+import sqlite3
+import logging
+import argparse
+import threading
+
+from metricas import medir, iniciar_servidor_metricas
+from prioridades import PRIORIDAD_INTERACTIVA, PRIORIDAD_LOTE  # noqa: F401 (app.py usa cola_trabajos.PRIORIDAD_*)
+
+# Configuración
+RUTA_COLA = "data/cola_trabajos.db"
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+HECHO = "hecho"
+FALLIDO = "fallido"
+ESTADOS = (PENDIENTE, EN_CURSO, HECHO, FALLIDO)
+
+MAX_INTENTOS = 3
+DURACION_LEASE_SEGUNDOS = 600    # si un trabajador muere, su trabajo vuelve a la cola tras este tiempo
+ESPERA_REINTENTO_SEGUNDOS = 30   # base del backoff exponencial entre reintentos
+ESPERA_COLA_VACIA_SEGUNDOS = 2
+
+
+class ColaTrabajos:
+    """
+    Cola duradera de facturas a procesar, en SQLite. Cada trabajo pasa por pendiente -> en_curso -> hecho/fallido.
+    Un trabajo en curso tiene un lease: si el trabajador no lo completa ni lo renueva a tiempo, otro lo reclama.
+    """
+
+    def __init__(self, ruta_bd=RUTA_COLA):
+        carpeta = os.path.dirname(ruta_bd)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta_bd, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL;")
+        self._conn.execute("PRAGMA synchronous = NORMAL;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS trabajos (
+                id INTEGER PRIMARY KEY,
+                ruta TEXT NOT NULL,
+                estado TEXT NOT NULL DEFAULT 'pendiente',
+                prioridad INTEGER NOT NULL DEFAULT 10,
+                intentos INTEGER NOT NULL DEFAULT 0,
+                max_intentos INTEGER NOT NULL DEFAULT 3,
+                disponible_desde REAL NOT NULL,
+                lease_hasta REAL,
+                trabajador TEXT,
+                resultado TEXT,
+                error TEXT,
+                creado REAL NOT NULL,
+                actualizado REAL NOT NULL
+            );
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trabajos_cola ON trabajos(estado, prioridad, disponible_desde);")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_trabajos_ruta ON trabajos(ruta, estado);")
+
+    def encolar(self, ruta, prioridad=PRIORIDAD_LOTE, max_intentos=MAX_INTENTOS):
+        """Añade un trabajo para `ruta`. Si ya hay uno pendiente o en curso para esa ruta, devuelve None."""
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE;")
+            try:
+                existente = self._conn.execute(
+                    "SELECT id, prioridad FROM trabajos WHERE ruta = ? AND estado IN (?, ?)", (ruta, PENDIENTE, EN_CURSO)
+                ).fetchone()
+                if existente:
+                    # Una subida interactiva adelanta un trabajo de lote que aún no ha empezado
+                    if prioridad < existente[1]:
+                        self._conn.execute(
+                            "UPDATE trabajos SET prioridad = ?, actualizado = ? WHERE id = ? AND estado = ?",
+                            (prioridad, ahora, existente[0], PENDIENTE)
+                        )
+                    self._conn.execute("COMMIT;")
+                    return None
+                cursor = self._conn.execute("""
+                    INSERT INTO trabajos (ruta, estado, prioridad, max_intentos, disponible_desde, creado, actualizado)
+                    VALUES (?, ?, ?, ?, ?, ?, ?);
+                """, (ruta, PENDIENTE, prioridad, max_intentos, ahora, ahora, ahora))
+                self._conn.execute("COMMIT;")
+                return cursor.lastrowid
+            except Exception:
+                self._conn.execute("ROLLBACK;")
+                raise
+
+    def reclamar(self, trabajador, duracion_lease=DURACION_LEASE_SEGUNDOS):
+        """
+        Reclama el siguiente trabajo disponible (pendiente, o en curso con el lease vencido) y lo marca en curso.
+        Devuelve un dict con id, ruta, prioridad e intentos, o None si no hay trabajo.
+        """
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE;")
+            try:
+                fila = self._conn.execute("""
+                    SELECT id, ruta, prioridad, intentos FROM trabajos
+                    WHERE (estado = ? AND disponible_desde <= ?) OR (estado = ? AND lease_hasta < ?)
+                    ORDER BY prioridad, id LIMIT 1
+                """, (PENDIENTE, ahora, EN_CURSO, ahora)).fetchone()
+                if fila is None:
+                    self._conn.execute("COMMIT;")
+                    return None
+                self._conn.execute("""
+                    UPDATE trabajos SET estado = ?, intentos = intentos + 1, lease_hasta = ?, trabajador = ?, actualizado = ?
+                    WHERE id = ?
+                """, (EN_CURSO, ahora + duracion_lease, trabajador, ahora, fila[0]))
+                self._conn.execute("COMMIT;")
+            except Exception:
+                self._conn.execute("ROLLBACK;")
+                raise
+        return {"id": fila[0], "ruta": fila[1], "prioridad": fila[2], "intentos": fila[3] + 1}
+
+    def renovar_lease(self, trabajo_id, trabajador, duracion_lease=DURACION_LEASE_SEGUNDOS):
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE trabajos SET lease_hasta = ?, actualizado = ? WHERE id = ? AND estado = ? AND trabajador = ?",
+                (ahora + duracion_lease, ahora, trabajo_id, EN_CURSO, trabajador)
+            )
+
+    def completar(self, trabajo_id, trabajador, resultado):
+        """
+        Marca el trabajo como hecho si `trabajador` aún tiene su lease. Devuelve False si lo perdió (el lease
+        caducó y otro trabajador lo reclamó): el resultado se descarta.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE trabajos SET estado = ?, resultado = ?, error = NULL, lease_hasta = NULL, actualizado = ? "
+                "WHERE id = ? AND estado = ? AND trabajador = ?",
+                (HECHO, resultado, time.time(), trabajo_id, EN_CURSO, trabajador)
+            )
+        return cursor.rowcount > 0
+
+    def fallar(self, trabajo_id, trabajador, error):
+        """
+        Registra un fallo: vuelve a pendiente con backoff exponencial, o queda fallido si agotó los intentos.
+        Como completar, solo si `trabajador` aún tiene el lease; si no, no cambia nada y devuelve None.
+        """
+        ahora = time.time()
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT intentos, max_intentos FROM trabajos WHERE id = ? AND estado = ? AND trabajador = ?",
+                (trabajo_id, EN_CURSO, trabajador)
+            ).fetchone()
+            if fila is None:
+                return None
+            intentos, max_intentos = fila
+            if intentos >= max_intentos:
+                estado, disponible_desde = FALLIDO, None
+            else:
+                espera = ESPERA_REINTENTO_SEGUNDOS * (2 ** (intentos - 1)) * random.uniform(0.8, 1.2)
+                estado, disponible_desde = PENDIENTE, ahora + espera
+            cursor = self._conn.execute(
+                "UPDATE trabajos SET estado = ?, error = ?, lease_hasta = NULL, "
+                "disponible_desde = COALESCE(?, disponible_desde), actualizado = ? "
+                "WHERE id = ? AND estado = ? AND trabajador = ?",
+                (estado, str(error), disponible_desde, ahora, trabajo_id, EN_CURSO, trabajador)
+            )
+        return estado if cursor.rowcount > 0 else None
+
+    def progreso(self):
+        """Número de trabajos por estado."""
+        with self._lock:
+            filas = self._conn.execute("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado").fetchall()
+        conteo = dict.fromkeys(ESTADOS, 0)
+        conteo.update(dict(filas))
+        return conteo
+
+    def recientes(self, limite=20):
+        """Últimos trabajos actualizados, como lista de dicts."""
+        with self._lock:
+            cursor = self._conn.execute("""
+                SELECT id, ruta, estado, prioridad, intentos, resultado, error, actualizado
+                FROM trabajos ORDER BY actualizado DESC LIMIT ?
+            """, (limite,))
+            columnas = [c[0] for c in cursor.description]
+            return [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+
+
+_cola = None
+_cola_lock = threading.Lock()
+
+def obtener_cola():
+    """Devuelve la cola compartida del proceso (se abre en el primer uso)."""
+    global _cola
+    with _cola_lock:
+        if _cola is None:
+            _cola = ColaTrabajos()
+        return _cola
+
+
+# --- Trabajador ---
+def _procesar_trabajo(cola, trabajo, trabajador, procesar_factura, con_prioridad):
+    fin = threading.Event()
+
+    def renovar():
+        while not fin.wait(DURACION_LEASE_SEGUNDOS / 3):
+            cola.renovar_lease(trabajo["id"], trabajador)
+
+    hilo_lease = threading.Thread(target=renovar, daemon=True)
+    hilo_lease.start()
+    try:
+        if not os.path.exists(trabajo["ruta"]):
+            raise FileNotFoundError(f"No existe el archivo '{trabajo['ruta']}'.")
+        # Las llamadas a la IA de este trabajo heredan su prioridad (las subidas interactivas van primero)
+        with con_prioridad(trabajo["prioridad"]), medir("procesar_factura", intento=trabajo["intentos"]):
+            resultado = procesar_factura(trabajo["ruta"], lanzar_errores=True)
+        if cola.completar(trabajo["id"], trabajador, resultado):
+            logging.info(f"✅ Trabajo {trabajo['id']} completado: {resultado}")
+        else:
+            logging.warning(f"⚠️ Trabajo {trabajo['id']}: el lease caducó y lo reclamó otro trabajador. Se descarta el resultado.")
+    except Exception as e:
+        estado = cola.fallar(trabajo["id"], trabajador, e)
+        if estado is None:
+            logging.warning(f"⚠️ Trabajo {trabajo['id']}: el lease caducó y lo reclamó otro trabajador. Se descarta el error: {e}")
+            return
+        logging.error(f"❌ Trabajo {trabajo['id']} ({os.path.basename(trabajo['ruta'])}) falló en el intento {trabajo['intentos']}: {e}. Estado: {estado}")
+    finally:
+        fin.set()
+
+def _bucle_trabajador(cola, nombre, procesar_factura, con_prioridad, parar):
+    while not parar.is_set():
+        trabajo = cola.reclamar(nombre)
+        if trabajo is None:
+            parar.wait(ESPERA_COLA_VACIA_SEGUNDOS)
+            continue
+        _procesar_trabajo(cola, trabajo, nombre, procesar_factura, con_prioridad)
+
+def ejecutar_trabajador(hilos=None, parar=None):
+    """Procesa trabajos de la cola con `hilos` hilos hasta que se active el evento `parar` (o Ctrl+C)."""
+    from read_invoice import procesar_factura, MAX_FACTURAS_CONCURRENTES
+    from planificador_llm import con_prioridad
+
+    cola = obtener_cola()
+    hilos = hilos or MAX_FACTURAS_CONCURRENTES
+    parar = parar or threading.Event()
+    base = f"{socket.gethostname()}:{os.getpid()}"
+    workers = [
+        threading.Thread(target=_bucle_trabajador, args=(cola, f"{base}:{i}", procesar_factura, con_prioridad, parar), daemon=True)
+        for i in range(hilos)
+    ]
+    logging.info(f"👷 Trabajador de facturas iniciado con {hilos} hilo(s).")
+    for worker in workers:
+        worker.start()
+    try:
+        while any(worker.is_alive() for worker in workers):
+            for worker in workers:
+                worker.join(timeout=1)
+    except KeyboardInterrupt:
+        logging.info("⏹️ Deteniendo trabajador: se terminarán los trabajos en curso.")
+        parar.set()
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trabajador de la cola de facturas de Stock AI.")
+    parser.add_argument("--hilos", type=int, default=None, help="Número de facturas procesadas en paralelo.")
+    parser.add_argument("--puerto-metricas", type=int, default=None,
+                        help="Sirve las métricas de la ingesta en formato Prometheus en http://0.0.0.0:PUERTO/metrics.")
+    args = parser.parse_args()
+    from read_invoice import configurar_proceso
+    configurar_proceso()
+    if args.puerto_metricas:
+        iniciar_servidor_metricas(args.puerto_metricas)
+    ejecutar_trabajador(args.hilos)
@@ -0,0 +1,176 @@
+import os
+import pandas as pd
+
+import db_manager
+import instantaneas
+import prevision_demanda
+
+# Capa de consultas del dashboard: los filtros (fechas, producto, paginación) se resuelven en SQL
+# y solo viaja a pandas el resultado. Las funciones no dependen de Streamlit; app.py las cachea.
+# Las fechas están normalizadas a ISO en la columna indexada cabeceras_factura.fecha (esquema v5).
+# La carga del historial completo y las páginas de líneas filtradas usan la instantánea columnar de la empresa
+# si está al día (instantaneas.py); si no, se leen de SQLite.
+
+_SELECT_LINEAS = """
+    SELECT l.id, c.numero_factura, c.fecha AS fecha_emision, p.nombre AS nombre_producto,
+           l.cantidad, l.precio_unitario, l.total_producto, c.total_factura,
+           NULLIF(TRIM(COALESCE(c.incidencias, '') || ',' || COALESCE(l.incidencias, ''), ','), '') AS incidencias
+    FROM lineas_factura l
+    JOIN cabeceras_factura c ON c.id = l.factura_id
+    JOIN productos p ON p.id = l.producto_id
+"""
+
+def _ruta_si_existe(nombre_empresa):
+    db_path = db_manager.ruta_bd_empresa(nombre_empresa)
+    return db_path if os.path.exists(db_path) else None
+
+def _filtros_sql(desde=None, hasta=None, producto=None):
+    condiciones, parametros = [], []
+    if desde:
+        condiciones.append("c.fecha >= ?")
+        parametros.append(str(desde))
+    if hasta:
+        condiciones.append("c.fecha <= ?")
+        parametros.append(str(hasta))
+    if producto:
+        condiciones.append("p.nombre = ?")
+        parametros.append(producto)
+    where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    return where, parametros
+
+def version_datos(nombre_empresa):
+    """Contador de cambios de la BD de la empresa (0 si no existe). Forma parte de la clave de caché."""
+    db_path = _ruta_si_existe(nombre_empresa)
+    if db_path is None:
+        return 0
+    with db_manager.conexion(db_path) as conn:
+        return db_manager.version_datos(conn)
+
+def obtener_datos_empresa(nombre_empresa, columnas=None):
+    """
+    Carga todas las líneas de la empresa (solo las columnas pedidas, si se indican), con las fechas como
+    datetime64 y el número de factura y el producto como categorías. Lee la instantánea columnar si
+    corresponde a la versión actual de la BD y, si no, la vista 'facturas'.
+    """
+    db_path = _ruta_si_existe(nombre_empresa)
+    if db_path is None:
+        return pd.DataFrame()
+    with db_manager.conexion(db_path) as conn:
+        df = instantaneas.leer_instantanea(nombre_empresa, columnas, conn)
+        if df is not None:
+            return df
+        seleccion = ", ".join(columnas) if columnas else "*"
+        df = pd.read_sql_query(f"SELECT {seleccion} FROM facturas", conn)
+    # Mismos tipos que la instantánea
+    if "fecha_emision" in df:
+        df["fecha_emision"] = pd.to_datetime(df["fecha_emision"], format="%Y-%m-%d", errors="coerce")
+    for columna in ("numero_factura", "nombre_producto"):
+        if columna in df:
+            df[columna] = df[columna].astype("category")
+    return df
+
+def resumen_filtros(nombre_empresa):
+    """Devuelve (fecha_min, fecha_max, productos) para inicializar los filtros sin cargar las líneas."""
+    db_path = _ruta_si_existe(nombre_empresa)
+    if db_path is None:
+        return None, None, []
+    with db_manager.conexion(db_path) as conn:
+        fecha_min, fecha_max = conn.execute(
+            "SELECT MIN(fecha), MAX(fecha) FROM cabeceras_factura"
+        ).fetchone()
+        productos = [fila[0] for fila in conn.execute("""
+            SELECT p.nombre FROM productos p
+            WHERE EXISTS (SELECT 1 FROM lineas_factura l WHERE l.producto_id = p.id)
+            ORDER BY p.nombre
+        """)]
+    return fecha_min, fecha_max, productos
+
+def contar_lineas(nombre_empresa, desde=None, hasta=None, producto=None):
+    db_path = _ruta_si_existe(nombre_empresa)
+    if db_path is None:
+        return 0
+    where, parametros = _filtros_sql(desde, hasta, producto)
+    with db_manager.conexion(db_path) as conn:
+        total = instantaneas.contar_lineas(nombre_empresa, conn, desde, hasta, producto)
+        if total is not None:
+            return total
+        return conn.execute(f"""
+            SELECT COUNT(*) FROM lineas_factura l
+            JOIN cabeceras_factura c ON c.id = l.factura_id
+            JOIN productos p ON p.id = l.producto_id
+            {where}
+        """, parametros).fetchone()[0]
+
+def consultar_lineas(nombre_empresa, desde=None, hasta=None, producto=None, limite=100, desplazamiento=0):
+    """Una página de líneas filtradas, de la más reciente a la más antigua."""
+    db_path = _ruta_si_existe(nombre_empresa)
+    if db_path is None:
+        return pd.DataFrame()
+    where, parametros = _filtros_sql(desde, hasta, producto)
+    with db_manager.conexion(db_path) as conn:
+        pagina = instantaneas.consultar_lineas(nombre_empresa, conn, desde, hasta, producto, limite, desplazamiento)
+        if pagina is not None:
+            return pagina
+        return pd.read_sql_query(
+            f"{_SELECT_LINEAS}{where} ORDER BY fecha_emision DESC, l.id DESC LIMIT ? OFFSET ?",
+            conn, params=parametros + [int(limite), int(desplazamiento)]
+        )
+
+def resumen_demanda(nombre_empresa):
+    """Totales de demanda por producto precalculados en la ingesta (una fila por producto)."""
+    db_path = _ruta_si_existe(nombre_empresa)
+    if db_path is None:
+        return pd.DataFrame()
+    with db_manager.conexion(db_path) as conn:
+        return pd.read_sql_query("""
+            SELECT p.nombre AS nombre_producto, d.primera_fecha, d.ultima_fecha, d.total_unidades, d.dias_con_compra
+            FROM demanda_producto d JOIN productos p ON p.id = d.producto_id
+            ORDER BY p.nombre
+        """, conn)
+
+def actualizar_prevision_empresa(nombre_empresa):
+    """
+    Reajusta la previsión de los productos con facturas nuevas o eliminadas desde el último ajuste (lo hace
+    también la ingesta). Escribe en la BD: no se llama desde funciones cacheadas. Devuelve los productos ajustados.
+    """
+    db_path = _ruta_si_existe(nombre_empresa)
+    if db_path is None:
+        return 0
+    return prevision_demanda.actualizar_previsiones(db_path)
+
+def prevision_demanda_empresa(nombre_empresa):
+    """
+    Estado guardado del modelo de previsión de cada producto (ver prevision_demanda.leer_previsiones).
+    Solo lee: los productos sin reajustar conservan su último ajuste.
+    """
+    db_path = _ruta_si_existe(nombre_empresa)
+    if db_path is None:
+        return pd.DataFrame()
+    with db_manager.conexion(db_path) as conn:
+        return prevision_demanda.leer_previsiones(conn)
+
+def contar_incidencias(nombre_empresa):
+    """Número de líneas de la empresa con alguna incidencia de validación (en la línea o en su cabecera)."""
+    db_path = _ruta_si_existe(nombre_empresa)
+    if db_path is None:
+        return 0
+    with db_manager.conexion(db_path) as conn:
+        return conn.execute("""
+            SELECT COUNT(*) FROM lineas_factura l JOIN cabeceras_factura c ON c.id = l.factura_id
+            WHERE l.incidencias IS NOT NULL OR c.incidencias IS NOT NULL
+        """).fetchone()[0]
+
+def linea_existe(nombre_empresa, linea_id, desde=None, hasta=None, producto=None):
+    """Si la línea existe y entra en los filtros de la tabla mostrada (los mismos que contar_lineas)."""
+    db_path = _ruta_si_existe(nombre_empresa)
+    if db_path is None:
+        return False
+    where, parametros = _filtros_sql(desde, hasta, producto)
+    where = f"{where} AND l.id = ?" if where else " WHERE l.id = ?"
+    with db_manager.conexion(db_path) as conn:
+        return conn.execute(f"""
+            SELECT 1 FROM lineas_factura l
+            JOIN cabeceras_factura c ON c.id = l.factura_id
+            JOIN productos p ON p.id = l.producto_id
+            {where}
+        """, parametros + [int(linea_id)]).fetchone() is not None
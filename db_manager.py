@@ -1,56 +1,571 @@
 import os
+import re
+import queue
 import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from normalizacion_datos import limpiar_numero, limpiar_numeros, incidencias_linea, INCIDENCIA_FECHA, INCIDENCIA_TOTAL
+
+CARPETA_BASES_DATOS = "data/bases_datos"
+
+# Versión del esquema de las BD de empresa (se guarda en PRAGMA user_version).
+# Versión 0/1: tabla plana 'facturas' con una fila por línea y la cabecera repetida.
+# Versión 2: cabeceras_factura + lineas_factura + productos, con índices. 'facturas' pasa a ser una vista.
+# Versión 3: tabla meta_bd con un contador de cambios (version_datos) mantenido por triggers.
+# Versión 4: agregados de demanda (demanda_diaria, demanda_producto) mantenidos al insertar/eliminar.
+# Versión 5: fecha ISO indexada en las cabeceras, importes siempre numéricos y columna 'incidencias'.
+# Versión 6: caché de la previsión de demanda por producto (prevision_demanda.py).
+# Versión 7: sin borrado a través de la vista 'facturas': las líneas se eliminan solo con eliminar_linea.
+# Versión 8: la caché de previsión guarda el estado del método de Croston (tamaño e intervalo de las compras).
+VERSION_ESQUEMA = 8
+
+# Conexiones inactivas que se conservan por BD en el pool
+MAX_CONEXIONES_INACTIVAS = 4
+
+# Pragmas aplicados a cada conexión nueva. WAL permite que el dashboard lea mientras se escribe una ingesta.
+PRAGMAS_CONEXION = (
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA foreign_keys = ON;",
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA cache_size = -16000;",      # ~16 MB de caché de páginas
+    "PRAGMA mmap_size = 268435456;",    # 256 MB
+)
 
 def normalizar_nombre_archivo(nombre):
     return nombre.lower().replace(" ", "_").replace(".", "").replace(",", "").replace("-", "_")
 
+def ruta_bd_empresa(nombre_empresa_normalizado):
+    return os.path.join(CARPETA_BASES_DATOS, f"{nombre_empresa_normalizado}.db")
+
+# --- Esquema ---
+def _ejecutar_script(cursor, script):
+    """Como executescript, pero sin el COMMIT implícito, para que la migración sea una sola transacción."""
+    sentencia = ""
+    for linea in script.splitlines(keepends=True):
+        sentencia += linea
+        if sqlite3.complete_statement(sentencia):
+            cursor.execute(sentencia)
+            sentencia = ""
+
+def _crear_esquema_v2(cursor):
+    _ejecutar_script(cursor, """
+        CREATE TABLE IF NOT EXISTS productos (
+            id INTEGER PRIMARY KEY,
+            nombre TEXT NOT NULL UNIQUE
+        );
+
+        CREATE TABLE IF NOT EXISTS cabeceras_factura (
+            id INTEGER PRIMARY KEY,
+            numero_factura TEXT NOT NULL UNIQUE,
+            fecha_emision TEXT,
+            total_factura REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_cabeceras_fecha ON cabeceras_factura(fecha_emision);
+
+        CREATE TABLE IF NOT EXISTS lineas_factura (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            factura_id INTEGER NOT NULL REFERENCES cabeceras_factura(id) ON DELETE CASCADE,
+            producto_id INTEGER NOT NULL REFERENCES productos(id),
+            cantidad REAL,
+            precio_unitario REAL,
+            total_producto REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_lineas_factura ON lineas_factura(factura_id);
+        CREATE INDEX IF NOT EXISTS idx_lineas_producto ON lineas_factura(producto_id);
+
+        -- Vista con las mismas columnas que la antigua tabla plana, para las consultas existentes
+        CREATE VIEW IF NOT EXISTS facturas AS
+            SELECT l.id, c.numero_factura, c.fecha_emision, p.nombre AS nombre_producto,
+                   l.cantidad, l.precio_unitario, l.total_producto, c.total_factura
+            FROM lineas_factura l
+            JOIN cabeceras_factura c ON c.id = l.factura_id
+            JOIN productos p ON p.id = l.producto_id;
+
+        -- Borrar por id sobre la vista elimina la línea y la cabecera si se queda sin líneas
+        CREATE TRIGGER IF NOT EXISTS facturas_borrar INSTEAD OF DELETE ON facturas
+        BEGIN
+            DELETE FROM lineas_factura WHERE id = OLD.id;
+            DELETE FROM cabeceras_factura
+            WHERE numero_factura = OLD.numero_factura
+              AND NOT EXISTS (SELECT 1 FROM lineas_factura l WHERE l.factura_id = cabeceras_factura.id);
+        END;
+    """)
+
+def _migrar_a_v2(cursor):
+    """Crea el esquema normalizado y, si existe la tabla plana antigua, copia sus datos."""
+    legado = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'facturas'"
+    ).fetchone()
+    if legado:
+        cursor.execute("ALTER TABLE facturas RENAME TO facturas_legado;")
+
+    _crear_esquema_v2(cursor)
+
+    if legado:
+        _ejecutar_script(cursor, """
+            INSERT OR IGNORE INTO productos (nombre)
+                SELECT DISTINCT COALESCE(nombre_producto, 'Producto Desconocido') FROM facturas_legado;
+
+            INSERT OR IGNORE INTO cabeceras_factura (numero_factura, fecha_emision, total_factura)
+                SELECT COALESCE(numero_factura, ''), MIN(fecha_emision), MAX(total_factura)
+                FROM facturas_legado GROUP BY COALESCE(numero_factura, '');
+
+            INSERT INTO lineas_factura (id, factura_id, producto_id, cantidad, precio_unitario, total_producto)
+                SELECT f.id, c.id, p.id, f.cantidad, f.precio_unitario, f.total_producto
+                FROM facturas_legado f
+                JOIN cabeceras_factura c ON c.numero_factura = COALESCE(f.numero_factura, '')
+                JOIN productos p ON p.nombre = COALESCE(f.nombre_producto, 'Producto Desconocido');
+
+            DROP TABLE facturas_legado;
+        """)
+
+def _migrar_a_v3(cursor):
+    """Contador de cambios de la BD: cualquier alta, baja o modificación de facturas lo incrementa."""
+    _ejecutar_script(cursor, """
+        CREATE TABLE IF NOT EXISTS meta_bd (
+            clave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta_bd (clave, valor) VALUES ('version_datos', 0);
+
+        CREATE TRIGGER IF NOT EXISTS lineas_version_insert AFTER INSERT ON lineas_factura
+        BEGIN
+            UPDATE meta_bd SET valor = valor + 1 WHERE clave = 'version_datos';
+        END;
+        CREATE TRIGGER IF NOT EXISTS lineas_version_update AFTER UPDATE ON lineas_factura
+        BEGIN
+            UPDATE meta_bd SET valor = valor + 1 WHERE clave = 'version_datos';
+        END;
+        CREATE TRIGGER IF NOT EXISTS lineas_version_delete AFTER DELETE ON lineas_factura
+        BEGIN
+            UPDATE meta_bd SET valor = valor + 1 WHERE clave = 'version_datos';
+        END;
+        CREATE TRIGGER IF NOT EXISTS cabeceras_version_insert AFTER INSERT ON cabeceras_factura
+        BEGIN
+            UPDATE meta_bd SET valor = valor + 1 WHERE clave = 'version_datos';
+        END;
+        CREATE TRIGGER IF NOT EXISTS cabeceras_version_update AFTER UPDATE ON cabeceras_factura
+        BEGIN
+            UPDATE meta_bd SET valor = valor + 1 WHERE clave = 'version_datos';
+        END;
+    """)
+
+def _migrar_a_v4(cursor):
+    """Agregados de demanda por producto y día, y totales acumulados por producto."""
+    _ejecutar_script(cursor, """
+        CREATE TABLE IF NOT EXISTS demanda_diaria (
+            producto_id INTEGER NOT NULL REFERENCES productos(id),
+            fecha TEXT NOT NULL,
+            unidades REAL NOT NULL,
+            num_lineas INTEGER NOT NULL,
+            PRIMARY KEY (producto_id, fecha)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS demanda_producto (
+            producto_id INTEGER PRIMARY KEY REFERENCES productos(id),
+            primera_fecha TEXT NOT NULL,
+            ultima_fecha TEXT NOT NULL,
+            total_unidades REAL NOT NULL,
+            dias_con_compra INTEGER NOT NULL
+        );
+    """)
+    # Los agregados se calculan al final de la migración a v5, que ya tiene la fecha ISO en las cabeceras
+
+# Vista con las columnas de la antigua tabla plana; desde la v5 'fecha_emision' es la fecha ISO normalizada
+_VISTA_FACTURAS_V5 = """
+    DROP VIEW IF EXISTS facturas;
+    CREATE VIEW facturas AS
+        SELECT l.id, c.numero_factura, c.fecha AS fecha_emision, p.nombre AS nombre_producto,
+               l.cantidad, l.precio_unitario, l.total_producto, c.total_factura
+        FROM lineas_factura l
+        JOIN cabeceras_factura c ON c.id = l.factura_id
+        JOIN productos p ON p.id = l.producto_id;
+
+    CREATE TRIGGER IF NOT EXISTS facturas_borrar INSTEAD OF DELETE ON facturas
+    BEGIN
+        DELETE FROM lineas_factura WHERE id = OLD.id;
+        DELETE FROM cabeceras_factura
+        WHERE numero_factura = OLD.numero_factura
+          AND NOT EXISTS (SELECT 1 FROM lineas_factura l WHERE l.factura_id = cabeceras_factura.id);
+    END;
+"""
+
+def _migrar_a_v5(cursor):
+    """
+    Normaliza una sola vez lo que antes se interpretaba en cada consulta: la fecha de emisión pasa a una columna
+    ISO indexada ('fecha') y los importes guardados como texto (BD migradas de la tabla plana) se convierten a
+    números. Las filas que no se pueden convertir quedan marcadas en 'incidencias'.
+    """
+    _ejecutar_script(cursor, f"""
+        ALTER TABLE cabeceras_factura ADD COLUMN fecha TEXT;
+        ALTER TABLE cabeceras_factura ADD COLUMN incidencias TEXT;
+        ALTER TABLE lineas_factura ADD COLUMN incidencias TEXT;
+
+        UPDATE cabeceras_factura SET fecha = fecha_iso(fecha_emision);
+        UPDATE cabeceras_factura SET incidencias = '{INCIDENCIA_FECHA}' WHERE fecha IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_cabeceras_fecha_iso ON cabeceras_factura(fecha);
+    """)
+    _ejecutar_script(cursor, _VISTA_FACTURAS_V5)
+
+    # Totales de factura en texto ('1.234,50'): se convierten igual que los de las líneas
+    filas = cursor.execute("SELECT id, total_factura FROM cabeceras_factura WHERE typeof(total_factura) = 'text'").fetchall()
+    if filas:
+        ids, totales = zip(*filas)
+        convertidos = [None if total != total else total for total in limpiar_numeros(totales).tolist()]  # NaN -> NULL
+        cursor.executemany(f"""
+            UPDATE cabeceras_factura SET total_factura = ?,
+                incidencias = CASE WHEN ? IS NULL THEN COALESCE(incidencias || ',', '') || '{INCIDENCIA_TOTAL}'
+                                   ELSE incidencias END
+            WHERE id = ?;
+        """, [(total, total, cabecera_id) for cabecera_id, total in zip(ids, convertidos)])
+        logging.info(f"🔢 {len(filas)} cabecera(s) con el total en texto convertidas a números "
+                     f"({convertidos.count(None)} sin poder convertir).")
+
+    # Importes en texto ('60.000 unidades', '12,5'): conversión vectorizada, solo si los hay
+    filas = cursor.execute("""
+        SELECT id, cantidad, precio_unitario, total_producto FROM lineas_factura
+        WHERE typeof(cantidad) = 'text' OR typeof(precio_unitario) = 'text' OR typeof(total_producto) = 'text'
+    """).fetchall()
+    if filas:
+        ids, cantidades, precios, totales = zip(*filas)
+        columnas = [limpiar_numeros(valores).astype(object) for valores in (cantidades, precios, totales)]
+        convertidas = []
+        for linea_id, cantidad, precio, total in zip(ids, *columnas):
+            cantidad, precio, total = (None if v != v else v for v in (cantidad, precio, total))  # NaN -> NULL
+            convertidas.append((cantidad, precio, total, incidencias_linea(cantidad, precio, total), linea_id))
+        cursor.executemany("""
+            UPDATE lineas_factura SET cantidad = ?, precio_unitario = ?, total_producto = ?, incidencias = ?
+            WHERE id = ?;
+        """, convertidas)
+        logging.info(f"🔢 {len(convertidas)} línea(s) con importes en texto convertidas a números.")
+    reconstruir_agregados(cursor)
+
+def _migrar_a_v6(cursor):
+    """
+    Estado del modelo de previsión de cada producto. Se guarda junto a los totales de demanda_producto con
+    los que se calculó: si cambian (facturas nuevas o eliminadas del producto), hay que recalcularlo.
+    No tiene triggers de version_datos: es una caché derivada de las facturas.
+    """
+    _ejecutar_script(cursor, """
+        CREATE TABLE IF NOT EXISTS prevision_demanda (
+            producto_id INTEGER PRIMARY KEY REFERENCES productos(id),
+            ultima_fecha TEXT NOT NULL,
+            total_unidades REAL NOT NULL,
+            dias_con_compra INTEGER NOT NULL,
+            version_modelo INTEGER NOT NULL,
+            nivel REAL NOT NULL,
+            tendencia REAL NOT NULL,
+            estacionalidad BLOB NOT NULL,   -- 7 float64, de lunes a domingo
+            desviacion REAL NOT NULL,
+            alfa REAL NOT NULL,
+            gamma REAL NOT NULL
+        );
+    """)
+
+def _migrar_a_v7(cursor):
+    """
+    Elimina el trigger INSTEAD OF DELETE de la vista 'facturas': un DELETE sobre la vista borraba la línea
+    sin descontarla de los agregados de demanda. Ahora la vista es de solo lectura y las bajas pasan por
+    eliminar_linea.
+    """
+    cursor.execute("DROP TRIGGER IF EXISTS facturas_borrar;")
+
+def _migrar_a_v8(cursor):
+    """
+    La previsión de demanda pasa de Holt-Winters sobre la serie diaria a Croston (SBA) sobre el tamaño y el
+    intervalo de las compras. La tabla es una caché derivada: se crea de nuevo vacía y se rellena en la
+    siguiente lectura.
+    """
+    _ejecutar_script(cursor, """
+        DROP TABLE IF EXISTS prevision_demanda;
+        CREATE TABLE prevision_demanda (
+            producto_id INTEGER PRIMARY KEY REFERENCES productos(id),
+            ultima_fecha TEXT NOT NULL,
+            total_unidades REAL NOT NULL,
+            dias_con_compra INTEGER NOT NULL,
+            version_modelo INTEGER NOT NULL,
+            tamano REAL NOT NULL,       -- unidades por compra (suavizado)
+            intervalo REAL NOT NULL,    -- días entre compras (suavizado)
+            varianza_tamano REAL NOT NULL,
+            varianza_intervalo REAL NOT NULL,
+            alfa REAL NOT NULL
+        );
+    """)
+
+# (versión destino, función de migración), en orden
+MIGRACIONES = [
+    (2, _migrar_a_v2),
+    (3, _migrar_a_v3),
+    (4, _migrar_a_v4),
+    (5, _migrar_a_v5),
+    (6, _migrar_a_v6),
+    (7, _migrar_a_v7),
+    (8, _migrar_a_v8),
+]
+
+def inicializar_bd(db_path):
+    """Crea la BD si no existe y aplica las migraciones pendientes hasta VERSION_ESQUEMA."""
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # fecha_iso(texto) en SQL, para las migraciones que normalizan fechas guardadas como texto
+    conn.create_function("fecha_iso", 1, fecha_a_iso, deterministic=True)
+    try:
+        cursor = conn.cursor()
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        for version_destino, migrar in MIGRACIONES:
+            if version < version_destino:
+                cursor.execute("BEGIN IMMEDIATE;")
+                # Otro proceso pudo migrar mientras esperábamos el lock
+                if cursor.execute("PRAGMA user_version").fetchone()[0] >= version_destino:
+                    cursor.execute("COMMIT;")
+                    version = version_destino
+                    continue
+                try:
+                    migrar(cursor)
+                    cursor.execute(f"PRAGMA user_version = {version_destino};")
+                    cursor.execute("COMMIT;")
+                except Exception:
+                    cursor.execute("ROLLBACK;")
+                    raise
+                logging.info(f"🔧 BD '{db_path}' migrada al esquema v{version_destino}.")
+                version = version_destino
+    finally:
+        conn.close()
+    return db_path
+
+# --- Fechas ---
+_FORMATOS_FECHA = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d", "%d/%m/%y", "%d-%m-%y")
+
+def fecha_a_iso(valor):
+    """
+    Convierte una fecha de factura ('15/03/2024', '2024-03-15', '15-03-2024 10:00'...) a 'AAAA-MM-DD'.
+    Las fechas con barras se interpretan como día/mes/año. Devuelve None si no se reconoce.
+    """
+    if not isinstance(valor, str) or not valor.strip():
+        return None
+    texto = re.split(r"[T\s]", valor.strip(), maxsplit=1)[0]
+    for formato in _FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto, formato).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+# --- Pool de conexiones ---
+_pools = {}
+_pools_lock = threading.Lock()
+_bds_inicializadas = set()
+
+def asegurar_esquema(db_path):
+    """Aplica inicializar_bd una sola vez por proceso y BD."""
+    if db_path in _bds_inicializadas:
+        return db_path
+    with _pools_lock:
+        if db_path not in _bds_inicializadas:
+            inicializar_bd(db_path)
+            _bds_inicializadas.add(db_path)
+    return db_path
+
+def _abrir_conexion(db_path):
+    # isolation_level=None: sin transacciones implícitas, las escrituras usan transaccion()
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+    for pragma in PRAGMAS_CONEXION:
+        conn.execute(pragma)
+    return conn
+
+@contextmanager
+def conexion(db_path):
+    """
+    Presta una conexión del pool de la BD (creando el esquema la primera vez en el proceso).
+    La conexión vuelve al pool al salir; no debe guardarse fuera del bloque `with`.
+    """
+    asegurar_esquema(db_path)
+    with _pools_lock:
+        pool = _pools.setdefault(db_path, queue.LifoQueue(maxsize=MAX_CONEXIONES_INACTIVAS))
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _abrir_conexion(db_path)
+
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+@contextmanager
+def transaccion(db_path):
+    """Conexión del pool dentro de una transacción de escritura (BEGIN IMMEDIATE ... COMMIT / ROLLBACK)."""
+    with conexion(db_path) as conn:
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+
+def cerrar_conexiones(db_path=None):
+    """Cierra las conexiones inactivas del pool (de una BD o de todas) y olvida que su esquema está verificado."""
+    with _pools_lock:
+        rutas = [db_path] if db_path else list(_pools)
+        if db_path is None:
+            _bds_inicializadas.clear()
+        for ruta in rutas:
+            pool = _pools.pop(ruta, None)
+            _bds_inicializadas.discard(ruta)
+            while pool is not None:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+
+# --- Operaciones ---
+def version_datos(conn):
+    """Contador que cambia con cada alta, baja o modificación de facturas (para invalidar cachés)."""
+    fila = conn.execute("SELECT valor FROM meta_bd WHERE clave = 'version_datos'").fetchone()
+    return fila[0] if fila else 0
+
+def factura_existe(conn, numero_factura):
+    fila = conn.execute(
+        "SELECT 1 FROM cabeceras_factura WHERE numero_factura = ?", (str(numero_factura),)
+    ).fetchone()
+    return fila is not None
+
+def obtener_o_crear_producto(conn, nombre):
+    conn.execute("INSERT OR IGNORE INTO productos (nombre) VALUES (?);", (nombre,))
+    return conn.execute("SELECT id FROM productos WHERE nombre = ?", (nombre,)).fetchone()[0]
+
+def insertar_factura(conn, numero_factura, fecha_emision, total_factura, lineas):
+    """
+    Inserta la cabecera y sus líneas. `lineas` es una lista de tuplas
+    (nombre_producto, cantidad, precio_unitario, total_producto) con los importes ya convertidos a números
+    (None si no se pudieron convertir). La fecha se guarda también en ISO ('fecha') y las filas con datos
+    no válidos se marcan en 'incidencias'.
+    Devuelve False si la factura ya existía. No hace commit: la transacción es del llamante.
+    """
+    fecha = fecha_a_iso(fecha_emision)
+    incidencias = [codigo for codigo, falla in ((INCIDENCIA_FECHA, fecha is None), (INCIDENCIA_TOTAL, total_factura is None)) if falla]
+    cursor = conn.execute("""
+        INSERT OR IGNORE INTO cabeceras_factura (numero_factura, fecha_emision, fecha, total_factura, incidencias)
+        VALUES (?, ?, ?, ?, ?);
+    """, (str(numero_factura), fecha_emision, fecha, total_factura, ",".join(incidencias) or None))
+    if cursor.rowcount == 0:
+        return False
+    factura_id = cursor.lastrowid
+
+    ids_productos = {}
+    filas = []
+    for nombre, cantidad, precio_unitario, total_producto in lineas:
+        if nombre not in ids_productos:
+            ids_productos[nombre] = obtener_o_crear_producto(conn, nombre)
+        filas.append((factura_id, ids_productos[nombre], cantidad, precio_unitario, total_producto,
+                      incidencias_linea(cantidad, precio_unitario, total_producto)))
+    conn.executemany("""
+        INSERT INTO lineas_factura (factura_id, producto_id, cantidad, precio_unitario, total_producto, incidencias)
+        VALUES (?, ?, ?, ?, ?, ?);
+    """, filas)
+
+    if fecha:
+        _actualizar_demanda(conn, fecha, [(fila[1], fila[2]) for fila in filas], signo=1)
+    return True
+
+def eliminar_linea(conn, linea_id):
+    """
+    Elimina una línea de factura (y su cabecera si se queda vacía) actualizando los agregados de demanda.
+    Devuelve False si la línea no existe. No hace commit: la transacción es del llamante.
+    """
+    fila = conn.execute("""
+        SELECT l.factura_id, l.producto_id, l.cantidad, c.fecha FROM lineas_factura l
+        JOIN cabeceras_factura c ON c.id = l.factura_id
+        WHERE l.id = ?
+    """, (linea_id,)).fetchone()
+    if fila is None:
+        return False
+    factura_id, producto_id, cantidad, fecha = fila
+    conn.execute("DELETE FROM lineas_factura WHERE id = ?", (linea_id,))
+    conn.execute("""
+        DELETE FROM cabeceras_factura
+        WHERE id = ? AND NOT EXISTS (SELECT 1 FROM lineas_factura WHERE factura_id = ?)
+    """, (factura_id, factura_id))
+
+    if fecha:
+        _actualizar_demanda(conn, fecha, [(producto_id, cantidad)], signo=-1)
+    return True
+
+# --- Agregados de demanda ---
+def _actualizar_demanda(conn, fecha, lineas, signo):
+    """Suma (signo=1) o resta (signo=-1) las cantidades de `lineas` [(producto_id, cantidad)] en la fecha dada."""
+    lineas = [(producto_id, cantidad) for producto_id, cantidad in lineas if cantidad is not None]
+    if not lineas:
+        return
+    if signo > 0:
+        conn.executemany("""
+            INSERT INTO demanda_diaria (producto_id, fecha, unidades, num_lineas) VALUES (?, ?, ?, 1)
+            ON CONFLICT(producto_id, fecha) DO UPDATE SET
+                unidades = unidades + excluded.unidades,
+                num_lineas = num_lineas + 1;
+        """, [(producto_id, fecha, cantidad) for producto_id, cantidad in lineas])
+    else:
+        conn.executemany("""
+            UPDATE demanda_diaria SET unidades = unidades - ?, num_lineas = num_lineas - 1
+            WHERE producto_id = ? AND fecha = ?;
+        """, [(cantidad, producto_id, fecha) for producto_id, cantidad in lineas])
+        conn.execute("DELETE FROM demanda_diaria WHERE fecha = ? AND num_lineas <= 0;", (fecha,))
+    _refrescar_demanda_producto(conn, {producto_id for producto_id, _ in lineas})
+
+def _refrescar_demanda_producto(conn, producto_ids):
+    """Recalcula los totales de los productos afectados a partir de sus filas de demanda_diaria."""
+    for producto_id in producto_ids:
+        conn.execute("DELETE FROM demanda_producto WHERE producto_id = ?;", (producto_id,))
+        conn.execute("""
+            INSERT INTO demanda_producto (producto_id, primera_fecha, ultima_fecha, total_unidades, dias_con_compra)
+            SELECT producto_id, MIN(fecha), MAX(fecha), SUM(unidades), COUNT(*)
+            FROM demanda_diaria WHERE producto_id = ? GROUP BY producto_id;
+        """, (producto_id,))
+
+def reconstruir_agregados(conn):
+    """Recalcula desde cero los agregados de demanda a partir de las líneas de factura."""
+    _ejecutar_script(conn, """
+        DELETE FROM demanda_diaria;
+        DELETE FROM demanda_producto;
+
+        INSERT INTO demanda_diaria (producto_id, fecha, unidades, num_lineas)
+            SELECT l.producto_id, c.fecha, SUM(l.cantidad), COUNT(*)
+            FROM lineas_factura l
+            JOIN cabeceras_factura c ON c.id = l.factura_id
+            WHERE l.cantidad IS NOT NULL AND c.fecha IS NOT NULL
+            GROUP BY l.producto_id, c.fecha;
+
+        INSERT INTO demanda_producto (producto_id, primera_fecha, ultima_fecha, total_unidades, dias_con_compra)
+            SELECT producto_id, MIN(fecha), MAX(fecha), SUM(unidades), COUNT(*)
+            FROM demanda_diaria GROUP BY producto_id;
+    """)
+
 def guardar_datos_en_base(datos):
     nombre_empresa = datos.get("nombre_empresa")
     if not nombre_empresa:
         raise ValueError("La clave 'nombre_empresa' no existe o está vacía.")
 
     nombre_normalizado = normalizar_nombre_archivo(nombre_empresa)
-    base_datos = f"data/bases_datos/{nombre_normalizado}.db"
-
-    conn = sqlite3.connect(base_datos)
-    cursor = conn.cursor()
-
-    # ✅ Crear tabla con campo numero_factura
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS facturas (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        numero_factura TEXT,
-        fecha_emision TEXT,
-        nombre_producto TEXT,
-        cantidad INTEGER,
-        precio_unitario REAL,
-        total_producto REAL,
-        total_factura REAL
-    )
-    """)
+    base_datos = ruta_bd_empresa(nombre_normalizado)
 
-    for producto in datos["productos"]:
-        cursor.execute("""
-        INSERT INTO facturas (
-            numero_factura,
-            fecha_emision,
-            nombre_producto,
-            cantidad,
-            precio_unitario,
-            total_producto,
-            total_factura
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
+    with transaccion(base_datos) as conn:
+        insertar_factura(
+            conn,
             datos["numero_factura"],
             datos["fecha_emision"],
-            producto["nombre"],
-            producto["cantidad"],
-            producto["precio_unitario"],
-            producto["total_por_producto"],
-            datos["total_factura"]
-        ))
-
-    conn.commit()
-    conn.close()
+            limpiar_numero(datos["total_factura"], por_defecto=None),
+            [(p["nombre"], *(limpiar_numero(p[campo], por_defecto=None) for campo in ("cantidad", "precio_unitario", "total_por_producto")))
+             for p in datos["productos"]]
+        )
 
     print(f"✅ Datos guardados en la base de datos: {base_datos}")
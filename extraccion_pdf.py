@@ -0,0 +1,84 @@
+import os
+import math
+import logging
+import tempfile
+import threading
+import multiprocessing
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+# Configuración
+SEPARADOR_PAGINA = "\f"  # entre el texto de dos páginas; preprocesado_texto lo usa para detectar cabeceras y pies
+MAX_PAGINAS_PDF = int(os.getenv("STOCKAI_MAX_PAGINAS_PDF", "200"))  # las páginas siguientes se ignoran
+UMBRAL_PAGINAS_PARALELO = 40  # a partir de aquí las páginas se reparten entre procesos
+MAX_PROCESOS_PDF = int(os.getenv("STOCKAI_PROCESOS_PDF", str(min(4, os.cpu_count() or 1))))
+
+
+def _abrir(origen):
+    """Abre un PDF desde una ruta o desde su contenido en memoria (bytes, bytearray o memoryview)."""
+    if isinstance(origen, memoryview):
+        origen = origen.tobytes()
+    if isinstance(origen, (bytes, bytearray)):
+        return fitz.open(stream=origen, filetype="pdf")
+    return fitz.open(origen)
+
+def _texto_paginas(origen, inicio, fin):
+    """Texto de las páginas [inicio, fin). Se ejecuta en los procesos del pool."""
+    with _abrir(origen) as doc:
+        return [doc[i].get_text() for i in range(inicio, fin)]
+
+_pool_procesos = None
+_pool_lock = threading.Lock()
+
+def _obtener_pool():
+    """
+    Pool de procesos compartido. Con "spawn" y no con fork: el pool se crea desde hilos (procesar_facturas_en_carpeta,
+    trabajador de la cola) y un fork copiaría los locks que otros hilos tuvieran tomados en ese momento.
+    """
+    global _pool_procesos
+    with _pool_lock:
+        if _pool_procesos is None:
+            _pool_procesos = ProcessPoolExecutor(max_workers=MAX_PROCESOS_PDF,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return _pool_procesos
+
+def iterar_paginas_pdf(origen, max_paginas=MAX_PAGINAS_PDF):
+    """
+    Genera el texto de cada página del PDF, en orden. `origen` es una ruta o el contenido del PDF en memoria
+    (así el PDF que ya se ha leído para calcular su hash no se vuelve a leer del disco).
+    Como mucho se leen `max_paginas` páginas (None = todas). Los PDF con muchas páginas se reparten en
+    rangos entre un pool de procesos; las páginas se siguen devolviendo en orden. A los procesos se les pasa
+    la ruta del PDF: si está en memoria, se escribe una vez en un archivo temporal en lugar de enviar el
+    contenido entero con cada rango.
+    """
+    with _abrir(origen) as doc:
+        total = doc.page_count
+        paginas = min(total, max_paginas) if max_paginas else total
+        if paginas < total:
+            logging.warning(f"⚠️ El PDF tiene {total} páginas; solo se leen las {paginas} primeras.")
+        if paginas < UMBRAL_PAGINAS_PARALELO or MAX_PROCESOS_PDF <= 1:
+            for i in range(paginas):
+                yield doc[i].get_text()
+            return
+
+    temporal = None
+    if isinstance(origen, (bytes, bytearray, memoryview)):
+        descriptor, temporal = tempfile.mkstemp(prefix="stockai_", suffix=".pdf")
+        with os.fdopen(descriptor, "wb") as f:
+            f.write(origen)
+        origen = temporal
+    try:
+        tamano = math.ceil(paginas / MAX_PROCESOS_PDF)
+        inicios = range(0, paginas, tamano)
+        fines = [min(inicio + tamano, paginas) for inicio in inicios]
+        for textos in _obtener_pool().map(_texto_paginas, repeat(origen), inicios, fines):
+            yield from textos
+    finally:
+        if temporal is not None:
+            os.remove(temporal)
+
+def extraer_texto_pdf(origen, max_paginas=MAX_PAGINAS_PDF):
+    """Texto del PDF con las páginas separadas por SEPARADOR_PAGINA (el preprocesado lo usa para detectar cabeceras y pies)."""
+    return SEPARADOR_PAGINA.join(iterar_paginas_pdf(origen, max_paginas))
@@ -0,0 +1,224 @@
+import os
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import db_manager
+from db_manager import transaccion
+from extraccion_pdf import extraer_texto_pdf
+from metricas import medir
+from normalizacion_datos import limpiar_numero
+from registro_procesados import obtener_registro, hash_bytes, hash_texto, TIPO_PDF, TIPO_TEXTO
+from read_invoice import (
+    MAX_FACTURAS_CONCURRENTES, actualizar_derivados, configurar_proceso, crear_base_datos_si_no_existe,
+    extraer_datos_factura, factura_existe, lineas_factura, lock_bd, normalizar_nombre_empresa,
+    normalizar_productos_factura,
+)
+
+# Configuración
+RUTA_PUNTO_CONTROL = "data/importacion_historico.db"
+TAMANO_LOTE = 50
+
+HECHO = "hecho"        # factura nueva guardada
+OMITIDO = "omitido"    # documento o factura que ya estaba en la BD
+ERROR = "error"
+
+
+class PuntoControl:
+    """
+    Estado de cada archivo de la importación (en SQLite). Se actualiza una vez por lote, después de confirmar
+    las escrituras en las BD de empresa, así que una importación interrumpida se reanuda en el primer lote
+    sin confirmar.
+    """
+
+    def __init__(self, ruta_bd=RUTA_PUNTO_CONTROL):
+        carpeta = os.path.dirname(ruta_bd)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta_bd, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS archivos (
+                ruta TEXT PRIMARY KEY,
+                estado TEXT NOT NULL,
+                empresa TEXT,
+                numero_factura TEXT,
+                error TEXT,
+                actualizado REAL NOT NULL
+            );
+        """)
+
+    def estados(self):
+        """Dict {ruta: estado} de los archivos ya tratados."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT ruta, estado FROM archivos").fetchall())
+
+    def marcar(self, resultados):
+        """Guarda el estado de los archivos de un lote en una sola transacción."""
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE;")
+            try:
+                self._conn.executemany("""
+                    INSERT OR REPLACE INTO archivos (ruta, estado, empresa, numero_factura, error, actualizado)
+                    VALUES (?, ?, ?, ?, ?, ?);
+                """, [(r["ruta"], r["estado"], r.get("empresa"), r.get("numero_factura"), r.get("error"), ahora)
+                      for r in resultados])
+                self._conn.execute("COMMIT;")
+            except Exception:
+                self._conn.execute("ROLLBACK;")
+                raise
+
+
+def buscar_pdfs(raiz):
+    """Rutas absolutas de los PDF bajo `raiz`, en un orden estable (necesario para reanudar)."""
+    for carpeta, subcarpetas, archivos in os.walk(os.path.abspath(raiz)):
+        subcarpetas.sort()
+        for nombre in sorted(archivos):
+            if nombre.lower().endswith(".pdf"):
+                yield os.path.join(carpeta, nombre)
+
+
+def _preparar(ruta):
+    """
+    Lee y extrae una factura sin escribir en ninguna BD de empresa. Devuelve un dict con su estado
+    (None si hay que guardarla), los datos extraídos y los segundos dedicados a la extracción con IA.
+    """
+    registro = obtener_registro()
+    resultado = {"ruta": ruta, "estado": None, "segundos_ia": 0.0}
+    try:
+        with open(ruta, "rb") as f:
+            contenido = f.read()
+        hash_pdf = hash_bytes(contenido)
+        previo = registro.buscar(hash_pdf, TIPO_PDF)
+        if previo is None:
+            with medir("extraer_texto_pdf", bytes_pdf=len(contenido)):
+                texto = extraer_texto_pdf(contenido)
+            hash_txt = hash_texto(texto)
+            previo = registro.buscar(hash_txt, TIPO_TEXTO)
+            if previo:
+                registro.registrar(previo["empresa"], previo["numero_factura"], os.path.basename(ruta), hash_pdf=hash_pdf)
+        if previo:
+            resultado.update(estado=OMITIDO, empresa=previo["empresa"], numero_factura=previo["numero_factura"])
+            return resultado
+
+        inicio = time.perf_counter()
+        datos = extraer_datos_factura(texto)
+        empresa = normalizar_nombre_empresa(datos.get("nombre_empresa", "empresa_desconocida"))
+        if not datos.get("numero_factura"):
+            resultado["segundos_ia"] = time.perf_counter() - inicio
+            raise ValueError("Datos de factura incompletos: numero_factura requerido.")
+        resultado.update(
+            empresa=empresa,
+            numero_factura=str(datos["numero_factura"]),
+            datos=datos, hash_pdf=hash_pdf, hash_txt=hash_txt,
+        )
+
+        # Misma factura en otro PDF: se omite antes de normalizar sus productos (sin peticiones a OpenAI ni
+        # nombres nuevos en el índice de la empresa); _guardar_lote la anota en el registro de procesados
+        db_path = db_manager.ruta_bd_empresa(empresa)
+        if os.path.exists(db_path) and factura_existe(db_path, datos["numero_factura"]):
+            logging.info(f"⏭️ Factura '{datos['numero_factura']}' para '{empresa}' ya existe en la BD. Omitiendo normalización.")
+            resultado.update(estado=OMITIDO, segundos_ia=time.perf_counter() - inicio)
+            return resultado
+
+        if datos.get("productos"):
+            with medir("normalizar_productos", productos=len(datos["productos"])):
+                normalizar_productos_factura(datos["productos"], nombre_empresa_normalizado=empresa)
+        resultado["segundos_ia"] = time.perf_counter() - inicio
+    except Exception as e:
+        logging.error(f"❌ Error al extraer {ruta}: {e}")
+        resultado.update(estado=ERROR, error=str(e))
+    return resultado
+
+def _guardar_lote(resultados):
+    """
+    Guarda las facturas preparadas del lote con una transacción por empresa. Si la transacción de una empresa
+    falla, todas sus facturas del lote quedan con error (y se reintentarán). Devuelve los segundos en BD.
+    """
+    por_empresa = defaultdict(list)
+    for resultado in resultados:
+        if resultado["estado"] is None:
+            por_empresa[resultado["empresa"]].append(resultado)
+
+    inicio = time.perf_counter()
+    for empresa, facturas in por_empresa.items():
+        try:
+            db_path = crear_base_datos_si_no_existe(empresa)
+            with lock_bd(empresa), medir("guardar_lote", facturas=len(facturas)), transaccion(db_path) as conn:
+                for factura in facturas:
+                    datos = factura["datos"]
+                    insertada = db_manager.insertar_factura(
+                        conn, datos["numero_factura"], datos.get("fecha_emision", ""),
+                        limpiar_numero(datos.get("total_factura", 0.0), por_defecto=None),
+                        lineas_factura(datos.get("productos") or []),
+                    )
+                    factura["estado"] = HECHO if insertada else OMITIDO
+        except sqlite3.Error as e:
+            logging.error(f"❌ Error al guardar el lote de '{empresa}': {e}")
+            for factura in facturas:
+                factura.update(estado=ERROR, error=str(e))
+    segundos_bd = time.perf_counter() - inicio
+
+    # Un segmento de instantánea y un reajuste de la previsión por empresa y lote, con todas sus facturas nuevas
+    for empresa, facturas in por_empresa.items():
+        if any(factura["estado"] == HECHO for factura in facturas):
+            actualizar_derivados(empresa)
+
+    registro = obtener_registro()
+    for resultado in resultados:
+        if resultado.get("datos") is not None and resultado["estado"] in (HECHO, OMITIDO):
+            registro.registrar(resultado["empresa"], resultado["numero_factura"], os.path.basename(resultado["ruta"]),
+                               hash_pdf=resultado["hash_pdf"], hash_txt=resultado["hash_txt"])
+    return segundos_bd
+
+
+def importar(raiz, tamano_lote=TAMANO_LOTE, concurrencia=None, reintentar_errores=False, ruta_punto_control=RUTA_PUNTO_CONTROL):
+    """
+    Importa todas las facturas PDF bajo `raiz` por lotes. Los archivos no se mueven: el punto de control
+    y el registro de documentos procesados evitan repetir trabajo al reanudar.
+    """
+    concurrencia = concurrencia or MAX_FACTURAS_CONCURRENTES
+    punto_control = PuntoControl(ruta_punto_control)
+    ya_tratados = punto_control.estados()
+    terminados = {HECHO, OMITIDO} if reintentar_errores else {HECHO, OMITIDO, ERROR}
+    pendientes = [ruta for ruta in buscar_pdfs(raiz) if ya_tratados.get(ruta) not in terminados]
+    print(f"📚 {len(pendientes)} factura(s) por importar ({len(ya_tratados)} ya registradas en el punto de control).", flush=True)
+
+    totales = {HECHO: 0, OMITIDO: 0, ERROR: 0}
+    segundos_ia = segundos_bd = 0.0
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix="importacion") as pool:
+        for desde in range(0, len(pendientes), tamano_lote):
+            resultados = list(pool.map(_preparar, pendientes[desde:desde + tamano_lote]))
+            segundos_bd += _guardar_lote(resultados)
+            punto_control.marcar(resultados)
+
+            segundos_ia += sum(r["segundos_ia"] for r in resultados)
+            for resultado in resultados:
+                totales[resultado["estado"]] += 1
+            hechas = desde + len(resultados)
+            minutos = (time.perf_counter() - inicio) / 60
+            print(f"📦 {hechas}/{len(pendientes)} | {totales[HECHO]} nuevas, {totales[OMITIDO]} omitidas, "
+                  f"{totales[ERROR]} con error | {hechas / minutos if minutos else 0:.1f} facturas/min | "
+                  f"IA {segundos_ia:.1f}s | BD {segundos_bd:.1f}s", flush=True)
+
+    return (f"Importación completada: {totales[HECHO]} facturas nuevas, {totales[OMITIDO]} omitidas, "
+            f"{totales[ERROR]} con error.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importación masiva del histórico de facturas PDF de Stock AI.")
+    parser.add_argument("directorio", help="Carpeta con las facturas (se recorre con sus subcarpetas).")
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE, help="Facturas por lote (un commit por empresa y lote).")
+    parser.add_argument("--concurrencia", type=int, default=None, help="Número máximo de facturas extraídas en paralelo.")
+    parser.add_argument("--reintentar-errores", action="store_true", help="Vuelve a intentar los archivos que fallaron.")
+    parser.add_argument("--punto-control", default=RUTA_PUNTO_CONTROL, help="Archivo SQLite con el progreso de la importación.")
+    args = parser.parse_args()
+    configurar_proceso()
+    print(importar(args.directorio, args.lote, args.concurrencia, args.reintentar_errores, args.punto_control))
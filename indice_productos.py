@@ -0,0 +1,193 @@
+import os
+import re
+import logging
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+import db_manager
+
+# Configuración
+UMBRAL_SIMILITUD = float(os.getenv("STOCKAI_UMBRAL_SIMILITUD_PRODUCTO", "0.8"))  # coeficiente de Dice sobre trigramas
+PRODUCTO_DESCONOCIDO = "Producto Desconocido"
+
+# Palabras que no distinguen un producto de otro ("de", "para", "talla"...)
+_PALABRAS_VACIAS = {"de", "del", "la", "el", "los", "las", "para", "con", "sin", "y", "en", "a", "talla", "t"}
+# Medidas y tallas ("500ml", "1,5 l", "10x10", "t-m", "xl"): no cuentan para la similitud, pero si difieren
+# son productos distintos (ver distintivos)
+_MEDIDA = re.compile(r"^(\d+(?:\.\d+)?(?:x\d+)?)([a-z]*)$")
+_UNIDADES = {
+    "ml": "ml", "cl": "cl", "l": "l", "lt": "l", "lts": "l", "litro": "l", "litros": "l",
+    "g": "g", "gr": "g", "grs": "g", "gramo": "g", "gramos": "g", "kg": "kg", "kilo": "kg", "kilos": "kg", "mg": "mg",
+    "cm": "cm", "mm": "mm", "m": "m", "metro": "m", "metros": "m",
+    "u": "ud", "ud": "ud", "uds": "ud", "unidad": "ud", "unidades": "ud",
+}
+_TALLAS = {"xxs", "xs", "s", "m", "l", "xl", "xxl", "xxxl"}
+
+
+def _palabras(nombre):
+    """Palabras del nombre sin tildes ni mayúsculas. Los decimales se conservan ("1,5l" -> "1.5l")."""
+    texto = unicodedata.normalize("NFKD", nombre.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"(?<=\d)[.,](?=\d)", ".", texto)
+    return re.sub(r"[^a-z0-9.]+", " ", texto).replace(". ", " ").strip(" .").split()
+
+def _separar(nombre):
+    """
+    Divide el nombre en palabras de comparación y distintivos: medidas con su unidad normalizada
+    ("1 L", "1l" y "1 litro" son "1l"), tallas ("talla M", "T-M" y "M" son "m") y palabras con cifras ("ffp2").
+    """
+    palabras = _palabras(nombre)
+    comparables, distintivos = [], set()
+    i = 0
+    while i < len(palabras):
+        palabra = palabras[i]
+        medida = _MEDIDA.match(palabra)
+        if medida and (not medida.group(2) or medida.group(2) in _UNIDADES):
+            numero, unidad = medida.groups()
+            if not unidad and i + 1 < len(palabras) and palabras[i + 1] in _UNIDADES:
+                unidad = palabras[i + 1]
+                i += 1
+            distintivos.add(numero + _UNIDADES.get(unidad, unidad))
+        elif palabra in _TALLAS:
+            distintivos.add(palabra)
+        elif any(c.isdigit() for c in palabra):
+            distintivos.add(palabra)
+            comparables.append(palabra)
+        elif palabra not in _PALABRAS_VACIAS and len(palabra) > 1:
+            comparables.append(_singular(palabra))
+        i += 1
+    return " ".join(comparables), frozenset(distintivos)
+
+def plegar(nombre):
+    """
+    Forma de comparación de un nombre de producto: sin tildes ni mayúsculas, sin signos, sin palabras vacías
+    ni medidas y en singular. "GUANTES LÁTEX T-M" y "Guante de latex" se pliegan igual: "guante latex".
+    """
+    return _separar(nombre)[0]
+
+def distintivos(nombre):
+    """
+    Medidas, tallas y palabras con cifras del nombre. Dos nombres con distintivos diferentes son productos
+    distintos aunque se plieguen igual: "Lejía 1L" y "Lejía 5L", "talla S" y "talla L", "ffp2" y "ffp3".
+    """
+    return _separar(nombre)[1]
+
+def _singular(palabra):
+    if len(palabra) > 4 and palabra.endswith("es") and palabra[-3] in "lrndj" and palabra[-4] in "aeiou":
+        return palabra[:-2]   # papeles -> papel (pero desechables -> desechable)
+    if len(palabra) > 3 and palabra.endswith("s") and palabra[-2] in "aeiou":
+        return palabra[:-1]   # guantes -> guante
+    return palabra
+
+def trigramas(plegado):
+    texto = f" {plegado} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceProductos:
+    """
+    Índice de los productos canónicos de una empresa para reconocer variantes de un nombre sin llamar a la IA.
+    Cada producto se indexa por su forma plegada (coincidencia exacta) y por sus trigramas de caracteres
+    (índice invertido trigrama -> productos). buscar() devuelve el producto más parecido si supera el umbral
+    y tiene los mismos distintivos (medidas, tallas, palabras con cifras).
+    Los alias (nombres originales ya resueltos) apuntan a su producto canónico y también se indexan.
+    """
+
+    def __init__(self, umbral=UMBRAL_SIMILITUD):
+        self.umbral = umbral
+        self.ultimo_id = 0           # mayor productos.id cargado de la BD
+        self._canonicos = []         # posición -> nombre canónico
+        self._posiciones = {}        # nombre canónico -> posición
+        self._entradas = []          # (posición del canónico, número de trigramas, distintivos) por forma indexada
+        self._por_plegado = {}       # (forma plegada, distintivos) -> posición del canónico
+        self._indice = defaultdict(list)  # trigrama -> entradas que lo contienen
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._canonicos)
+
+    def anadir(self, canonico, alias=None):
+        """Registra un producto canónico (si es nuevo) y, opcionalmente, un nombre original que lo designa."""
+        if not canonico or canonico == PRODUCTO_DESCONOCIDO:
+            return
+        with self._lock:
+            posicion = self._posiciones.get(canonico)
+            if posicion is None:
+                posicion = self._posiciones[canonico] = len(self._canonicos)
+                self._canonicos.append(canonico)
+            for nombre in (canonico, alias):
+                if isinstance(nombre, str):
+                    self._indexar(_separar(nombre), posicion)
+
+    def _indexar(self, clave, posicion):
+        plegado, distintivos_nombre = clave
+        if not plegado or clave in self._por_plegado:
+            return
+        self._por_plegado[clave] = posicion
+        grams = trigramas(plegado)
+        entrada = len(self._entradas)
+        self._entradas.append((posicion, len(grams), distintivos_nombre))
+        for gram in grams:
+            self._indice[gram].append(entrada)
+
+    def buscar(self, nombre):
+        """Devuelve (nombre canónico, similitud) del producto más parecido con similitud >= umbral, o None."""
+        if not isinstance(nombre, str):
+            return None
+        clave = _separar(nombre)
+        plegado, distintivos_nombre = clave
+        if not plegado:
+            return None
+        with self._lock:
+            posicion = self._por_plegado.get(clave)
+            if posicion is not None:
+                return self._canonicos[posicion], 1.0
+            grams = trigramas(plegado)
+            comunes = Counter(entrada for gram in grams for entrada in self._indice.get(gram, ()))
+            mejor, mejor_similitud = None, 0.0
+            for entrada, n in comunes.items():
+                posicion, total, distintivos_entrada = self._entradas[entrada]
+                if distintivos_entrada != distintivos_nombre:
+                    continue
+                similitud = 2 * n / (len(grams) + total)
+                if similitud > mejor_similitud:
+                    mejor, mejor_similitud = posicion, similitud
+            if mejor is None or mejor_similitud < self.umbral:
+                return None
+            return self._canonicos[mejor], mejor_similitud
+
+    def cargar_de_bd(self, conn):
+        """Añade los productos de la BD con id mayor que el último cargado. Devuelve cuántos ha añadido."""
+        filas = conn.execute("SELECT id, nombre FROM productos WHERE id > ? ORDER BY id", (self.ultimo_id,)).fetchall()
+        for id_producto, nombre in filas:
+            self.anadir(nombre)
+            self.ultimo_id = id_producto
+        return len(filas)
+
+
+_indices = {}
+_indices_lock = threading.Lock()
+
+def obtener_indice(nombre_empresa_normalizado):
+    """
+    Índice de productos de la empresa, compartido en el proceso. Se construye en la primera llamada con los
+    productos de su BD y en las siguientes solo carga los productos añadidos desde entonces (también por otros
+    procesos). Si la BD se ha regenerado (ids menores que los ya cargados), se reconstruye desde cero.
+    """
+    db_path = db_manager.ruta_bd_empresa(nombre_empresa_normalizado)
+    with _indices_lock:
+        indice = _indices.get(nombre_empresa_normalizado)
+        if indice is None:
+            indice = _indices[nombre_empresa_normalizado] = IndiceProductos()
+    if not os.path.exists(db_path):
+        return indice
+    with db_manager.conexion(db_manager.asegurar_esquema(db_path)) as conn:
+        maximo = conn.execute("SELECT COALESCE(MAX(id), 0) FROM productos").fetchone()[0]
+        if maximo < indice.ultimo_id:
+            with _indices_lock:
+                indice = _indices[nombre_empresa_normalizado] = IndiceProductos()
+        if maximo > indice.ultimo_id:
+            nuevos = indice.cargar_de_bd(conn)
+            logging.info(f"🔎 Índice de productos de '{nombre_empresa_normalizado}': {nuevos} producto(s) cargados ({len(indice)} en total).")
+    return indice
@@ -0,0 +1,352 @@
+import os
+import json
+import uuid
+import logging
+import argparse
+import threading
+from datetime import date
+
+import db_manager
+
+# Configuración
+CARPETA_INSTANTANEAS = "data/instantaneas"
+INSTANTANEAS_ACTIVAS = os.getenv("STOCKAI_INSTANTANEAS", "1") != "0"  # 0 = leer siempre de SQLite
+VERSION_INSTANTANEA = 2      # cambiarla obliga a regenerar todas las instantáneas
+FILAS_POR_LOTE = 100_000     # filas leídas de SQLite y escritas en cada lote de Arrow
+ARCHIVO_META = "instantanea.json"
+
+# Instantánea columnar de las líneas de factura de cada empresa (las mismas columnas que la vista 'facturas',
+# más sus incidencias), en archivos Arrow IPC sin comprimir que se leen con memory-map: cargar o filtrar unas
+# columnas solo toca sus páginas y no pasa fila a fila por Python como pd.read_sql_query. Los textos repetidos
+# (número de factura, producto) van como diccionarios y las fechas como date32.
+#
+# La instantánea es una lista de segmentos, cada uno con las líneas de un rango de ids, y un instantanea.json
+# con la huella de la BD a la que corresponde (version_datos, última línea y última cabecera: una BD regenerada
+# desde la caché vuelve a contar desde cero, y solo el contador podría coincidir por casualidad). La ingesta la
+# actualiza después de guardar cada factura o lote: si solo ha habido altas, añade un segmento con las líneas
+# nuevas; los segmentos pequeños se funden con el anterior mientras no sea mayor que ellos, así que hay O(log n)
+# segmentos y cada fila se reescribe pocas veces. Si la BD ha cambiado de otra forma (líneas eliminadas,
+# migraciones) se reconstruye entera en la siguiente actualización. La pestaña de facturas del dashboard filtra
+# y pagina sobre la instantánea (consultas.consultar_lineas). pyarrow es opcional: sin él, o con la instantánea
+# desfasada, todo se lee de SQLite.
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+def _lock_empresa(nombre_empresa):
+    with _locks_guard:
+        return _locks.setdefault(nombre_empresa, threading.Lock())
+
+def _pyarrow():
+    """El módulo pyarrow, o None si no está instalado o las instantáneas están desactivadas."""
+    if not INSTANTANEAS_ACTIVAS:
+        return None
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+    except ImportError:
+        return None
+    return pyarrow
+
+def disponible():
+    return _pyarrow() is not None
+
+def _esquema(pa):
+    texto = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("id", pa.int64()),
+        ("numero_factura", texto),
+        ("fecha_emision", pa.date32()),
+        ("nombre_producto", texto),
+        ("cantidad", pa.float64()),
+        ("precio_unitario", pa.float64()),
+        ("total_producto", pa.float64()),
+        ("total_factura", pa.float64()),
+        ("incidencias", pa.string()),  # casi siempre nula: sin diccionario, que tendría que ser común a los lotes
+    ])
+
+def carpeta_empresa(nombre_empresa):
+    return os.path.join(CARPETA_INSTANTANEAS, nombre_empresa)
+
+def _leer_meta(carpeta):
+    try:
+        with open(os.path.join(carpeta, ARCHIVO_META), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return meta if meta.get("version_instantanea") == VERSION_INSTANTANEA else None
+
+def _escribir_meta(carpeta, meta):
+    ruta = os.path.join(carpeta, ARCHIVO_META)
+    temporal = f"{ruta}.{uuid.uuid4().hex}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(temporal, ruta)  # los lectores ven la lista de segmentos anterior o la nueva, nunca a medias
+
+# --- Escritura ---
+def _escribir_segmento(pa, conn, carpeta, desde_id):
+    """Escribe en un segmento nuevo las líneas con id > desde_id. Devuelve {'archivo', 'filas', 'ultimo_id'}."""
+    import numpy as np
+
+    # Diccionarios del segmento: solo las cabeceras y productos que usan sus líneas, ordenados por id
+    cabeceras = conn.execute("""
+        SELECT id, numero_factura, fecha, total_factura FROM cabeceras_factura
+        WHERE id IN (SELECT factura_id FROM lineas_factura WHERE id > ?) ORDER BY id
+    """, (desde_id,)).fetchall()
+    productos = conn.execute("""
+        SELECT id, nombre FROM productos
+        WHERE id IN (SELECT producto_id FROM lineas_factura WHERE id > ?) ORDER BY id
+    """, (desde_id,)).fetchall()
+    ids_cabecera = np.array([c[0] for c in cabeceras], dtype=np.int64)
+    numeros = pa.array([c[1] for c in cabeceras], pa.string())
+    fechas = pa.array([date.fromisoformat(c[2]) if c[2] else None for c in cabeceras], pa.date32())
+    totales_factura = np.array([c[3] for c in cabeceras], dtype=float)
+    ids_producto = np.array([p[0] for p in productos], dtype=np.int64)
+    nombres = pa.array([p[1] for p in productos], pa.string())
+
+    esquema = _esquema(pa)
+    archivo = f"{uuid.uuid4().hex}.arrow"
+    ruta = os.path.join(carpeta, archivo)
+    filas, ultimo_id = 0, desde_id
+    # Incidencias de la línea y de su cabecera, como en la vista 'facturas'
+    cursor = conn.execute("""
+        SELECT l.id, l.factura_id, l.producto_id, l.cantidad, l.precio_unitario, l.total_producto,
+               NULLIF(TRIM(COALESCE(c.incidencias, '') || ',' || COALESCE(l.incidencias, ''), ','), '')
+        FROM lineas_factura l JOIN cabeceras_factura c ON c.id = l.factura_id
+        WHERE l.id > ? ORDER BY l.id
+    """, (desde_id,))
+    with pa.OSFile(f"{ruta}.tmp", "wb") as destino, pa.ipc.new_file(destino, esquema) as escritor:
+        while True:
+            lote = cursor.fetchmany(FILAS_POR_LOTE)
+            if not lote:
+                break
+            valores = np.array([fila[:6] for fila in lote], dtype=float)  # None -> NaN
+            posicion_cabecera = pa.array(np.searchsorted(ids_cabecera, valores[:, 1].astype(np.int64)).astype(np.int32))
+            posicion_producto = pa.array(np.searchsorted(ids_producto, valores[:, 2].astype(np.int64)).astype(np.int32))
+            columnas = [
+                pa.array(valores[:, 0].astype(np.int64)),
+                pa.DictionaryArray.from_arrays(posicion_cabecera, numeros),
+                fechas.take(posicion_cabecera),
+                pa.DictionaryArray.from_arrays(posicion_producto, nombres),
+                *(pa.array(valores[:, i], from_pandas=True) for i in (3, 4, 5)),
+                pa.array(totales_factura[posicion_cabecera.to_numpy()], from_pandas=True),
+                pa.array([fila[6] for fila in lote], pa.string()),
+            ]
+            escritor.write_batch(pa.record_batch(columnas, schema=esquema))
+            filas += len(lote)
+            ultimo_id = int(lote[-1][0])
+    os.replace(f"{ruta}.tmp", ruta)
+    return {"archivo": archivo, "filas": filas, "ultimo_id": ultimo_id}
+
+def _fundir_segmentos(pa, carpeta, segmentos):
+    """Reescribe varios segmentos consecutivos como uno solo (con un diccionario por columna)."""
+    tabla = pa.concat_tables([_abrir_segmento(pa, carpeta, s["archivo"]) for s in segmentos])
+    tabla = tabla.unify_dictionaries().combine_chunks()
+    archivo = f"{uuid.uuid4().hex}.arrow"
+    ruta = os.path.join(carpeta, archivo)
+    with pa.OSFile(f"{ruta}.tmp", "wb") as destino, pa.ipc.new_file(destino, tabla.schema) as escritor:
+        escritor.write_table(tabla, max_chunksize=FILAS_POR_LOTE)
+    os.replace(f"{ruta}.tmp", ruta)
+    return {"archivo": archivo, "filas": tabla.num_rows, "ultimo_id": segmentos[-1]["ultimo_id"]}
+
+def _huella_ultima_linea(conn, linea_id):
+    """Datos de la última línea incluida en la instantánea, para comprobar que la BD es la misma."""
+    fila = conn.execute(
+        "SELECT factura_id, producto_id, cantidad FROM lineas_factura WHERE id = ?", (linea_id,)
+    ).fetchone()
+    return list(fila) if fila else None
+
+def _huella_bd(conn):
+    """
+    version_datos, id y datos de la última línea e id y número de la última cabecera: identifica el contenido
+    de la BD aunque se haya regenerado y su contador haya vuelto a la misma cifra.
+    """
+    ultimo_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM lineas_factura").fetchone()[0]
+    cabecera = conn.execute("SELECT id, numero_factura FROM cabeceras_factura ORDER BY id DESC LIMIT 1").fetchone()
+    return [db_manager.version_datos(conn), ultimo_id, _huella_ultima_linea(conn, ultimo_id),
+            list(cabecera) if cabecera else None]
+
+def _solo_altas(conn, meta, version):
+    """
+    True si desde la instantánea solo se han añadido facturas: los triggers de version_datos cuentan una
+    unidad por cabecera o línea insertada, así que cualquier baja o modificación hace que no cuadre.
+    """
+    if version < meta["version_datos"] or _huella_ultima_linea(conn, meta["ultimo_id"]) != meta["huella"]:
+        return False
+    lineas_nuevas = conn.execute("SELECT COUNT(*) FROM lineas_factura WHERE id > ?", (meta["ultimo_id"],)).fetchone()[0]
+    cabeceras_nuevas = conn.execute("SELECT COUNT(*) FROM cabeceras_factura WHERE id > ?", (meta["ultima_cabecera"],)).fetchone()[0]
+    return version - meta["version_datos"] == lineas_nuevas + cabeceras_nuevas
+
+def _borrar_huerfanos(carpeta, segmentos):
+    vigentes = {s["archivo"] for s in segmentos}
+    for nombre in os.listdir(carpeta):
+        if nombre.endswith(".arrow") and nombre not in vigentes:
+            try:
+                os.remove(os.path.join(carpeta, nombre))
+            except OSError:
+                pass  # en Windows no se puede borrar mientras un lector lo tenga mapeado; se borrará en otra ocasión
+
+def actualizar_instantanea(nombre_empresa):
+    """
+    Pone al día la instantánea de la empresa: nada si ya corresponde a la version_datos de la BD, un segmento
+    con las líneas nuevas si solo ha habido altas, o una reconstrucción completa en otro caso. Devuelve el
+    contenido de instantanea.json, o None si no hay pyarrow o la empresa no tiene BD. Un error al escribir la
+    instantánea se registra y no se propaga: la ingesta no depende de ella.
+    """
+    pa = _pyarrow()
+    db_path = db_manager.ruta_bd_empresa(nombre_empresa)
+    if pa is None or not os.path.exists(db_path):
+        return None
+    from metricas import medir
+
+    carpeta = carpeta_empresa(nombre_empresa)
+    try:
+        with _lock_empresa(nombre_empresa), db_manager.conexion(db_path) as conn:
+            meta = _leer_meta(carpeta)
+            conn.execute("BEGIN;")  # lectura consistente: la ingesta de otro proceso no se cuela entre consultas
+            try:
+                version = db_manager.version_datos(conn)
+                huella = _huella_bd(conn)
+                if meta is not None and meta["huella_bd"] == huella:
+                    return meta
+                os.makedirs(carpeta, exist_ok=True)
+                incremental = meta is not None and _solo_altas(conn, meta, version) and all(
+                    os.path.exists(os.path.join(carpeta, s["archivo"])) for s in meta["segmentos"])
+                segmentos = meta["segmentos"] if incremental else []
+                with medir("actualizar_instantanea", incremental=incremental) as medicion:
+                    nuevo = _escribir_segmento(pa, conn, carpeta, meta["ultimo_id"] if incremental else 0)
+                    if nuevo["filas"]:
+                        segmentos = segmentos + [nuevo]
+                        # Fusión escalonada: el último segmento se funde con el anterior mientras no sea mayor
+                        while len(segmentos) >= 2 and segmentos[-2]["filas"] <= segmentos[-1]["filas"]:
+                            segmentos = segmentos[:-2] + [_fundir_segmentos(pa, carpeta, segmentos[-2:])]
+                    medicion["filas"] = nuevo["filas"]
+                ultimo_id = segmentos[-1]["ultimo_id"] if segmentos else 0
+                meta = {
+                    "version_instantanea": VERSION_INSTANTANEA,
+                    "version_datos": version,
+                    "ultimo_id": ultimo_id,
+                    "ultima_cabecera": conn.execute("SELECT COALESCE(MAX(id), 0) FROM cabeceras_factura").fetchone()[0],
+                    "huella": _huella_ultima_linea(conn, ultimo_id),
+                    "huella_bd": huella,
+                    "filas": sum(s["filas"] for s in segmentos),
+                    "segmentos": segmentos,
+                }
+            finally:
+                conn.rollback()
+            _escribir_meta(carpeta, meta)
+            _borrar_huerfanos(carpeta, segmentos)
+    except Exception as e:
+        logging.warning(f"⚠️ No se pudo actualizar la instantánea de '{nombre_empresa}': {e}")
+        return None
+    logging.info(f"🧊 Instantánea de '{nombre_empresa}' {'actualizada' if incremental else 'regenerada'}: "
+                 f"+{nuevo['filas']} línea(s), {meta['filas']} en {len(segmentos)} segmento(s).")
+    return meta
+
+# --- Lectura ---
+def _abrir_segmento(pa, carpeta, archivo):
+    # Con memory_map la tabla apunta a las páginas del archivo: no se copia nada hasta convertir a pandas
+    return pa.ipc.open_file(pa.memory_map(os.path.join(carpeta, archivo), "r")).read_all()
+
+def _tabla_vigente(pa, nombre_empresa, conn):
+    """
+    Tabla Arrow (memory-map) de la instantánea de la empresa, o None si no existe o no corresponde a la BD
+    abierta en `conn` (se compara la huella de la BD, ver _huella_bd).
+    """
+    carpeta = carpeta_empresa(nombre_empresa)
+    meta = _leer_meta(carpeta)
+    if meta is None or (conn is not None and meta["huella_bd"] != _huella_bd(conn)):
+        return None
+    try:
+        tablas = [_abrir_segmento(pa, carpeta, s["archivo"]) for s in meta["segmentos"]]
+    except (OSError, pa.ArrowInvalid):
+        return None  # segmento sustituido por una fusión mientras se leía la lista: se lee de la BD
+    return pa.concat_tables(tablas) if tablas else _esquema(pa).empty_table()
+
+def leer_instantanea(nombre_empresa, columnas=None, conn=None):
+    """
+    Líneas de la empresa desde su instantánea, solo con las columnas pedidas: fechas como datetime64 y
+    número de factura y producto como categorías. Devuelve None si no hay pyarrow, no hay instantánea o
+    no corresponde a la BD abierta en `conn` (si se indica); en ese caso hay que leer de la BD.
+    """
+    pa = _pyarrow()
+    if pa is None:
+        return None
+    tabla = _tabla_vigente(pa, nombre_empresa, conn)
+    if tabla is None:
+        return None
+    if columnas:
+        tabla = tabla.select(list(columnas))
+    return tabla.to_pandas(date_as_object=False)
+
+def _filtrar(pa, tabla, desde=None, hasta=None, producto=None):
+    """Líneas con fecha entre `desde` y `hasta` (ISO, inclusive) y del producto indicado, sin pasar a pandas."""
+    import pyarrow.compute as pc
+
+    condiciones = []
+    if desde:
+        condiciones.append(pc.greater_equal(tabla["fecha_emision"], pa.scalar(date.fromisoformat(str(desde)), pa.date32())))
+    if hasta:
+        condiciones.append(pc.less_equal(tabla["fecha_emision"], pa.scalar(date.fromisoformat(str(hasta)), pa.date32())))
+    if producto:
+        # Cada segmento tiene su diccionario: se busca el producto en él y se comparan los índices
+        condiciones.append(pa.chunked_array([
+            pc.equal(trozo.indices, pc.index(trozo.dictionary, producto)).fill_null(False)
+            for trozo in tabla["nombre_producto"].chunks], pa.bool_()))
+    if not condiciones:
+        return tabla
+    mascara = condiciones[0]
+    for condicion in condiciones[1:]:
+        mascara = pc.and_(mascara, condicion)
+    return tabla.filter(mascara)
+
+def contar_lineas(nombre_empresa, conn, desde=None, hasta=None, producto=None):
+    """Número de líneas filtradas según la instantánea, o None si hay que contarlas en la BD."""
+    pa = _pyarrow()
+    tabla = _tabla_vigente(pa, nombre_empresa, conn) if pa is not None else None
+    if tabla is None:
+        return None
+    return _filtrar(pa, tabla.select(["fecha_emision", "nombre_producto"]), desde, hasta, producto).num_rows
+
+def consultar_lineas(nombre_empresa, conn, desde=None, hasta=None, producto=None, limite=100, desplazamiento=0):
+    """
+    Una página de líneas filtradas desde la instantánea, de la más reciente a la más antigua, con los mismos
+    tipos que consultas.consultar_lineas (fechas ISO y textos). Devuelve None si hay que leer de la BD.
+    """
+    pa = _pyarrow()
+    tabla = _tabla_vigente(pa, nombre_empresa, conn) if pa is not None else None
+    if tabla is None:
+        return None
+    tabla = _filtrar(pa, tabla, desde, hasta, producto)
+    pagina = tabla.sort_by([("fecha_emision", "descending"), ("id", "descending")]).slice(int(desplazamiento), int(limite))
+    # Solo la página se convierte a textos y a pandas
+    columnas = [
+        pa.chunked_array([trozo.dictionary_decode() for trozo in columna.chunks], pa.string())
+        if pa.types.is_dictionary(columna.type) else columna
+        for columna in pagina.columns
+    ]
+    columnas[pagina.schema.get_field_index("fecha_emision")] = pagina["fecha_emision"].cast(pa.string())
+    return pa.table(columnas, names=pagina.column_names).to_pandas()
+
+def eliminar_instantanea(nombre_empresa):
+    carpeta = carpeta_empresa(nombre_empresa)
+    if os.path.exists(os.path.join(carpeta, ARCHIVO_META)):
+        os.remove(os.path.join(carpeta, ARCHIVO_META))
+    if os.path.isdir(carpeta):
+        _borrar_huerfanos(carpeta, [])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Actualiza las instantáneas columnares de las BD de empresa.")
+    parser.add_argument("empresas", nargs="*", help="Empresas a actualizar (por defecto, todas).")
+    parser.add_argument("--reconstruir", action="store_true", help="Descarta las instantáneas y las genera de nuevo.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not disponible():
+        raise SystemExit("pyarrow no está instalado (o STOCKAI_INSTANTANEAS=0): las consultas leen de las BD de empresa.")
+    empresas = args.empresas or sorted(
+        os.path.splitext(f)[0] for f in os.listdir(db_manager.CARPETA_BASES_DATOS) if f.endswith(".db"))
+    for empresa in empresas:
+        if args.reconstruir:
+            eliminar_instantanea(empresa)
+        actualizar_instantanea(empresa)
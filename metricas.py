@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+
+# Configuración
+CARPETA_METRICAS = "data/metricas"   # un archivo JSONL por día: la app lee el de los trabajadores
+METRICAS_ACTIVAS = os.getenv("STOCKAI_METRICAS", "1") != "0"
+LIMITES_HISTOGRAMA = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Medición en curso en el contexto actual: anotar() le suma valores sin tener que pasarla como parámetro
+_medicion_actual = contextvars.ContextVar("medicion_actual", default=None)
+
+_lock = threading.Lock()
+_histogramas = {}  # etapa -> {"cubetas": [...], "suma": s, "cuenta": n, "errores": e}
+_contadores = {}   # (etapa, campo) -> total
+
+
+@contextmanager
+def medir(etapa, **valores):
+    """
+    Mide una etapa de la ingesta. Registra el tiempo de reloj, si terminó sin error y los valores anotados
+    durante la etapa (tokens, aciertos de caché, filas...), en el archivo de métricas del día y en los
+    contadores del proceso (exportar_prometheus). Devuelve un dict al que se pueden añadir valores.
+    """
+    medicion = {"etapa": etapa, **valores}
+    token = _medicion_actual.set(medicion)
+    inicio = time.perf_counter()
+    correcto = False
+    try:
+        yield medicion
+        correcto = True
+    finally:
+        _medicion_actual.reset(token)
+        medicion["segundos"] = round(time.perf_counter() - inicio, 6)
+        medicion["ok"] = correcto
+        _registrar(medicion)
+
+def anotar(**valores):
+    """Suma los valores numéricos (y fija los demás) en la medición en curso, si la hay."""
+    medicion = _medicion_actual.get()
+    if medicion is None:
+        return
+    for clave, valor in valores.items():
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            medicion[clave] = medicion.get(clave, 0) + valor
+        else:
+            medicion[clave] = valor
+
+def anotar_uso(respuesta):
+    """Anota los tokens de una respuesta de OpenAI en la medición en curso."""
+    uso = getattr(respuesta, "usage", None)
+    anotar(llamadas_ia=1)
+    if uso is not None:
+        anotar(tokens_entrada=uso.prompt_tokens or 0, tokens_salida=uso.completion_tokens or 0)
+
+
+def _registrar(medicion):
+    if not METRICAS_ACTIVAS:
+        return
+    etapa = medicion["etapa"]
+    with _lock:
+        histograma = _histogramas.setdefault(etapa, {"cubetas": [0] * len(LIMITES_HISTOGRAMA), "suma": 0.0, "cuenta": 0, "errores": 0})
+        for i, limite in enumerate(LIMITES_HISTOGRAMA):
+            if medicion["segundos"] <= limite:
+                histograma["cubetas"][i] += 1
+        histograma["suma"] += medicion["segundos"]
+        histograma["cuenta"] += 1
+        histograma["errores"] += not medicion["ok"]
+        for clave, valor in medicion.items():
+            if clave != "segundos" and isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                _contadores[(etapa, clave)] = _contadores.get((etapa, clave), 0) + valor
+
+        try:
+            os.makedirs(CARPETA_METRICAS, exist_ok=True)
+            ruta = os.path.join(CARPETA_METRICAS, f"metricas_{datetime.now():%Y%m%d}.jsonl")
+            with open(ruta, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"ts": time.time(), "pid": os.getpid(), **medicion}, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            logging.warning(f"⚠️ No se pudo escribir la métrica de '{etapa}': {e}")
+
+
+# --- Lectura (panel de administración) ---
+def leer_metricas(dias=7):
+    """Mediciones de los últimos `dias` días, como lista de dicts."""
+    registros = []
+    hoy = datetime.now().date()
+    for atras in range(dias - 1, -1, -1):
+        ruta = os.path.join(CARPETA_METRICAS, f"metricas_{hoy - timedelta(days=atras):%Y%m%d}.jsonl")
+        if not os.path.exists(ruta):
+            continue
+        with open(ruta, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    registros.append(json.loads(linea))
+                except ValueError:
+                    continue  # línea a medio escribir
+    return registros
+
+def _percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    indice = max(0, min(len(valores_ordenados) - 1, round(p / 100 * len(valores_ordenados) + 0.5) - 1))
+    return valores_ordenados[indice]
+
+def resumen_por_etapa(registros):
+    """Por etapa: ejecuciones, errores, p50, p95 y total de segundos, y la suma de cada valor anotado."""
+    por_etapa = {}
+    for registro in registros:
+        por_etapa.setdefault(registro["etapa"], []).append(registro)
+    resumen = []
+    for etapa, filas in sorted(por_etapa.items()):
+        tiempos = sorted(f["segundos"] for f in filas)
+        fila = {
+            "etapa": etapa,
+            "ejecuciones": len(filas),
+            "errores": sum(not f.get("ok", True) for f in filas),
+            "p50_s": round(_percentil(tiempos, 50), 3),
+            "p95_s": round(_percentil(tiempos, 95), 3),
+            "total_s": round(sum(tiempos), 1),
+        }
+        for f in filas:
+            for clave, valor in f.items():
+                if clave not in ("ts", "pid", "segundos") and isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                    fila[clave] = fila.get(clave, 0) + valor
+        resumen.append(fila)
+    return resumen
+
+
+# --- Exportación en formato Prometheus ---
+def _etiqueta(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"')
+
+def exportar_prometheus():
+    """Métricas de este proceso en el formato de texto de Prometheus."""
+    lineas = [
+        "# HELP stockai_etapa_segundos Duración de las etapas de la ingesta de facturas.",
+        "# TYPE stockai_etapa_segundos histogram",
+    ]
+    with _lock:
+        histogramas = {etapa: dict(h, cubetas=list(h["cubetas"])) for etapa, h in _histogramas.items()}
+        contadores = dict(_contadores)
+    for etapa, h in sorted(histogramas.items()):
+        for limite, cuenta in zip(LIMITES_HISTOGRAMA, h["cubetas"]):
+            lineas.append(f'stockai_etapa_segundos_bucket{{etapa="{_etiqueta(etapa)}",le="{limite}"}} {cuenta}')
+        lineas.append(f'stockai_etapa_segundos_bucket{{etapa="{_etiqueta(etapa)}",le="+Inf"}} {h["cuenta"]}')
+        lineas.append(f'stockai_etapa_segundos_sum{{etapa="{_etiqueta(etapa)}"}} {h["suma"]}')
+        lineas.append(f'stockai_etapa_segundos_count{{etapa="{_etiqueta(etapa)}"}} {h["cuenta"]}')
+    lineas += ["# HELP stockai_etapa_errores_total Etapas terminadas con error.", "# TYPE stockai_etapa_errores_total counter"]
+    for etapa, h in sorted(histogramas.items()):
+        lineas.append(f'stockai_etapa_errores_total{{etapa="{_etiqueta(etapa)}"}} {h["errores"]}')
+    for campo in sorted({campo for _, campo in contadores}):
+        lineas += [f"# HELP stockai_{campo}_total Suma de '{campo}' anotado en las etapas.", f"# TYPE stockai_{campo}_total counter"]
+        for (etapa, c), total in sorted(contadores.items()):
+            if c == campo:
+                lineas.append(f'stockai_{campo}_total{{etapa="{_etiqueta(etapa)}"}} {total}')
+    return "\n".join(lineas) + "\n"
+
+def iniciar_servidor_metricas(puerto, host="0.0.0.0"):
+    """Sirve exportar_prometheus() en http://host:puerto/metrics desde un hilo en segundo plano."""
+    # http.server solo se importa aquí: el resto de procesos (la app, los scripts) no paga su importación
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _ManejadorMetricas(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            cuerpo = exportar_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, formato, *args):
+            pass  # sin una línea de log por cada scrape
+
+    servidor = ThreadingHTTPServer((host, puerto), _ManejadorMetricas)
+    threading.Thread(target=servidor.serve_forever, name="servidor-metricas", daemon=True).start()
+    logging.info(f"📈 Métricas en formato Prometheus en http://{host}:{puerto}/metrics")
+    return servidor
@@ -0,0 +1,82 @@
+import re
+import logging
+
+# Tolerancia al comparar importes (cantidad × precio con el total de la línea, suma de líneas con el total)
+TOLERANCIA_ABSOLUTA = 0.05   # euros de diferencia admitidos por redondeos
+TOLERANCIA_RELATIVA = 0.01
+
+# Incidencias que se guardan con cada cabecera y línea de factura (columna 'incidencias', separadas por comas)
+INCIDENCIA_FECHA = "fecha"        # fecha de emisión no reconocida
+INCIDENCIA_TOTAL = "total"        # total de la factura no numérico
+INCIDENCIA_CANTIDAD = "cantidad"  # cantidad no numérica
+INCIDENCIA_PRECIO = "precio"      # precio unitario o total de la línea no numéricos
+INCIDENCIA_IMPORTE = "importe"    # cantidad × precio no cuadra con el total de la línea
+
+
+def limpiar_numero(valor, por_defecto=0.0):
+    """Convierte strings como '60.000 unidades', '12,5', '1.000,25' a float. Si no puede, devuelve `por_defecto`."""
+    if not isinstance(valor, str):
+        try:
+            return float(valor)
+        except (ValueError, TypeError):
+            logging.warning(f"No se pudo convertir a float: {valor}. Devolviendo {por_defecto}")
+            return por_defecto
+
+    limpio = re.sub(r"[^\d,\.]", "", valor)
+
+    if "," in limpio and "." in limpio:
+        if limpio.rfind(',') > limpio.rfind('.'):
+            limpio = limpio.replace(".", "").replace(",", ".")
+        else:
+            limpio = limpio.replace(",", "")
+    elif "," in limpio:
+        limpio = limpio.replace(",", ".")
+    elif limpio.count(".") > 1:
+        limpio = limpio.replace(".", "")
+
+    try:
+        return float(limpio)
+    except ValueError:
+        logging.warning(f"No se pudo limpiar y convertir a float: '{valor}' -> '{limpio}'. Devolviendo {por_defecto}")
+        return por_defecto
+
+def limpiar_numeros(valores):
+    """
+    Versión vectorizada de limpiar_numero para conversiones masivas (migraciones, importaciones): recibe una
+    Series o un iterable y devuelve una Series de float con las mismas reglas, y NaN donde limpiar_numero
+    devolvería `por_defecto`. Los valores que ya son números no pasan por las expresiones regulares.
+    """
+    import pandas as pd
+
+    serie = valores if isinstance(valores, pd.Series) else pd.Series(list(valores), dtype=object)
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float)
+    es_texto = serie.map(type).eq(str)
+    resultado = pd.to_numeric(serie.where(~es_texto), errors="coerce").astype(float)
+    if not es_texto.any():
+        return resultado
+
+    limpio = serie[es_texto].str.replace(r"[^\d,.]", "", regex=True)
+    ultima_coma, ultimo_punto = limpio.str.rfind(","), limpio.str.rfind(".")
+    coma_decimal = (ultima_coma > ultimo_punto)                        # '1.000,25' y '12,5'
+    coma_miles = (ultima_coma >= 0) & (ultimo_punto > ultima_coma)     # '1,000.25'
+    punto_miles = (ultima_coma < 0) & (limpio.str.count(r"\.") > 1)    # '1.000.000'
+    limpio = limpio.mask(coma_decimal, limpio.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    limpio = limpio.mask(coma_miles, limpio.str.replace(",", "", regex=False))
+    limpio = limpio.mask(punto_miles, limpio.str.replace(".", "", regex=False))
+    resultado[es_texto] = pd.to_numeric(limpio, errors="coerce")
+    return resultado
+
+def casi_igual(a, b):
+    return abs(a - b) <= max(TOLERANCIA_ABSOLUTA, TOLERANCIA_RELATIVA * abs(b))
+
+def incidencias_linea(cantidad, precio_unitario, total_producto):
+    """Códigos de incidencia de una línea ya convertida a números (None = valor no numérico), o None si es válida."""
+    incidencias = []
+    if cantidad is None:
+        incidencias.append(INCIDENCIA_CANTIDAD)
+    if precio_unitario is None or total_producto is None:
+        incidencias.append(INCIDENCIA_PRECIO)
+    elif cantidad is not None and not casi_igual(cantidad * precio_unitario, total_producto):
+        incidencias.append(INCIDENCIA_IMPORTE)
+    return ",".join(incidencias) or None
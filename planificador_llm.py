@@ -0,0 +1,207 @@
+import os
+import time
+import heapq
+import random
+import logging
+import itertools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+from prioridades import PRIORIDAD_LOTE
+from metricas import anotar, anotar_uso
+
+# Configuración (límites de la cuenta de OpenAI; ajustables por entorno)
+LIMITE_PETICIONES_MINUTO = int(os.getenv("STOCKAI_OPENAI_RPM", "500"))
+LIMITE_TOKENS_MINUTO = int(os.getenv("STOCKAI_OPENAI_TPM", "30000"))
+MAX_REINTENTOS = int(os.getenv("STOCKAI_OPENAI_MAX_REINTENTOS", "5"))
+ESPERA_BASE_SEGUNDOS = 1.0
+ESPERA_MAXIMA_SEGUNDOS = 60.0
+TIMEOUT_PETICION_SEGUNDOS = float(os.getenv("STOCKAI_OPENAI_TIMEOUT", "120"))
+TOKENS_SALIDA_ESTIMADOS = 500  # si la petición no indica max_tokens
+
+_VENTANA_SEGUNDOS = 60.0
+_CODIGOS_REINTENTABLES = {408, 409, 429, 500, 502, 503, 504}
+
+# Prioridad de las llamadas hechas desde el contexto actual (ver con_prioridad)
+prioridad_llm = contextvars.ContextVar("prioridad_llm", default=PRIORIDAD_LOTE)
+
+@contextmanager
+def con_prioridad(prioridad):
+    """Las llamadas a la IA hechas dentro del bloque usan esta prioridad (PRIORIDAD_INTERACTIVA o PRIORIDAD_LOTE)."""
+    token = prioridad_llm.set(prioridad)
+    try:
+        yield
+    finally:
+        prioridad_llm.reset(token)
+
+
+try:
+    import tiktoken
+    _codificador = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken es opcional: sin él se estima por caracteres
+    _codificador = None
+
+def estimar_tokens(mensajes):
+    """Estimación de los tokens de entrada de una lista de mensajes de chat."""
+    texto = "".join(m.get("content") or "" for m in mensajes)
+    if _codificador is not None:
+        return len(_codificador.encode(texto)) + 4 * len(mensajes)
+    return len(texto) // 4 + 4 * len(mensajes)
+
+
+def _es_reintentable(error):
+    import openai
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if getattr(error, "code", None) == "insufficient_quota":
+        return False  # sin saldo: reintentar no sirve
+    return getattr(error, "status_code", None) in _CODIGOS_REINTENTABLES
+
+def _espera_sugerida(error):
+    """Segundos indicados por el servidor en la cabecera Retry-After, si los hay."""
+    respuesta = getattr(error, "response", None)
+    valor = respuesta.headers.get("retry-after") if respuesta is not None else None
+    try:
+        return float(valor) if valor is not None else None
+    except ValueError:
+        return None
+
+
+class PlanificadorLLM:
+    """
+    Punto único de salida de las llamadas a OpenAI. Respeta un presupuesto de peticiones y tokens por minuto
+    (ventana deslizante), atiende antes las peticiones interactivas que las de lote y reintenta los errores
+    transitorios (429, timeouts, 5xx) con backoff exponencial con jitter.
+    """
+
+    def __init__(self, cliente=None, limite_peticiones=LIMITE_PETICIONES_MINUTO,
+                 limite_tokens=LIMITE_TOKENS_MINUTO, max_reintentos=MAX_REINTENTOS):
+        self._cliente = cliente
+        self.limite_peticiones = limite_peticiones
+        self.limite_tokens = limite_tokens
+        self.max_reintentos = max_reintentos
+        self._ventana = deque()  # (instante, tokens reservados)
+        self._tokens_en_ventana = 0
+        self._esperando = []      # heap de (prioridad, turno)
+        self._turnos = itertools.count()
+        self._condicion = threading.Condition()
+        self.peticiones = 0
+        self.reintentos = 0
+        self.tokens_entrada = 0
+        self.tokens_salida = 0
+
+    @property
+    def cliente(self):
+        if self._cliente is None:
+            from openai import OpenAI
+            self._cliente = OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url=os.getenv("OPENAI_BASE_URL") or None,  # p. ej. un servidor local compatible
+                max_retries=0,  # los reintentos los gestiona el planificador
+                timeout=TIMEOUT_PETICION_SEGUNDOS,
+            )
+        return self._cliente
+
+    def _purgar_ventana(self, ahora):
+        while self._ventana and ahora - self._ventana[0][0] >= _VENTANA_SEGUNDOS:
+            self._tokens_en_ventana -= self._ventana.popleft()[1]
+
+    def _espera_necesaria(self, tokens, ahora):
+        """Segundos hasta que haya presupuesto para una petición de `tokens` tokens (0 si ya lo hay)."""
+        self._purgar_ventana(ahora)
+        espera = 0.0
+        if len(self._ventana) >= self.limite_peticiones:
+            espera = self._ventana[0][0] + _VENTANA_SEGUNDOS - ahora
+        if self._ventana and self._tokens_en_ventana + tokens > self.limite_tokens:
+            # Esperar a que caduquen suficientes entradas (una petición mayor que el límite pasa con la ventana vacía)
+            liberados = 0
+            for instante, reservados in self._ventana:
+                liberados += reservados
+                if self._tokens_en_ventana - liberados + tokens <= self.limite_tokens:
+                    break
+            espera = max(espera, instante + _VENTANA_SEGUNDOS - ahora)
+        return max(espera, 0.0)
+
+    def _reservar(self, tokens, prioridad):
+        """Bloquea hasta que sea el turno de esta petición y haya presupuesto; entonces lo consume."""
+        turno = (prioridad, next(self._turnos))
+        with self._condicion:
+            heapq.heappush(self._esperando, turno)
+            try:
+                while True:
+                    ahora = time.monotonic()
+                    if self._esperando[0] == turno:
+                        espera = self._espera_necesaria(tokens, ahora)
+                        if espera == 0:
+                            self._ventana.append((ahora, tokens))
+                            self._tokens_en_ventana += tokens
+                            return
+                        self._condicion.wait(espera)
+                    else:
+                        self._condicion.wait(1.0)
+            finally:
+                self._esperando.remove(turno)
+                heapq.heapify(self._esperando)
+                self._condicion.notify_all()
+
+    def completar(self, prioridad=None, **parametros):
+        """
+        Equivalente a client.chat.completions.create(**parametros), con control de ritmo y reintentos.
+        `prioridad` por defecto es la del contexto actual (con_prioridad).
+        """
+        prioridad = prioridad_llm.get() if prioridad is None else prioridad
+        tokens = estimar_tokens(parametros.get("messages", [])) + parametros.get("max_tokens", TOKENS_SALIDA_ESTIMADOS)
+
+        for intento in range(self.max_reintentos + 1):
+            self._reservar(tokens, prioridad)
+            try:
+                respuesta = self.cliente.chat.completions.create(**parametros)
+            except Exception as e:
+                if intento >= self.max_reintentos or not _es_reintentable(e):
+                    raise
+                espera = _espera_sugerida(e)
+                if espera is None:
+                    espera = min(ESPERA_MAXIMA_SEGUNDOS, ESPERA_BASE_SEGUNDOS * 2 ** intento)
+                    espera = random.uniform(espera / 2, espera)  # jitter
+                with self._condicion:
+                    self.reintentos += 1
+                anotar(reintentos_ia=1)
+                logging.warning(f"⏳ Error transitorio de OpenAI ({e.__class__.__name__}); reintento {intento + 1}/{self.max_reintentos} en {espera:.1f}s.")
+                time.sleep(espera)
+                continue
+
+            uso = getattr(respuesta, "usage", None)
+            with self._condicion:
+                self.peticiones += 1
+                if uso is not None:
+                    self.tokens_entrada += uso.prompt_tokens or 0
+                    self.tokens_salida += uso.completion_tokens or 0
+            # Tokens atribuidos a la etapa que hizo la llamada (metricas.medir)
+            anotar_uso(respuesta)
+            return respuesta
+
+    def estadisticas(self):
+        return {
+            "peticiones": self.peticiones,
+            "reintentos": self.reintentos,
+            "tokens_entrada": self.tokens_entrada,
+            "tokens_salida": self.tokens_salida,
+        }
+
+
+_planificador = None
+_planificador_lock = threading.Lock()
+
+def obtener_planificador():
+    """Devuelve el planificador compartido del proceso (el cliente de OpenAI se crea en la primera llamada)."""
+    global _planificador
+    with _planificador_lock:
+        if _planificador is None:
+            _planificador = PlanificadorLLM()
+        return _planificador
+
+def configurar_cliente(cliente):
+    """Sustituye el cliente de OpenAI del planificador compartido (p. ej. por uno apuntando a un servidor local)."""
+    obtener_planificador()._cliente = cliente
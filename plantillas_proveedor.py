@@ -0,0 +1,294 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+from db_manager import fecha_a_iso
+from normalizacion_datos import limpiar_numero, casi_igual
+
+# Configuración
+CARPETA_PLANTILLAS = "data/plantillas"
+PLANTILLAS_ACTIVAS = os.getenv("STOCKAI_PLANTILLAS", "1") != "0"  # 0 = extraer siempre con la IA
+LINEAS_FIRMA = 3             # líneas fijas del membrete que identifican el diseño de un proveedor
+TIPOS_IVA = (0.0, 0.21, 0.10, 0.04)  # total_factura puede ser la base o la base con IVA
+
+CAMPOS_CABECERA = ("nombre_empresa", "numero_factura", "fecha_emision", "total_factura")
+
+# Expresiones de los valores que captura una plantilla
+_NUMERO = r"\d[\d.,]*"
+_FECHA = r"\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4}"
+_VALOR_CAMPO = {
+    "nombre_empresa": r"(?P<valor>[^\n]*?\S)[ \t]*$",
+    "numero_factura": r"(?P<valor>[^\s:]+)",
+    "fecha_emision": r"(?P<valor>" + _FECHA + r")",
+    "total_factura": r"(?P<valor>" + _NUMERO + r")",
+}
+
+# Diseños de tabla de productos que se prueban al aprender una plantilla: orden de columnas y separación
+# (una línea por producto, o cada celda en su línea, que es como PyMuPDF suele devolver las tablas)
+_COLUMNAS_PRODUCTO = (
+    ("nombre", "cantidad", "precio_unitario", "total_por_producto"),
+    ("cantidad", "nombre", "precio_unitario", "total_por_producto"),
+    ("nombre", "precio_unitario", "cantidad", "total_por_producto"),
+)
+_SEPARADORES_CELDA = (r"[ \t]+", r"[ \t]*\n[ \t]*")
+_SUFIJO_NUMERO = r"(?:[ \t]*(?:€|EUR|\$|[A-Za-z.]{1,10}))?"
+_PATRON_CELDA = {
+    "nombre": r"(?P<nombre>[^\n]*?[A-Za-zÀ-ÿ][^\n]*?)",
+    "cantidad": r"(?P<cantidad>" + _NUMERO + r")" + _SUFIJO_NUMERO,
+    "precio_unitario": r"(?P<precio_unitario>" + _NUMERO + r")" + _SUFIJO_NUMERO,
+    "total_por_producto": r"(?P<total_por_producto>" + _NUMERO + r")" + _SUFIJO_NUMERO,
+}
+
+
+def validar_factura(datos):
+    """
+    Comprueba la coherencia de una factura extraída: cabecera completa, cantidad × precio = total en cada línea
+    y suma de líneas = total_factura (con o sin IVA). Devuelve (True, "") o (False, motivo).
+    """
+    if not isinstance(datos, dict):
+        return False, "no es un objeto"
+    for campo in ("nombre_empresa", "numero_factura"):
+        if not str(datos.get(campo) or "").strip():
+            return False, f"falta '{campo}'"
+    if fecha_a_iso(str(datos.get("fecha_emision") or "")) is None:
+        return False, f"fecha no reconocida: {datos.get('fecha_emision')!r}"
+    productos = datos.get("productos") or []
+    if not productos:
+        return False, "sin productos"
+
+    suma = 0.0
+    for producto in productos:
+        cantidad = limpiar_numero(producto.get("cantidad", 0))
+        precio = limpiar_numero(producto.get("precio_unitario", 0))
+        total = limpiar_numero(producto.get("total_por_producto", 0))
+        if cantidad <= 0 or not casi_igual(cantidad * precio, total):
+            return False, f"línea incoherente: {producto.get('nombre')!r} ({cantidad} × {precio} ≠ {total})"
+        suma += total
+
+    total_factura = limpiar_numero(datos.get("total_factura", 0))
+    if not any(casi_igual(suma * (1 + iva), total_factura) for iva in TIPOS_IVA):
+        return False, f"la suma de líneas ({suma:.2f}) no cuadra con total_factura ({total_factura:.2f})"
+    return True, ""
+
+
+def _lineas(texto):
+    return [linea.strip() for linea in texto.splitlines()]
+
+def _coincide_valor(campo, encontrado, esperado):
+    if campo == "total_factura":
+        return casi_igual(limpiar_numero(encontrado), limpiar_numero(esperado))
+    if campo == "fecha_emision":
+        return fecha_a_iso(encontrado) is not None and fecha_a_iso(encontrado) == fecha_a_iso(str(esperado))
+    return encontrado.strip() == str(esperado).strip()
+
+def _aprender_campo(texto, campo, esperado):
+    """
+    Busca en el texto la línea donde aparece el valor del campo y devuelve una regex anclada en la etiqueta
+    que lo precede ('Nº factura:', 'Total'...) o, si el valor va solo en su línea, en la línea anterior.
+    """
+    lineas = _lineas(texto)
+    busqueda = re.escape(str(esperado).strip()) if campo == "nombre_empresa" else _VALOR_CAMPO[campo].replace(r"[ \t]*$", "")
+    # El total suele ir al final; el resto de campos, en la cabecera
+    orden = range(len(lineas) - 1, -1, -1) if campo == "total_factura" else range(len(lineas))
+    for i in orden:
+        for m in re.finditer(busqueda, lineas[i]):
+            if not _coincide_valor(campo, m.group(0), esperado):
+                continue
+            prefijo = lineas[i][:m.start()].strip()
+            # De la etiqueta se descarta lo que lleve cifras (otro valor de la misma línea, p. ej. el número de factura)
+            etiqueta = re.split(r"\S*\d\S*", prefijo)[-1].strip()
+            if etiqueta:
+                inicio = r"^[ \t]*" if etiqueta == prefijo else ""
+                patron = inicio + re.escape(etiqueta) + r"[ \t]*" + _VALOR_CAMPO[campo]
+            elif prefijo:
+                continue
+            else:
+                anteriores = [l for l in lineas[:i] if l]
+                if not anteriores or m.start() > 0:
+                    continue
+                patron = r"^[ \t]*" + re.escape(anteriores[-1]) + r"[ \t]*\n(?:[ \t]*\n)*[ \t]*" + _VALOR_CAMPO[campo]
+            coincidencia = re.search(patron, texto, re.MULTILINE)
+            if coincidencia and _coincide_valor(campo, coincidencia.group("valor"), esperado):
+                return patron
+    return None
+
+def _extraer_productos(patron, texto):
+    return [
+        {clave: m.group(clave).strip() for clave in _PATRON_CELDA}
+        for m in re.finditer(patron, texto, re.MULTILINE)
+    ]
+
+def _mismos_productos(encontrados, esperados):
+    if len(encontrados) != len(esperados):
+        return False
+    for encontrado, esperado in zip(encontrados, esperados):
+        if encontrado["nombre"].lower() != str(esperado.get("nombre", "")).strip().lower():
+            return False
+        for clave in ("cantidad", "precio_unitario", "total_por_producto"):
+            if not casi_igual(limpiar_numero(encontrado[clave]), limpiar_numero(esperado.get(clave, 0))):
+                return False
+    return True
+
+def _aprender_productos(texto, productos):
+    """Prueba los diseños de tabla conocidos y devuelve la regex que reproduce exactamente los productos."""
+    for columnas in _COLUMNAS_PRODUCTO:
+        for separador in _SEPARADORES_CELDA:
+            patron = r"^[ \t]*" + separador.join(_PATRON_CELDA[c] for c in columnas) + r"[ \t]*$"
+            if _mismos_productos(_extraer_productos(patron, texto), productos):
+                return patron
+    return None
+
+def _firma(texto, datos):
+    """
+    Primeras líneas fijas del documento (membrete del proveedor): sin cifras y sin los valores propios
+    de esta factura (cliente, productos), para que se repitan en todas las facturas del mismo diseño.
+    """
+    variables = [str(datos.get("nombre_empresa") or "").lower()]
+    variables += [str(p.get("nombre") or "").lower() for p in datos.get("productos") or []]
+    firma = []
+    for linea in _lineas(texto):
+        if len(linea) < 4 or re.search(r"\d", linea):
+            continue
+        minusculas = linea.lower()
+        if any(v and (v in minusculas or minusculas in v) for v in variables):
+            continue
+        if linea not in firma:
+            firma.append(linea)
+        if len(firma) == LINEAS_FIRMA:
+            break
+    return firma
+
+
+class AlmacenPlantillas:
+    """
+    Plantillas de extracción por diseño de factura de proveedor, guardadas como JSON en `carpeta`.
+    Cada plantilla tiene una firma (líneas literales del membrete), una regex por campo de cabecera y una regex
+    de línea de producto. Las facturas de un diseño conocido se extraen localmente, sin llamar a la IA; el
+    resultado solo se acepta si pasa validar_factura. Las plantillas se aprenden de extracciones de la IA válidas.
+    """
+
+    def __init__(self, carpeta=CARPETA_PLANTILLAS):
+        self.carpeta = carpeta
+        self._lock = threading.Lock()
+        self._plantillas = {}
+        self.aciertos = 0
+        self.fallos = 0
+        os.makedirs(carpeta, exist_ok=True)
+        for nombre in sorted(os.listdir(carpeta)):
+            if not nombre.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(carpeta, nombre), encoding="utf-8") as f:
+                    plantilla = json.load(f)
+                self._plantillas[plantilla["id"]] = self._compilar(plantilla)
+            except (OSError, ValueError, KeyError, re.error) as e:
+                logging.warning(f"⚠️ Plantilla de proveedor '{nombre}' ignorada: {e}")
+        if self._plantillas:
+            logging.info(f"🧩 {len(self._plantillas)} plantilla(s) de proveedor cargadas.")
+
+    @staticmethod
+    def _compilar(plantilla):
+        plantilla["_campos"] = {c: re.compile(p, re.MULTILINE) for c, p in plantilla["campos"].items()}
+        plantilla["_productos"] = re.compile(plantilla["productos"], re.MULTILINE)
+        return plantilla
+
+    @staticmethod
+    def _aplicar(plantilla, texto):
+        datos = {}
+        for campo, patron in plantilla["_campos"].items():
+            m = patron.search(texto)
+            if m is None:
+                return None
+            datos[campo] = m.group("valor").strip()
+        datos["productos"] = [
+            {clave: m.group(clave).strip() for clave in _PATRON_CELDA}
+            for m in plantilla["_productos"].finditer(texto)
+        ]
+        return datos
+
+    def extraer(self, texto):
+        """Devuelve los datos de la factura si una plantilla la reconoce y el resultado es válido; si no, None."""
+        if not PLANTILLAS_ACTIVAS:
+            return None
+        lineas = set(_lineas(texto))
+        with self._lock:
+            candidatas = [p for p in self._plantillas.values() if all(l in lineas for l in p["firma"])]
+        for plantilla in candidatas:
+            datos = self._aplicar(plantilla, texto)
+            valida, motivo = validar_factura(datos) if datos is not None else (False, "campos no encontrados")
+            if valida:
+                with self._lock:
+                    self.aciertos += 1
+                logging.info(f"🧩 Factura extraída con la plantilla '{plantilla['proveedor']}', sin llamar a OpenAI.")
+                return datos
+            logging.info(f"🧩 La plantilla '{plantilla['proveedor']}' no sirve para esta factura ({motivo}).")
+        with self._lock:
+            self.fallos += 1
+        return None
+
+    def aprender(self, texto, datos):
+        """
+        Intenta crear una plantilla a partir de una extracción válida de la IA. Solo se guarda si, aplicada al
+        mismo texto, reproduce los datos. Devuelve la plantilla o None.
+        """
+        if not PLANTILLAS_ACTIVAS or not validar_factura(datos)[0]:
+            return None
+        firma = _firma(texto, datos)
+        if len(firma) < 2:
+            return None
+        campos = {}
+        for campo in CAMPOS_CABECERA:
+            patron = _aprender_campo(texto, campo, datos.get(campo))
+            if patron is None:
+                return None
+            campos[campo] = patron
+        productos = _aprender_productos(texto, datos["productos"])
+        if productos is None:
+            return None
+
+        plantilla = self._compilar({
+            "id": hashlib.sha256("\n".join(firma).encode("utf-8")).hexdigest()[:16],
+            "proveedor": firma[0],
+            "firma": firma,
+            "campos": campos,
+            "productos": productos,
+            "creada": datetime.now().isoformat(timespec="seconds"),
+        })
+        aplicado = self._aplicar(plantilla, texto)
+        if aplicado is None or not _mismos_productos(aplicado["productos"], datos["productos"]):
+            return None
+
+        ruta = os.path.join(self.carpeta, f"{plantilla['id']}.json")
+        with self._lock:
+            with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({k: v for k, v in plantilla.items() if not k.startswith("_")}, f, ensure_ascii=False, indent=2)
+            os.replace(ruta + ".tmp", ruta)
+            self._plantillas[plantilla["id"]] = plantilla
+        logging.info(f"🧩 Nueva plantilla de proveedor aprendida: '{plantilla['proveedor']}'.")
+        return plantilla
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "plantillas": len(self._plantillas),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_acierto": self.aciertos / total if total else 0.0,
+            }
+
+
+_almacen = None
+_almacen_lock = threading.Lock()
+
+def obtener_plantillas():
+    """Devuelve el almacén de plantillas compartido del proceso (se carga en el primer uso)."""
+    global _almacen
+    with _almacen_lock:
+        if _almacen is None:
+            _almacen = AlmacenPlantillas()
+        return _almacen
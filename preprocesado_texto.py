@@ -0,0 +1,159 @@
+import os
+import re
+import math
+import logging
+
+from planificador_llm import estimar_tokens
+from extraccion_pdf import SEPARADOR_PAGINA
+
+# Configuración
+MAX_TOKENS_FRAGMENTO = int(os.getenv("STOCKAI_MAX_TOKENS_FRAGMENTO", "6000"))
+LINEAS_ZONA_CABECERA_PIE = 8    # líneas al principio y al final de cada página donde se buscan cabeceras y pies
+FRACCION_PAGINAS_REPETIDA = 0.5  # una línea es cabecera/pie si se repite en al menos esta fracción de páginas
+
+_NUMERO = re.compile(r"\d[\d.,]*")
+_NUMERO_PAGINA = re.compile(r"^(p[áa]g(ina)?\.?\s*)?\d+\s*(de|/)\s*\d+$|^p[áa]g(ina)?\.?\s*\d+$", re.IGNORECASE)
+_PALABRAS_TABLA = ("descripci", "concepto", "producto", "artículo", "articulo", "referencia",
+                   "cantidad", "cant.", "uds", "unidades", "precio", "importe", "total")
+_INICIO_TABLA = "--- LÍNEAS DE PRODUCTO ---"
+_FIN_TABLA = "--- FIN DE LÍNEAS DE PRODUCTO ---"
+_INICIO_TOTALES = re.compile(r"^(sub\s*total|total|base imponible|importe total|suma|i\.?v\.?a\.?\b)", re.IGNORECASE)
+
+
+def _contar_tokens(texto):
+    return estimar_tokens([{"content": texto}])
+
+def _limpiar_linea(linea):
+    return re.sub(r"[ \t\u00a0]+", " ", linea).strip()
+
+def _clave_repeticion(linea):
+    # Los números de página cambian en cada hoja; el resto de una cabecera o pie se repite literalmente
+    return "#pagina#" if _NUMERO_PAGINA.match(linea) else linea.lower()
+
+def _parece_linea_producto(linea):
+    return len(_NUMERO.findall(linea)) >= 3
+
+def quitar_cabeceras_pies(paginas):
+    """
+    Recibe las líneas limpias de cada página y quita las cabeceras y pies repetidos: líneas de la zona
+    superior o inferior de la página que aparecen en muchas páginas. Se conserva su primera aparición
+    (la cabecera de la primera página lleva el proveedor, el cliente y el número de factura).
+    Las líneas con aspecto de producto nunca se quitan, aunque se repitan.
+    """
+    if len(paginas) < 2:
+        return paginas
+
+    def zona(lineas):
+        if len(lineas) <= 2 * LINEAS_ZONA_CABECERA_PIE:
+            return set(range(len(lineas)))
+        return set(range(LINEAS_ZONA_CABECERA_PIE)) | set(range(len(lineas) - LINEAS_ZONA_CABECERA_PIE, len(lineas)))
+
+    apariciones = {}
+    for lineas in paginas:
+        for clave in {_clave_repeticion(lineas[i]) for i in zona(lineas)}:
+            apariciones[clave] = apariciones.get(clave, 0) + 1
+    minimo = max(2, math.ceil(FRACCION_PAGINAS_REPETIDA * len(paginas)))
+    repetidas = {clave for clave, n in apariciones.items() if n >= minimo}
+
+    vistas = set()
+    resultado = []
+    for lineas in paginas:
+        indices_zona = zona(lineas)
+        conservadas = []
+        for i, linea in enumerate(lineas):
+            clave = _clave_repeticion(linea)
+            if i in indices_zona and clave in repetidas and not _parece_linea_producto(linea):
+                if clave in vistas or clave == "#pagina#":
+                    continue
+                vistas.add(clave)
+            conservadas.append(linea)
+        resultado.append(conservadas)
+    return resultado
+
+def localizar_tabla(lineas):
+    """
+    Devuelve (inicio, fin) de la zona de líneas de producto: desde la fila de títulos de la tabla
+    (la primera línea con varias palabras como 'Descripción', 'Cantidad', 'Precio'...) hasta la primera línea
+    de totales posterior a algún producto. (None, None) si no se reconoce ninguna tabla.
+    """
+    inicio = None
+    for i, linea in enumerate(lineas):
+        minusculas = linea.lower()
+        if sum(palabra in minusculas for palabra in _PALABRAS_TABLA) >= 2 and not _parece_linea_producto(linea):
+            inicio = i
+            break
+    if inicio is None:
+        return None, None
+
+    fin = len(lineas)
+    hay_productos = False
+    for i in range(inicio + 1, len(lineas)):
+        if _INICIO_TOTALES.match(lineas[i]) and hay_productos:
+            fin = i
+            break
+        hay_productos = hay_productos or bool(_NUMERO.search(lineas[i]))
+    return inicio, fin
+
+def _partir_lineas(lineas, max_tokens):
+    """Agrupa las líneas en bloques consecutivos de como mucho `max_tokens` tokens estimados."""
+    bloques, actual, tokens_actual = [], [], 0
+    for linea in lineas:
+        tokens = _contar_tokens(linea)
+        if actual and tokens_actual + tokens > max_tokens:
+            bloques.append(actual)
+            actual, tokens_actual = [], 0
+        actual.append(linea)
+        tokens_actual += tokens
+    if actual:
+        bloques.append(actual)
+    return bloques
+
+def preparar_texto(texto, max_tokens=MAX_TOKENS_FRAGMENTO):
+    """
+    Prepara el texto de una factura para el prompt de extracción: quita cabeceras y pies repetidos entre páginas,
+    compacta los espacios y marca la tabla de productos. Si no cabe en `max_tokens`, lo parte en fragmentos:
+    todos llevan la cabecera de la factura y una parte de la tabla, y solo el último lleva los totales.
+    Devuelve la lista de fragmentos (normalmente uno).
+    """
+    paginas = [[l for l in map(_limpiar_linea, pagina.splitlines()) if l] for pagina in texto.split(SEPARADOR_PAGINA)]
+    lineas = [linea for pagina in quitar_cabeceras_pies(paginas) for linea in pagina]
+
+    inicio, fin = localizar_tabla(lineas)
+    if inicio is None:
+        cabecera, tabla, pie = [], lineas, []
+        marcar = lambda bloque: bloque
+    else:
+        cabecera, tabla, pie = lineas[:inicio], lineas[inicio:fin], lineas[fin:]
+        marcar = lambda bloque: [_INICIO_TABLA] + bloque + [_FIN_TABLA]
+
+    completo = "\n".join(cabecera + marcar(tabla) + pie)
+    if _contar_tokens(completo) <= max_tokens:
+        fragmentos = [completo]
+    else:
+        fijo = _contar_tokens("\n".join(cabecera + pie))
+        presupuesto = max(max_tokens - fijo, max_tokens // 4)
+        bloques = _partir_lineas(tabla, presupuesto)
+        fragmentos = ["\n".join(cabecera + marcar(bloque) + (pie if n == len(bloques) - 1 else []))
+                      for n, bloque in enumerate(bloques)]
+
+    antes = _contar_tokens(texto)
+    despues = sum(_contar_tokens(f) for f in fragmentos)
+    logging.info(f"✂️ Texto de la factura: {antes} → {despues} tokens estimados ({len(paginas)} página(s), {len(fragmentos)} fragmento(s)).")
+    return fragmentos
+
+def combinar_extracciones(resultados):
+    """
+    Une las extracciones de los fragmentos de una factura: productos concatenados en orden, campos de cabecera
+    del primer fragmento que los trae y total_factura del último (el que incluye los totales).
+    """
+    combinado = {"productos": []}
+    for datos in resultados:
+        for clave, valor in datos.items():
+            if clave == "productos":
+                combinado["productos"].extend(valor or [])
+            elif clave == "total_factura":
+                if valor not in (None, ""):
+                    combinado[clave] = valor
+            elif valor not in (None, "") and not combinado.get(clave):
+                combinado[clave] = valor
+    return combinado
@@ -0,0 +1,260 @@
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+import db_manager
+
+# Configuración
+HISTORIAL_DIAS = 365          # días de historia (hasta la última compra) con los que se ajusta cada producto
+REJILLA_ALFA = (0.05, 0.1, 0.2, 0.3)   # suavizado de tamaños e intervalos: se elige el de menor error por producto
+PRODUCTOS_POR_LOTE = 4096     # productos ajustados a la vez (memoria: rejilla × productos × compras)
+IDS_POR_CONSULTA = 500        # parámetros por consulta IN (...) a SQLite
+VERSION_MODELO = 2            # cambiarla invalida la caché de todas las empresas
+COLUMNAS_ESTADO = ("tamano", "intervalo", "varianza_tamano", "varianza_intervalo", "alfa")  # tabla prevision_demanda
+
+# Previsión de demanda por producto con el método de Croston corregido por Syntetos-Boylan (SBA), pensado
+# para demanda intermitente: las compras llegan a días sueltos y en lotes. En lugar de suavizar la serie
+# diaria con sus ceros (que deja la previsión alta justo después de una compra y baja justo antes de la
+# siguiente), se suavizan por separado el tamaño de cada compra y el intervalo en días desde la anterior.
+# La demanda diaria prevista es (1 - α/2) · tamaño / intervalo y no depende de en qué punto del ciclo de
+# compras esté el producto. No hay componente estacional ni de tendencia: un perfil semanal se estimaría con los
+# pocos días de compra de cada semana, y con compras cada varias semanas no hay ciclos que lo sostengan; los
+# cambios de ritmo los recoge el suavizado del tamaño y del intervalo.
+#
+# Para el stock de seguridad, la demanda durante la reposición (L días) se modela como N compras: con
+# m = L / intervalo compras esperadas, N es ⌊m⌋ o ⌊m⌋ + 1 (con probabilidad la parte fraccionaria de m), y
+# dado N la demanda es normal con media N · tamaño y varianza N · var(tamaño) + L · var(intervalo) / intervalo³
+# · tamaño² (la irregularidad de los intervalos). Con compras en lotes poco frecuentes el cuantil sale de
+# la mezcla y no de una normal: si es probable que caiga una compra en la reposición, hay que cubrir el lote.
+#
+# Todos los productos de un lote se ajustan a la vez: las compras van en una matriz productos × compras y cada
+# paso del suavizado es una operación de NumPy sobre el lote entero, para todos los valores de la rejilla.
+# El estado se calcula en la última compra, así que no depende de la fecha de consulta, y se guarda en la
+# tabla prevision_demanda (esquema v8). Después de cada ingesta (read_invoice.actualizar_derivados), y antes de
+# mostrar el punto de pedido, se reajustan solo los productos cuyos totales de demanda_producto han cambiado
+# desde el ajuste; la lectura (leer_previsiones) no escribe.
+
+
+def _compras(series):
+    """
+    Compras de cada fila de `series` (productos × días): matrices productos × compras con el tamaño de cada
+    compra a partir de la segunda, los días desde la compra anterior y la máscara de posiciones válidas,
+    alineadas a la izquierda, más la media y la varianza de los tamaños (de todas las compras) y de los intervalos.
+    """
+    num_productos = series.shape[0]
+    filas, columnas = np.nonzero(series > 0)
+    tamanos = series[filas, columnas]
+    cuentas = np.bincount(filas, minlength=num_productos)
+    media_tamano = np.bincount(filas, weights=tamanos, minlength=num_productos) / np.maximum(cuentas, 1)
+    varianza_tamano = (np.bincount(filas, weights=(tamanos - media_tamano[filas]) ** 2, minlength=num_productos)
+                       / np.maximum(cuentas, 1))
+
+    # Cada compra con la anterior de la misma fila: tamaño e intervalo en días
+    misma_fila = filas[1:] == filas[:-1]
+    fila_par = filas[1:][misma_fila]
+    tamano_par = tamanos[1:][misma_fila]
+    intervalo_par = (columnas[1:] - columnas[:-1])[misma_fila].astype(float)
+    num_pares = np.maximum(cuentas - 1, 0)
+    media_intervalo = np.bincount(fila_par, weights=intervalo_par, minlength=num_productos) / np.maximum(num_pares, 1)
+    varianza_intervalo = (np.bincount(fila_par, weights=(intervalo_par - media_intervalo[fila_par]) ** 2,
+                                      minlength=num_productos) / np.maximum(num_pares, 1))
+
+    primero = np.concatenate(([0], np.cumsum(num_pares)[:-1]))
+    posicion = np.arange(len(fila_par)) - primero[fila_par]
+    ancho = int(num_pares.max(initial=0))
+    tamano, intervalo = np.zeros((num_productos, ancho)), np.ones((num_productos, ancho))
+    valida = np.zeros((num_productos, ancho), dtype=bool)
+    tamano[fila_par, posicion] = tamano_par
+    intervalo[fila_par, posicion] = intervalo_par
+    valida[fila_par, posicion] = True
+    return tamano, intervalo, valida, (media_tamano, varianza_tamano, media_intervalo, varianza_intervalo)
+
+def ajustar_series(series):
+    """
+    Ajusta el modelo a cada fila de `series` (productos × días de unidades compradas; los días sin compra son 0).
+    Cada producto necesita al menos dos días con compras. Devuelve un dict de arrays por producto: tamano e
+    intervalo (suavizados, en unidades y días), varianza_tamano, varianza_intervalo y alfa.
+    El parámetro α de cada producto es el de la rejilla con menor error al prever la demanda diaria de cada
+    intervalo entre compras (tamaño / intervalo) antes de conocerlo, ponderado por los días del intervalo.
+    """
+    tamanos, intervalos, validas, (tamano0, var_tamano0, intervalo0, var_intervalo0) = _compras(series)
+    num_productos = series.shape[0]
+    alfas = np.array(REJILLA_ALFA, dtype=float).reshape(-1, 1)
+    filas = np.arange(num_productos)
+    tamano = np.repeat(tamano0[None, :], len(alfas), axis=0)
+    intervalo = np.repeat(np.maximum(intervalo0, 1)[None, :], len(alfas), axis=0)
+    var_tamano = np.repeat(var_tamano0[None, :], len(alfas), axis=0)
+    var_intervalo = np.repeat(var_intervalo0[None, :], len(alfas), axis=0)
+    error_cuadratico = np.zeros((len(alfas), num_productos))
+
+    for k in range(tamanos.shape[1]):
+        valida = validas[:, k]
+        tamano_k, intervalo_k = tamanos[:, k], intervalos[:, k]
+        prevista = (1 - alfas / 2) * tamano / intervalo
+        error_cuadratico += intervalo_k * (tamano_k / intervalo_k - prevista) ** 2 * valida
+        paso = alfas * valida
+        error_tamano, error_intervalo = tamano_k - tamano, intervalo_k - intervalo
+        var_tamano += paso * (error_tamano ** 2 - var_tamano)
+        var_intervalo += paso * (error_intervalo ** 2 - var_intervalo)
+        tamano += paso * error_tamano
+        intervalo += paso * error_intervalo
+
+    mejor = error_cuadratico.argmin(axis=0)
+    return {
+        "tamano": tamano[mejor, filas],
+        "intervalo": intervalo[mejor, filas],
+        "varianza_tamano": var_tamano[mejor, filas],
+        "varianza_intervalo": var_intervalo[mejor, filas],
+        "alfa": alfas[mejor, 0],
+    }
+
+def demanda_diaria(estado):
+    """Demanda diaria prevista de cada producto: (1 - α/2) · tamaño / intervalo (corrección de Syntetos-Boylan)."""
+    return (1 - estado["alfa"] / 2) * estado["tamano"] / estado["intervalo"]
+
+def prever(estado, plazos):
+    """Unidades previstas de cada producto en los `plazos[p]` días siguientes (admite fracciones)."""
+    return demanda_diaria(estado) * np.asarray(plazos, dtype=float)
+
+def _compras_en_plazo(estado, plazos):
+    """Número de compras esperado en el plazo, su parte entera y fraccionaria, y la varianza por intervalos irregulares."""
+    plazos = np.asarray(plazos, dtype=float)
+    esperadas = plazos * (1 - estado["alfa"] / 2) / estado["intervalo"]
+    enteras = np.floor(esperadas)
+    ruido = plazos * estado["varianza_intervalo"] / estado["intervalo"] ** 3
+    return esperadas, enteras, esperadas - enteras, ruido
+
+def varianza_plazo(estado, plazos):
+    """Varianza de la demanda de cada producto en los `plazos[p]` días siguientes."""
+    esperadas, _, fraccion, ruido = _compras_en_plazo(estado, plazos)
+    return esperadas * estado["varianza_tamano"] + (fraccion * (1 - fraccion) + ruido) * estado["tamano"] ** 2
+
+def _fda_normal(x):
+    """Función de distribución normal estándar, vectorizada (Abramowitz-Stegun 7.1.26, error < 1.5e-7)."""
+    z = np.abs(x) / np.sqrt(2)
+    t = 1 / (1 + 0.3275911 * z)
+    polinomio = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return 0.5 * (1 + np.sign(x) * (1 - polinomio * np.exp(-z * z)))
+
+def cuantil_plazo(estado, plazos, nivel_servicio, iteraciones=60):
+    """
+    Unidades que cubren la demanda de cada producto en los `plazos[p]` días siguientes con probabilidad
+    `nivel_servicio`: cuantil de la mezcla de ⌊m⌋ y ⌊m⌋ + 1 compras (ver el comentario del módulo), por bisección.
+    """
+    _, enteras, fraccion, ruido = _compras_en_plazo(estado, plazos)
+    tamano, varianza_tamano = estado["tamano"], estado["varianza_tamano"]
+    componentes = []
+    for compras, peso in ((enteras, 1 - fraccion), (enteras + 1, fraccion)):
+        desviacion = np.sqrt(compras * varianza_tamano + ruido * tamano ** 2) + 1e-9
+        componentes.append((compras * tamano, desviacion, peso))
+    bajo = np.zeros_like(tamano)
+    alto = np.max([media + 10 * desviacion for media, desviacion, _ in componentes], axis=0)
+    for _ in range(iteraciones):
+        medio = (bajo + alto) / 2
+        probabilidad = sum(peso * _fda_normal((medio - media) / desviacion) for media, desviacion, peso in componentes)
+        cubre = probabilidad >= nivel_servicio
+        alto = np.where(cubre, medio, alto)
+        bajo = np.where(cubre, bajo, medio)
+    return alto
+
+# --- Caché en la BD de la empresa ---
+def _productos_pendientes(conn):
+    """
+    Productos con al menos dos días de compra cuyo ajuste falta o no corresponde a sus totales actuales:
+    [(producto_id, ultima_fecha, total_unidades, dias_con_compra, días de historia)], por producto_id.
+    """
+    return conn.execute("""
+        SELECT d.producto_id, d.ultima_fecha, d.total_unidades, d.dias_con_compra,
+               CAST(julianday(d.ultima_fecha) - julianday(d.primera_fecha) AS INTEGER)
+        FROM demanda_producto d LEFT JOIN prevision_demanda p ON p.producto_id = d.producto_id
+        WHERE d.dias_con_compra >= 2 AND (
+            p.producto_id IS NULL OR p.version_modelo != ? OR p.ultima_fecha != d.ultima_fecha
+            OR p.total_unidades != d.total_unidades OR p.dias_con_compra != d.dias_con_compra)
+        ORDER BY d.producto_id
+    """, (VERSION_MODELO,)).fetchall()
+
+def _leer_series(conn, pendientes):
+    """
+    Matriz productos × días de las unidades compradas, alineada para que cada fila acabe en su última compra.
+    """
+    ids = np.array([fila[0] for fila in pendientes], dtype=np.int64)
+    historia = np.array([fila[4] for fila in pendientes], dtype=np.int64)
+    num_dias = int(min(HISTORIAL_DIAS, historia.max() + 1))
+    series = np.zeros((len(pendientes), num_dias))
+    for i in range(0, len(ids), IDS_POR_CONSULTA):
+        lote = ids[i:i + IDS_POR_CONSULTA].tolist()
+        # Días hasta la última compra del producto, calculados en SQL para no convertir fechas fila a fila
+        filas = conn.execute(f"""
+            SELECT d.producto_id, CAST(julianday(p.ultima_fecha) - julianday(d.fecha) AS INTEGER), d.unidades
+            FROM demanda_diaria d JOIN demanda_producto p ON p.producto_id = d.producto_id
+            WHERE d.producto_id IN ({', '.join('?' * len(lote))})
+        """, lote).fetchall()
+        if not filas:
+            continue
+        valores = np.array(filas, dtype=float)
+        posicion = np.searchsorted(ids, valores[:, 0].astype(np.int64))
+        columna = num_dias - 1 - valores[:, 1].astype(np.int64)
+        dentro = columna >= 0
+        np.add.at(series, (posicion[dentro], columna[dentro]), valores[dentro, 2])
+    return series
+
+def actualizar_previsiones(db_path):
+    """
+    Reajusta los productos pendientes de la BD (ver _productos_pendientes) por lotes y guarda su estado.
+    Las series se leen en una transacción de lectura y el ajuste se hace fuera de ella: solo la escritura final
+    bloquea la BD. Si entretanto llega una factura de un producto, sus totales ya no cuadran con los guardados y
+    se reajustará en la siguiente llamada. Devuelve el número de productos ajustados.
+    """
+    from metricas import medir
+
+    with db_manager.conexion(db_path) as conn:
+        conn.execute("BEGIN;")
+        try:
+            pendientes = _productos_pendientes(conn)
+            lotes = [pendientes[i:i + PRODUCTOS_POR_LOTE] for i in range(0, len(pendientes), PRODUCTOS_POR_LOTE)]
+            series_lotes = [_leer_series(conn, lote) for lote in lotes]
+        finally:
+            conn.rollback()
+    if not pendientes:
+        return 0  # las filas de productos que se han quedado sin historia las descarta leer_previsiones
+
+    filas = []
+    with medir("ajustar_previsiones", productos=len(pendientes)):
+        for lote, series in zip(lotes, series_lotes):
+            estado = ajustar_series(series)
+            for i, (producto_id, ultima_fecha, total_unidades, dias_con_compra, _) in enumerate(lote):
+                filas.append((producto_id, ultima_fecha, total_unidades, dias_con_compra, VERSION_MODELO,
+                              *(float(estado[columna][i]) for columna in COLUMNAS_ESTADO)))
+    with db_manager.transaccion(db_path) as conn:
+        conn.executemany(f"""
+            INSERT OR REPLACE INTO prevision_demanda (producto_id, ultima_fecha, total_unidades, dias_con_compra,
+                version_modelo, {', '.join(COLUMNAS_ESTADO)})
+            VALUES (?, ?, ?, ?, ?, {', '.join('?' * len(COLUMNAS_ESTADO))});
+        """, filas)
+        # Productos que ya no tienen historia suficiente (facturas eliminadas)
+        conn.execute("""
+            DELETE FROM prevision_demanda WHERE producto_id NOT IN
+                (SELECT producto_id FROM demanda_producto WHERE dias_con_compra >= 2);
+        """)
+    logging.info(f"📈 Previsión de demanda reajustada para {len(pendientes)} producto(s) de '{os.path.basename(db_path)}'.")
+    return len(pendientes)
+
+def leer_previsiones(conn):
+    """
+    Estado guardado de todos los productos, una fila por producto: nombre_producto, ultima_fecha y las
+    columnas de COLUMNAS_ESTADO.
+    """
+    return pd.read_sql_query(f"""
+        SELECT p.nombre AS nombre_producto, f.ultima_fecha, {', '.join('f.' + columna for columna in COLUMNAS_ESTADO)}
+        FROM prevision_demanda f
+        JOIN productos p ON p.id = f.producto_id
+        JOIN demanda_producto d ON d.producto_id = f.producto_id AND d.dias_con_compra >= 2
+        WHERE f.version_modelo = ?
+        ORDER BY p.nombre
+    """, conn, params=(VERSION_MODELO,))
+
+def estado_desde_tabla(df):
+    """Dict de arrays (el formato de ajustar_series) a partir de la tabla de leer_previsiones."""
+    return {columna: df[columna].to_numpy(dtype=float) for columna in COLUMNAS_ESTADO}
@@ -0,0 +1,7 @@
+# Prioridades compartidas por la cola de trabajos (cola_trabajos.py) y el planificador de llamadas a la IA
+# (planificador_llm.py): una factura conserva su prioridad desde que se encola hasta sus peticiones a OpenAI.
+# Módulo sin dependencias, para que ninguno de los dos tenga que importar al otro.
+
+# Menor número = más prioridad. Las subidas del administrador van antes que el histórico pendiente.
+PRIORIDAD_INTERACTIVA = 0
+PRIORIDAD_LOTE = 10
@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+
+import prevision_demanda
+
+# --- Configuraciones ---
+TIEMPO_REPOSICION_DIAS = 5  # estándar
+DIAS_COBERTURA_SEGURIDAD = 7
+FACTOR_STOCK_SEGURIDAD = 0.2
+NIVEL_SERVICIO = 0.95  # probabilidad de no quedarse sin stock durante la reposición (punto de pedido con previsión)
+
+COLUMNAS_RESULTADO = ["Producto", "Demanda diaria estimada", "Stock de seguridad", "Punto de pedido (unidades)"]
+COLUMNAS_PREVISION = ["Producto", "Demanda diaria estimada", "Desviación diaria", "Demanda en la reposición",
+                      "Stock de seguridad", "Punto de pedido (unidades)"]
+
+
+def _cantidades_numericas(cantidad):
+    """
+    Convierte la columna 'cantidad' a float. Los valores numéricos (la columna REAL de la BD) se usan tal cual;
+    los textos ('1.000 unidades') se interpretan como antes: se extrae el número y '.' es separador de miles.
+    """
+    if pd.api.types.is_numeric_dtype(cantidad):
+        return cantidad.astype(float)
+    es_texto = cantidad.map(type).eq(str)
+    numeros = pd.to_numeric(cantidad.where(~es_texto), errors="coerce")
+    if es_texto.any():
+        texto = cantidad[es_texto].str.extract(r"([\d,.]+)")[0]
+        numeros[es_texto] = pd.to_numeric(texto.str.replace(".", "").str.replace(",", "."), errors="coerce")
+    return numeros.astype(float)
+
+def _tiempos_reposicion(productos, tiempo_reposicion):
+    """Tiempo de reposición por producto: un número global o un dict/Series {producto: días}."""
+    if isinstance(tiempo_reposicion, (dict, pd.Series)):
+        return (pd.Series(productos).map(tiempo_reposicion)
+                .fillna(TIEMPO_REPOSICION_DIAS).to_numpy(dtype=float))
+    return np.full(len(productos), float(tiempo_reposicion))
+
+def calcular_punto_pedido(df, tiempo_reposicion=TIEMPO_REPOSICION_DIAS):
+    """
+    Calcula demanda diaria, stock de seguridad y punto de pedido de todos los productos a la vez.
+    Un producto necesita compras en al menos dos fechas distintas. La demanda diaria es el total de unidades
+    dividido entre los días transcurridos de la primera a la última compra.
+    `tiempo_reposicion` puede ser un número de días o un dict/Series {producto: días}; los productos
+    que no aparecen usan TIEMPO_REPOSICION_DIAS.
+    """
+    if df.empty:
+        return pd.DataFrame()
+
+    datos = pd.DataFrame({
+        "nombre_producto": df["nombre_producto"],
+        # Desde el esquema v5 las fechas llegan en ISO: con el formato explícito no se adivina fila a fila
+        "fecha_emision": pd.to_datetime(df["fecha_emision"], format="%Y-%m-%d", errors="coerce"),
+        "cantidad": _cantidades_numericas(df["cantidad"]),
+    }).dropna(subset=["fecha_emision", "nombre_producto", "cantidad"])
+    if datos.empty:
+        return pd.DataFrame()
+
+    # Unidades por producto y día, y después resumen por producto en una sola agregación
+    # (observed=True: si el producto llega como categoría, no se generan combinaciones sin compras)
+    diario = datos.groupby(["nombre_producto", "fecha_emision"], sort=True, observed=True)["cantidad"].sum().reset_index()
+    resumen = diario.groupby("nombre_producto", sort=True, observed=True).agg(
+        dias_con_compra=("fecha_emision", "size"),
+        primera_fecha=("fecha_emision", "min"),
+        ultima_fecha=("fecha_emision", "max"),
+        total_unidades=("cantidad", "sum"),
+    )
+    resumen = resumen[resumen["dias_con_compra"] >= 2]
+    if resumen.empty:
+        return pd.DataFrame()
+
+    return _tabla_punto_pedido(
+        resumen.index.to_numpy(),
+        resumen["total_unidades"].to_numpy(dtype=float),
+        (resumen["ultima_fecha"] - resumen["primera_fecha"]).dt.days.to_numpy(),
+        tiempo_reposicion,
+    )
+
+def calcular_desde_resumen(resumen, tiempo_reposicion=TIEMPO_REPOSICION_DIAS):
+    """
+    Igual que calcular_punto_pedido, pero a partir de los totales por producto que se mantienen en la ingesta
+    (consultas.resumen_demanda): coste proporcional al número de productos, no al de líneas.
+    """
+    if resumen.empty:
+        return pd.DataFrame()
+    resumen = resumen[resumen["dias_con_compra"] >= 2]
+    if resumen.empty:
+        return pd.DataFrame()
+
+    total_dias = (pd.to_datetime(resumen["ultima_fecha"], format="%Y-%m-%d")
+                  - pd.to_datetime(resumen["primera_fecha"], format="%Y-%m-%d")).dt.days
+    return _tabla_punto_pedido(
+        resumen["nombre_producto"].to_numpy(),
+        resumen["total_unidades"].to_numpy(dtype=float),
+        total_dias.to_numpy(),
+        tiempo_reposicion,
+    )
+
+def _tabla_punto_pedido(productos, total_unidades, total_dias, tiempo_reposicion):
+    total_dias = np.asarray(total_dias, dtype=float)
+    demanda_diaria = np.where(total_dias == 0, total_unidades, total_unidades / np.where(total_dias == 0, 1, total_dias))
+    stock_seguridad = demanda_diaria * DIAS_COBERTURA_SEGURIDAD * FACTOR_STOCK_SEGURIDAD
+    punto_pedido = demanda_diaria * _tiempos_reposicion(productos, tiempo_reposicion) + stock_seguridad
+
+    return pd.DataFrame({
+        "Producto": productos,
+        # np.round como el round() del cálculo original, que recibía np.float64 (2953/200 da 14.76)
+        "Demanda diaria estimada": np.round(demanda_diaria, 2),
+        "Stock de seguridad": np.round(stock_seguridad).astype(int),
+        "Punto de pedido (unidades)": np.round(punto_pedido).astype(int),
+    }, columns=COLUMNAS_RESULTADO)
+
+def calcular_desde_prevision(prevision, tiempo_reposicion=TIEMPO_REPOSICION_DIAS, nivel_servicio=NIVEL_SERVICIO):
+    """
+    Punto de pedido a partir del modelo de previsión de cada producto (consultas.prevision_demanda_empresa):
+    las unidades que cubren la demanda durante la reposición con probabilidad `nivel_servicio`, según el tamaño
+    de las compras y los días entre ellas (prevision_demanda.cuantil_plazo). El stock de seguridad es lo que
+    supera a la demanda prevista. No depende de los días que hayan pasado desde la última compra del producto.
+    """
+    if prevision.empty:
+        return pd.DataFrame()
+    estado = prevision_demanda.estado_desde_tabla(prevision)
+    productos = prevision["nombre_producto"].to_numpy()
+    plazos = _tiempos_reposicion(productos, tiempo_reposicion)
+    demanda_plazo = prevision_demanda.prever(estado, plazos)
+    punto_pedido = np.maximum(prevision_demanda.cuantil_plazo(estado, plazos, nivel_servicio), demanda_plazo)
+    desviacion_diaria = np.sqrt(prevision_demanda.varianza_plazo(estado, plazos) / np.maximum(plazos, 1e-9))
+
+    return pd.DataFrame({
+        "Producto": productos,
+        "Demanda diaria estimada": np.round(prevision_demanda.demanda_diaria(estado), 2),
+        "Desviación diaria": np.round(desviacion_diaria, 2),
+        "Demanda en la reposición": np.round(demanda_plazo, 1),
+        "Stock de seguridad": np.round(punto_pedido - demanda_plazo).astype(int),
+        "Punto de pedido (unidades)": np.round(punto_pedido).astype(int),
+    }, columns=COLUMNAS_PREVISION)
@@ -2,66 +2,73 @@ import os
 import json
 import shutil
 import sqlite3
-import fitz  # PyMuPDF
 import re
-from openai import OpenAI
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
-from dotenv import load_dotenv
-
-# Configuración de logging para una mejor depuración
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-# Cargar variables de entorno (como OPENAI_API_KEY)
-load_dotenv()
+import argparse
+import db_manager
+from db_manager import asegurar_esquema, conexion, transaccion, ruta_bd_empresa
+from cache_ia import obtener_cache_normalizacion, obtener_cache_extracciones
+from planificador_llm import obtener_planificador
+from registro_procesados import obtener_registro, hash_bytes, hash_texto, TIPO_PDF, TIPO_TEXTO
+from normalizacion_datos import limpiar_numero
+from plantillas_proveedor import obtener_plantillas
+from indice_productos import obtener_indice
+import instantaneas
+import prevision_demanda
+from preprocesado_texto import preparar_texto, combinar_extracciones
+from extraccion_pdf import extraer_texto_pdf
+from metricas import medir, anotar
 
 # Configuración
 CARPETA_FACTURAS = "data/facturas"
 CARPETA_PROCESADAS = "data/facturas_procesadas"
-CARPETA_BASES_DATOS = "data/bases_datos"
+CARPETA_BASES_DATOS = db_manager.CARPETA_BASES_DATOS
 
-# Asegurarse de que las carpetas existan
-os.makedirs(CARPETA_FACTURAS, exist_ok=True)
-os.makedirs(CARPETA_PROCESADAS, exist_ok=True)
-os.makedirs(CARPETA_BASES_DATOS, exist_ok=True)
+# Número máximo de facturas procesadas en paralelo (llamadas a OpenAI, lectura de PDF, escritura en BD)
+MAX_FACTURAS_CONCURRENTES = int(os.getenv("STOCKAI_MAX_FACTURAS_CONCURRENTES", "4"))
 
-# Inicializa cliente OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Versión del prompt de normalización de productos. Cambiarla invalida la caché de normalizaciones.
+VERSION_PROMPT_NORMALIZACION = "v1"
+# Versión del prompt de normalización por lotes (otro prompt, con salida JSON): sus nombres tienen su propia clave
+VERSION_PROMPT_NORMALIZACION_LOTES = "lotes-v1"
 
-def limpiar_numero(valor):
-    """Convierte strings como '60.000 unidades', '12,5', '1.000,25' a float."""
-    if not isinstance(valor, str):
-        try:
-            return float(valor)
-        except (ValueError, TypeError):
-            logging.warning(f"No se pudo convertir a float: {valor}. Devolviendo 0.0")
-            return 0.0
-    
-    limpio = re.sub(r"[^\d,\.]", "", valor)
-    
-    if "," in limpio and "." in limpio:
-        if limpio.rfind(',') > limpio.rfind('.'):
-            limpio = limpio.replace(".", "").replace(",", ".")
-        else:
-            limpio = limpio.replace(",", "")
-    elif "," in limpio:
-        limpio = limpio.replace(",", ".")
-    elif limpio.count(".") > 1:
-        limpio = limpio.replace(".", "")
-    
-    try:
-        return float(limpio)
-    except ValueError:
-        logging.warning(f"No se pudo limpiar y convertir a float: '{valor}' -> '{limpio}'. Devolviendo 0.0")
-        return 0.0
-
-def extraer_texto_pdf(ruta_pdf):
-    doc = fitz.open(ruta_pdf)
-    texto = ""
-    for pagina in doc:
-        texto += pagina.get_text()
-    doc.close()
-    return texto
+# Modelo y versión del prompt de extracción. Forman parte de la clave de la caché de extracciones.
+MODELO_EXTRACCION = "gpt-4" # Puedes considerar gpt-3.5-turbo para menor costo si el rendimiento es aceptable
+VERSION_PROMPT_EXTRACCION = "v2"  # v2: texto preprocesado, con las líneas de producto marcadas y facturas largas por fragmentos
+
+# Los nombres normalizados que propone el prompt de extracción se guardan en la caché de normalizaciones con
+# su propia versión: cambiar uno de los dos prompts solo invalida sus nombres.
+VERSION_NORMALIZACION_EXTRACCION = f"extraccion-{VERSION_PROMPT_EXTRACCION}"
+# Versiones que se consultan para un nombre, en orden de preferencia (se mantiene el primer nombre canónico)
+VERSIONES_NORMALIZACION = (VERSION_PROMPT_NORMALIZACION, VERSION_PROMPT_NORMALIZACION_LOTES, VERSION_NORMALIZACION_EXTRACCION)
+
+# Las extracciones con plantilla se guardan en la misma caché con este "modelo", para reconstruir las BD
+MODELO_PLANTILLA = "plantilla"
+
+# Importar este módulo no tiene efectos secundarios (ni carpetas, ni logging, ni .env): de eso se encargan
+# los puntos de entrada con configurar_proceso(). Las carpetas se crean cuando se usan.
+def configurar_proceso():
+    """Configura logging y carga las variables de .env (como OPENAI_API_KEY). Para los puntos de entrada."""
+    from dotenv import load_dotenv
+
+    # Configuración de logging para una mejor depuración
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv()
+
+# Todas las llamadas a OpenAI pasan por el planificador (límites de ritmo, prioridades y reintentos)
+
+# Un lock por base de datos de empresa: las escrituras a una misma BD se serializan
+_locks_bd = {}
+_locks_bd_guard = threading.Lock()
+
+def lock_bd(nombre_empresa_normalizado):
+    with _locks_bd_guard:
+        if nombre_empresa_normalizado not in _locks_bd:
+            _locks_bd[nombre_empresa_normalizado] = threading.Lock()
+        return _locks_bd[nombre_empresa_normalizado]
 
 def normalizar_nombre_empresa(nombre):
     """Normaliza el nombre de la empresa para usarlo en nombres de archivos/BD."""
@@ -74,10 +81,17 @@ def normalizar_nombre_producto_ia(nombre_producto):
     """
     Normaliza el nombre de un producto utilizando la IA para estandarizarlo.
     Elimina plurales, marcas, tamaños, unidades de medida o cualquier descriptor que no sea esencial.
+    Los resultados se guardan en la caché persistente (ver cache_ia.py), así que un nombre ya visto
+    no vuelve a llamar a OpenAI.
     """
     if not isinstance(nombre_producto, str) or not nombre_producto.strip():
         return "Producto Desconocido"
 
+    cache = obtener_cache_normalizacion()
+    en_cache = cache.obtener_alguna(nombre_producto, VERSIONES_NORMALIZACION)
+    if en_cache is not None:
+        return en_cache
+
     prompt = f"""
     Normaliza el siguiente nombre de producto para que sea genérico y estandarizado, eliminando plurales, marcas, tamaños, unidades de medida o cualquier descriptor que no sea esencial para identificar el producto principal.
     Ejemplos:
@@ -92,68 +106,218 @@ def normalizar_nombre_producto_ia(nombre_producto):
     Devuelve solo el nombre normalizado, sin explicaciones ni texto adicional.
     """
     try:
-        respuesta = client.chat.completions.create(
+        respuesta = obtener_planificador().completar(
             model="gpt-4o", # O gpt-4, gpt-3.5-turbo. gpt-4o es bueno para esto.
             messages=[
                 {"role": "user", "content": prompt}
             ],
             temperature=0.1 # Baja temperatura para resultados consistentes
         )
-        normalizado = respuesta.choices[0].message.content.strip()
-        # Una limpieza final por si la IA añade algo inesperado
-        normalizado = re.sub(r"[^a-záéíóúüñ\d\s]", "", normalizado.lower()) # solo letras, numeros, espacios
-        normalizado = re.sub(r"\s+", " ", normalizado).strip() # Multiples espacios a uno, trim
-        
-        return normalizado if normalizado else "Producto Desconocido"
+        normalizado = _limpiar_nombre_normalizado(respuesta.choices[0].message.content)
+
+        if not normalizado:
+            return "Producto Desconocido"
+        cache.guardar(nombre_producto, VERSION_PROMPT_NORMALIZACION, normalizado)
+        return normalizado
     except Exception as e:
         logging.error(f"❌ Error al normalizar '{nombre_producto}' con IA: {e}")
         # En caso de error, volvemos a la normalización básica para no perder el dato
-        return re.sub(r"[^a-záéíóúüñ\d\s]", "", nombre_producto.lower()).replace("  ", " ").strip()
+        return _normalizacion_basica(nombre_producto)
+
+
+# Máximo de nombres enviados en una sola petición de normalización por lotes
+MAX_NOMBRES_POR_LOTE = 100
+
+def normalizar_nombres_productos_ia(nombres_productos):
+    """
+    Versión por lotes de normalizar_nombre_producto_ia: normaliza todos los nombres de una factura
+    con una única petición a OpenAI (solo para los que no están en caché).
+    Devuelve un dict {nombre_original: nombre_normalizado}. Si la respuesta es inválida o parcial,
+    los nombres afectados usan la normalización básica por regex.
+    """
+    resultado = {}
+    cache = obtener_cache_normalizacion()
+    pendientes = []
+    for nombre in nombres_productos:
+        if nombre in resultado or nombre in pendientes:
+            continue
+        if not isinstance(nombre, str) or not nombre.strip():
+            resultado[nombre] = "Producto Desconocido"
+            continue
+        en_cache = cache.obtener_alguna(nombre, VERSIONES_NORMALIZACION)
+        if en_cache is not None:
+            resultado[nombre] = en_cache
+        else:
+            pendientes.append(nombre)
+
+    for inicio in range(0, len(pendientes), MAX_NOMBRES_POR_LOTE):
+        lote = pendientes[inicio:inicio + MAX_NOMBRES_POR_LOTE]
+        normalizados = _normalizar_lote_ia(lote)
+        for nombre in lote:
+            normalizado = normalizados.get(nombre)
+            if normalizado:
+                cache.guardar(nombre, VERSION_PROMPT_NORMALIZACION_LOTES, normalizado)
+                resultado[nombre] = normalizado
+            else:
+                resultado[nombre] = _normalizacion_basica(nombre) or "Producto Desconocido"
+
+    return resultado
+
+def _normalizar_lote_ia(nombres):
+    """Envía un lote de nombres a la IA y devuelve {nombre: normalizado} solo con las respuestas válidas."""
+    entrada = {str(i): nombre for i, nombre in enumerate(nombres, start=1)}
+    prompt = f"""
+    Normaliza cada uno de los siguientes nombres de producto para que sea genérico y estandarizado, eliminando plurales, marcas, tamaños, unidades de medida o cualquier descriptor que no sea esencial para identificar el producto principal.
+    Ejemplos:
+    - "Mascarillas quirúrgicas IIR caja de 50 unidades" -> "Mascarilla quirúrgica"
+    - "Guantes de latex talla M" -> "Guante de látex"
+    - "Batas desechables azules" -> "Bata desechable"
+    - "Gel hidroalcoholico 500ml" -> "Gel hidroalcohólico"
+    - "Lapiz HB Staedtler" -> "Lápiz"
+    - "Ordenador portatil HP Pavilion" -> "Ordenador portátil"
+
+    Productos a normalizar (JSON, clave = identificador):
+    {json.dumps(entrada, ensure_ascii=False)}
+
+    Devuelve solo un objeto JSON con las mismas claves y como valor el nombre normalizado, sin explicaciones ni texto adicional.
+    """
+    try:
+        respuesta = obtener_planificador().completar(
+            model="gpt-4o",
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
+        salida = json.loads(respuesta.choices[0].message.content)
+    except Exception as e:
+        logging.error(f"❌ Error al normalizar un lote de {len(nombres)} productos con IA: {e}")
+        return {}
+
+    if not isinstance(salida, dict):
+        logging.warning("⚠️ La normalización por lotes no devolvió un objeto JSON. Se usa la normalización básica.")
+        return {}
+
+    normalizados = {}
+    for clave, nombre in entrada.items():
+        valor = salida.get(clave)
+        if isinstance(valor, str) and _limpiar_nombre_normalizado(valor):
+            normalizados[nombre] = _limpiar_nombre_normalizado(valor)
+    if len(normalizados) < len(nombres):
+        logging.warning(f"⚠️ Respuesta parcial de la IA: {len(nombres) - len(normalizados)} de {len(nombres)} productos usarán la normalización básica.")
+    return normalizados
+
+def normalizar_productos_factura(productos, usar_ia=True, nombre_empresa_normalizado=None):
+    """
+    Añade 'nombre_normalizado' a cada producto de la factura.
+    Si la extracción ya propuso un 'nombre_normalizado', se usa (salvo que la caché ya tenga uno para ese
+    nombre, para mantener estable el nombre canónico); el resto se normaliza en una sola petición por lotes.
+    Con usar_ia=False no se llama a OpenAI: se usa la caché y, si no hay entrada, la normalización básica.
+    Con la empresa, los nombres que no están en la caché se buscan antes en su índice de productos
+    (indice_productos.py): si se parecen lo bastante a un producto existente, se usa ese sin llamar a OpenAI.
+    Al final, los nombres se añaden al índice tal cual: los que vienen de la IA, la caché o la extracción no se
+    cambian por el producto más parecido (el índice solo decide cuando evita una llamada a la IA).
+    """
+    cache = obtener_cache_normalizacion()
+    indice = obtener_indice(nombre_empresa_normalizado) if nombre_empresa_normalizado else None
+    sin_normalizar = []
+    for producto in productos:
+        nombre = producto.get("nombre", "Producto Desconocido")
+        propuesto = producto.get("nombre_normalizado")
+        propuesto = _limpiar_nombre_normalizado(propuesto) if isinstance(propuesto, str) else ""
+        if propuesto and isinstance(nombre, str) and nombre.strip():
+            en_cache = cache.obtener_alguna(nombre, VERSIONES_NORMALIZACION)
+            if en_cache is None:
+                cache.guardar(nombre, VERSION_NORMALIZACION_EXTRACCION, propuesto)
+            producto["nombre_normalizado"] = en_cache or propuesto
+        else:
+            sin_normalizar.append(producto)
+
+    if sin_normalizar and indice is not None:
+        pendientes = []
+        for producto in sin_normalizar:
+            nombre = producto.get("nombre", "Producto Desconocido")
+            encontrado = None
+            if isinstance(nombre, str) and cache.obtener_alguna(nombre, VERSIONES_NORMALIZACION) is None:
+                encontrado = indice.buscar(nombre)
+            if encontrado:
+                producto["nombre_normalizado"] = encontrado[0]
+            else:
+                pendientes.append(producto)
+        if len(pendientes) < len(sin_normalizar):
+            anotar(aciertos_indice=len(sin_normalizar) - len(pendientes))
+        sin_normalizar = pendientes
+
+    if sin_normalizar and not usar_ia:
+        for producto in sin_normalizar:
+            nombre = producto.get("nombre", "Producto Desconocido")
+            if not isinstance(nombre, str) or not nombre.strip():
+                producto["nombre_normalizado"] = "Producto Desconocido"
+            else:
+                producto["nombre_normalizado"] = (cache.obtener_alguna(nombre, VERSIONES_NORMALIZACION)
+                                                  or _normalizacion_basica(nombre) or "Producto Desconocido")
+    elif sin_normalizar:
+        normalizados = normalizar_nombres_productos_ia([p.get("nombre", "Producto Desconocido") for p in sin_normalizar])
+        for producto in sin_normalizar:
+            producto["nombre_normalizado"] = normalizados[producto.get("nombre", "Producto Desconocido")]
+
+    if indice is not None:
+        for producto in productos:
+            indice.anadir(producto["nombre_normalizado"], alias=producto.get("nombre"))
+    return productos
+
+def _limpiar_nombre_normalizado(texto):
+    """Limpieza final de un nombre devuelto por la IA: solo letras, números y espacios simples."""
+    normalizado = re.sub(r"[^a-záéíóúüñ\d\s]", "", texto.strip().lower())
+    return re.sub(r"\s+", " ", normalizado).strip()
+
+def _normalizacion_basica(nombre_producto):
+    """Normalización por regex que se usa cuando la IA no está disponible o no responde bien."""
+    return re.sub(r"[^a-záéíóúüñ\d\s]", "", nombre_producto.lower()).replace("  ", " ").strip()
 
 
 def crear_base_datos_si_no_existe(nombre_empresa_normalizado):
-    db_path = os.path.join(CARPETA_BASES_DATOS, f"{nombre_empresa_normalizado}.db")
-    conn = None
+    db_path = ruta_bd_empresa(nombre_empresa_normalizado)
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS facturas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                numero_factura TEXT,
-                fecha_emision TEXT,
-                nombre_producto TEXT,
-                cantidad REAL,
-                precio_unitario REAL,
-                total_producto REAL,
-                total_factura REAL,
-                UNIQUE(numero_factura, fecha_emision) ON CONFLICT IGNORE
-            );
-        """)
-        conn.commit()
-        logging.info(f"Base de datos '{db_path}' verificada/creada.")
+        asegurar_esquema(db_path)
     except sqlite3.Error as e:
         logging.error(f"Error al crear/conectar la BD {db_path}: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
     return db_path
 
 def factura_existe(db_path, numero_factura):
-    conn = None
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM facturas WHERE numero_factura = ?", (numero_factura,))
-        count = cursor.fetchone()[0]
-        return count > 0
+        with conexion(db_path) as conn:
+            return db_manager.factura_existe(conn, numero_factura)
     except sqlite3.Error as e:
         logging.error(f"Error al verificar duplicado en {db_path} para factura {numero_factura}: {e}")
         return False
-    finally:
-        if conn:
-            conn.close()
+
+def lineas_factura(productos):
+    """
+    Tuplas (nombre_producto, cantidad, precio_unitario, total_producto) para db_manager.insertar_factura.
+    Los importes se convierten a números aquí, una sola vez; los que no se pueden convertir quedan en None
+    (NULL en la BD, con la línea marcada en 'incidencias').
+    """
+    return [(
+        producto["nombre_normalizado"],
+        limpiar_numero(producto.get("cantidad", 0), por_defecto=None),
+        limpiar_numero(producto.get("precio_unitario", 0.0), por_defecto=None),
+        limpiar_numero(producto.get("total_por_producto", 0.0), por_defecto=None),
+    ) for producto in productos]
+
+def actualizar_derivados(nombre_empresa_normalizado):
+    """
+    Pone al día lo que se calcula a partir de las facturas de la empresa después de guardar alguna: su
+    instantánea columnar y la previsión de demanda de los productos afectados. Un error se registra y no se
+    propaga: las facturas ya están guardadas y el dashboard lee de la BD (y reajusta la previsión) si hace falta.
+    """
+    instantaneas.actualizar_instantanea(nombre_empresa_normalizado)
+    try:
+        prevision_demanda.actualizar_previsiones(ruta_bd_empresa(nombre_empresa_normalizado))
+    except Exception as e:
+        logging.warning(f"⚠️ No se pudo reajustar la previsión de demanda de '{nombre_empresa_normalizado}': {e}")
 
 def guardar_datos_en_bd(nombre_empresa_normalizado, datos):
     if not datos.get("numero_factura"):
@@ -161,70 +325,91 @@ def guardar_datos_en_bd(nombre_empresa_normalizado, datos):
         raise ValueError("Datos de factura incompletos: numero_factura requerido.")
     
     numero_factura = datos["numero_factura"]
-    db_path = os.path.join(CARPETA_BASES_DATOS, f"{nombre_empresa_normalizado}.db")
-    
-    crear_base_datos_si_no_existe(nombre_empresa_normalizado)
+    db_path = crear_base_datos_si_no_existe(nombre_empresa_normalizado)
 
     if factura_existe(db_path, numero_factura):
         logging.info(f"⏭️ Factura '{numero_factura}' para '{nombre_empresa_normalizado}' ya existe en la BD. Omitiendo inserción.")
         return False
     
-    if not datos.get("productos"):
-        logging.warning(f"No se encontraron productos en la factura {numero_factura}. No se insertarán líneas de producto.")
-        return True
+    productos = datos.get("productos") or []
+    if not productos:
+        logging.warning(f"No se encontraron productos en la factura {numero_factura}. Solo se guardará la cabecera.")
+
+    # Todas las normalizaciones de la factura en una sola petición, antes de abrir la conexión
+    # (los llamantes habituales ya las han hecho fuera del lock de la BD)
+    if any("nombre_normalizado" not in producto for producto in productos):
+        normalizar_productos_factura(productos, nombre_empresa_normalizado=nombre_empresa_normalizado)
+
+    lineas = lineas_factura(productos)
 
-    conn = None
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        total_factura_final = limpiar_numero(datos.get("total_factura", 0.0))
-
-        for producto in datos["productos"]:
-            # --- APLICAR NORMALIZACIÓN DEL NOMBRE DEL PRODUCTO USANDO IA AQUÍ ---
-            nombre_producto_normalizado = normalizar_nombre_producto_ia(producto.get("nombre", "Producto Desconocido"))
-            
-            cursor.execute("""
-                INSERT INTO facturas (numero_factura, fecha_emision, nombre_producto, cantidad, precio_unitario, total_producto, total_factura)
-                VALUES (?, ?, ?, ?, ?, ?, ?);
-            """, (
+        with medir("guardar_datos_en_bd", filas=len(lineas)), transaccion(db_path) as conn:
+            insertada = db_manager.insertar_factura(
+                conn,
                 numero_factura,
                 datos.get("fecha_emision", ""),
-                nombre_producto_normalizado, # Usar el nombre normalizado por IA
-                limpiar_numero(producto.get("cantidad", 0)),
-                limpiar_numero(producto.get("precio_unitario", 0.0)),
-                limpiar_numero(producto.get("total_por_producto", 0.0)),
-                total_factura_final
-            ))
-        
-        conn.commit()
-        logging.info(f"✅ Datos de factura {numero_factura} guardados en: {db_path}")
-        return True
+                limpiar_numero(datos.get("total_factura", 0.0), por_defecto=None),
+                lineas
+            )
+        if insertada:
+            logging.info(f"✅ Datos de factura {numero_factura} guardados en: {db_path}")
+        return insertada
     except sqlite3.Error as e:
         logging.error(f"Error al guardar datos de la factura {numero_factura} en BD: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
 
 def extraer_datos_structurados(texto):
+    """
+    Extrae los datos de la factura con la IA. El JSON devuelto se guarda en la caché de extracciones
+    (clave: hash del texto + modelo + versión del prompt) y se reutiliza si el mismo texto vuelve a llegar.
+    El texto se preprocesa antes de enviarlo (preprocesado_texto.preparar_texto); las facturas demasiado
+    largas se envían en varios fragmentos y sus resultados se combinan.
+    """
+    cache = obtener_cache_extracciones()
+    hash_txt = hash_texto(texto)
+    en_cache = cache.obtener(hash_txt, MODELO_EXTRACCION, VERSION_PROMPT_EXTRACCION)
+    if en_cache is not None:
+        logging.info("♻️ Extracción recuperada de la caché, sin llamar a OpenAI.")
+        return en_cache
+
+    fragmentos = preparar_texto(texto)
+    if len(fragmentos) == 1:
+        datos_json = _extraer_fragmento_ia(fragmentos[0])
+    else:
+        anotar(fragmentos=len(fragmentos))
+        datos_json = combinar_extracciones([
+            _extraer_fragmento_ia(fragmento, parte=n, partes=len(fragmentos))
+            for n, fragmento in enumerate(fragmentos, start=1)
+        ])
+    cache.guardar(hash_txt, MODELO_EXTRACCION, VERSION_PROMPT_EXTRACCION, datos_json)
+    return datos_json
+
+def _extraer_fragmento_ia(texto, parte=1, partes=1):
+    aviso_fragmento = ""
+    if partes > 1:
+        aviso_fragmento = f"""
+Este texto es la parte {parte} de {partes} de una factura larga: incluye la cabecera y solo una parte de las líneas de producto.
+Extrae únicamente los productos que aparecen en esta parte. Si los totales no aparecen, deja 'total_factura' vacío.
+"""
     prompt = f"""
 Extrae los datos estructurados de la siguiente factura. Devuelve el resultado como JSON con las claves:
 - nombre_empresa (string)
 - numero_factura (string o número)
 - fecha_emision (DD/MM/AAAA o similar, si no está presente, usar formato AAAA-MM-DD y dejar vacío)
-- productos (lista de objetos con las claves: nombre, cantidad, precio_unitario, total_por_producto)
+- productos (lista de objetos con las claves: nombre, nombre_normalizado, cantidad, precio_unitario, total_por_producto)
 - total_factura (número, si no está presente, dejar vacío)
 
 Asegúrate de que 'nombre_empresa', 'numero_factura' y 'fecha_emision' siempre existan.
 Para 'productos', asegúrate de que cada objeto tenga 'nombre', 'cantidad', 'precio_unitario' y 'total_por_producto'. Si falta alguna, asigna una cadena vacía o 0.
-
+'nombre' es el texto tal como aparece en la factura. 'nombre_normalizado' es ese mismo producto en forma genérica y estandarizada, en singular y sin marcas, tamaños, unidades de medida ni descriptores no esenciales (por ejemplo "Guantes de latex talla M" -> "Guante de látex").
+Las líneas de producto, si se han reconocido, van entre las marcas '--- LÍNEAS DE PRODUCTO ---' y '--- FIN DE LÍNEAS DE PRODUCTO ---'.
+{aviso_fragmento}
 Texto:
 {texto}
 """
     try:
-        respuesta = client.chat.completions.create(
-            model="gpt-4", # Puedes considerar gpt-3.5-turbo para menor costo si el rendimiento es aceptable
+        respuesta = obtener_planificador().completar(
+            model=MODELO_EXTRACCION,
             messages=[
                 {"role": "user", "content": prompt}
             ],
@@ -237,8 +422,7 @@ Texto:
         if start_index != -1 and end_index != -1:
             contenido = contenido[start_index : end_index + 1]
         
-        datos_json = json.loads(contenido)
-        return datos_json
+        return json.loads(contenido)
     except json.JSONDecodeError as e:
         logging.error(f"❌ La respuesta de OpenAI no es un JSON válido:\n'{contenido}'\nError: {e}")
         raise ValueError("❌ La respuesta de OpenAI no es un JSON válido.")
@@ -246,17 +430,83 @@ Texto:
         logging.error(f"❌ Error general al llamar a OpenAI: {e}")
         raise
 
-def procesar_factura(ruta_pdf):
+def extraer_datos_factura(texto):
+    """
+    Extrae los datos de la factura con la plantilla del proveedor si alguna la reconoce y el resultado valida;
+    si no, con la IA. De las extracciones de la IA válidas se aprende la plantilla del diseño para la próxima vez.
+    Las dos se guardan en la caché de extracciones con el hash del texto (reconstruir_bases_desde_cache).
+    """
+    plantillas = obtener_plantillas()
+    with medir("plantillas_proveedor") as medicion:
+        datos = plantillas.extraer(texto)
+        medicion["aciertos"] = int(datos is not None)
+    if datos is not None:
+        obtener_cache_extracciones().guardar(hash_texto(texto), MODELO_PLANTILLA, VERSION_PROMPT_EXTRACCION, datos)
+        return datos
+    with medir("extraer_datos_structurados"):
+        datos = extraer_datos_structurados(texto)
+    plantillas.aprender(texto, datos)
+    return datos
+
+def procesar_factura(ruta_pdf, lanzar_errores=False):
+    """
+    Procesa una factura y devuelve un mensaje de resumen. Por defecto los errores se devuelven como mensaje;
+    con lanzar_errores=True se relanzan (lo usa el trabajador de la cola para gestionar reintentos).
+    """
     logging.info(f"\n📥 Procesando archivo: {ruta_pdf}")
     try:
-        texto = extraer_texto_pdf(ruta_pdf)
-        datos_raw = extraer_datos_structurados(texto)
+        registro = obtener_registro()
+
+        # 1) Documento idéntico ya procesado: se omite sin parsear el PDF
+        with open(ruta_pdf, "rb") as f:
+            contenido = f.read()
+        hash_pdf = hash_bytes(contenido)
+        previo = registro.buscar(hash_pdf, TIPO_PDF)
+        if previo:
+            return _omitir_documento_conocido(ruta_pdf, previo)
+
+        # El texto se extrae de los mismos bytes, sin volver a leer el archivo
+        with medir("extraer_texto_pdf", bytes_pdf=len(contenido)) as medicion:
+            texto = extraer_texto_pdf(contenido)
+            medicion["caracteres"] = len(texto)
+        del contenido
+
+        # 2) Mismo contenido con distintos bytes (p. ej. re-exportado): se omite antes de llamar a OpenAI
+        hash_txt = hash_texto(texto)
+        previo = registro.buscar(hash_txt, TIPO_TEXTO)
+        if previo:
+            registro.registrar(previo["empresa"], previo["numero_factura"], os.path.basename(ruta_pdf), hash_pdf=hash_pdf)
+            return _omitir_documento_conocido(ruta_pdf, previo)
+
+        datos_raw = extraer_datos_factura(texto)
         logging.info("📄 Datos estructurados (parcial): %s", json.dumps(datos_raw, indent=2, ensure_ascii=False)[:500] + "...")
         
         nombre_empresa_normalizado = normalizar_nombre_empresa(datos_raw.get("nombre_empresa", "empresa_desconocida"))
-        
-        was_inserted = guardar_datos_en_bd(nombre_empresa_normalizado, datos_raw)
-        
+
+        # 3) Misma factura en otro PDF (mismo número, distinto contenido): se omite antes de normalizar sus
+        # productos, sin gastar peticiones a OpenAI ni añadir sus nombres al índice de la empresa
+        numero_factura = datos_raw.get("numero_factura")
+        ruta_bd = ruta_bd_empresa(nombre_empresa_normalizado)
+        if numero_factura and os.path.exists(ruta_bd) and factura_existe(ruta_bd, numero_factura):
+            logging.info(f"⏭️ Factura '{numero_factura}' para '{nombre_empresa_normalizado}' ya existe en la BD. Omitiendo normalización.")
+            registro.registrar(nombre_empresa_normalizado, numero_factura, os.path.basename(ruta_pdf),
+                               hash_pdf=hash_pdf, hash_txt=hash_txt)
+            mover_factura_procesada(ruta_pdf)
+            return f"ℹ️ '{os.path.basename(ruta_pdf)}' (factura '{numero_factura}') ya existe y fue omitida."
+
+        # Normalizar productos fuera del lock de la BD para no bloquear otras facturas de la misma empresa
+        if datos_raw.get("productos"):
+            with medir("normalizar_productos", productos=len(datos_raw["productos"])):
+                normalizar_productos_factura(datos_raw["productos"], nombre_empresa_normalizado=nombre_empresa_normalizado)
+
+        with lock_bd(nombre_empresa_normalizado):
+            was_inserted = guardar_datos_en_bd(nombre_empresa_normalizado, datos_raw)
+        if was_inserted:
+            actualizar_derivados(nombre_empresa_normalizado)
+
+        registro.registrar(nombre_empresa_normalizado, datos_raw["numero_factura"], os.path.basename(ruta_pdf),
+                           hash_pdf=hash_pdf, hash_txt=hash_txt)
+
         if was_inserted:
             mover_factura_procesada(ruta_pdf)
             return f"✅ '{os.path.basename(ruta_pdf)}' procesada y guardada."
@@ -266,27 +516,148 @@ def procesar_factura(ruta_pdf):
 
     except Exception as e:
         logging.error(f"❌ Error al procesar {os.path.basename(ruta_pdf)}: {e}")
+        if lanzar_errores:
+            raise
         return f"❌ Error al procesar '{os.path.basename(ruta_pdf)}': {e}"
 
+def _omitir_documento_conocido(ruta_pdf, previo):
+    logging.info(f"⏭️ '{os.path.basename(ruta_pdf)}' ya fue procesado (empresa '{previo['empresa']}', factura '{previo['numero_factura']}'). Omitiendo extracción.")
+    mover_factura_procesada(ruta_pdf)
+    return f"ℹ️ '{os.path.basename(ruta_pdf)}' (factura '{previo['numero_factura']}') ya existe y fue omitida."
+
 def mover_factura_procesada(ruta_pdf):
-    if not os.path.exists(CARPETA_PROCESADAS):
-        os.makedirs(CARPETA_PROCESADAS)
+    os.makedirs(CARPETA_PROCESADAS, exist_ok=True)
     nombre_archivo = os.path.basename(ruta_pdf)
     destino = os.path.join(CARPETA_PROCESADAS, nombre_archivo)
-    shutil.move(ruta_pdf, destino)
+    with medir("mover_factura_procesada"):
+        shutil.move(ruta_pdf, destino)
     logging.info(f"📦 Factura movida a: {destino}")
 
-def procesar_facturas_en_carpeta():
-    """Función principal para procesar todas las facturas pendientes."""
+def procesar_facturas_en_carpeta(max_concurrencia=None):
+    """
+    Función principal para procesar todas las facturas pendientes.
+    Las facturas se procesan en paralelo con un pool de hilos limitado a `max_concurrencia`
+    (por defecto MAX_FACTURAS_CONCURRENTES). Con max_concurrencia=1 se procesan una tras otra.
+    """
+    os.makedirs(CARPETA_FACTURAS, exist_ok=True)
     archivos = [f for f in os.listdir(CARPETA_FACTURAS) if f.endswith(".pdf")]
     if not archivos:
         logging.info("⚠️ No se encontraron archivos PDF en la carpeta de facturas pendientes.")
         return "No se encontraron facturas pendientes de procesar."
-    
-    resultados_procesamiento = []
-    for archivo in archivos:
-        ruta_pdf = os.path.join(CARPETA_FACTURAS, archivo)
-        resultado_individual = procesar_factura(ruta_pdf)
-        resultados_procesamiento.append(resultado_individual)
-    
-    return "\n".join(resultados_procesamiento)
\ No newline at end of file
+
+    if max_concurrencia is None:
+        max_concurrencia = MAX_FACTURAS_CONCURRENTES
+    max_concurrencia = max(1, min(max_concurrencia, len(archivos)))
+
+    rutas = [os.path.join(CARPETA_FACTURAS, archivo) for archivo in archivos]
+    if max_concurrencia == 1:
+        resultados_procesamiento = [procesar_factura(ruta_pdf) for ruta_pdf in rutas]
+    else:
+        logging.info(f"⚙️ Procesando {len(rutas)} facturas con {max_concurrencia} hilos.")
+        with ThreadPoolExecutor(max_workers=max_concurrencia, thread_name_prefix="factura") as pool:
+            # map conserva el orden de los archivos en el resumen
+            resultados_procesamiento = list(pool.map(procesar_factura, rutas))
+
+    stats = obtener_cache_normalizacion().estadisticas()
+    logging.info(
+        f"📊 Caché de normalización: {stats['hits_memoria'] + stats['hits_disco']} aciertos, "
+        f"{stats['misses']} fallos ({stats['tasa_acierto']:.0%})."
+    )
+    stats = obtener_plantillas().estadisticas()
+    logging.info(
+        f"🧩 Plantillas de proveedor: {stats['aciertos']} facturas extraídas sin IA, "
+        f"{stats['fallos']} enviadas a OpenAI ({stats['plantillas']} plantillas)."
+    )
+    return "\n".join(resultados_procesamiento)
+
+
+def reconstruir_bases_desde_cache():
+    """
+    Regenera todas las bases de datos de empresa a partir de la caché de extracciones, sin llamar a OpenAI.
+    Las BD actuales se mueven a una carpeta de respaldo antes de empezar. Las facturas eliminadas desde la
+    aplicación (marcadas en el registro de procesados) no se vuelven a insertar.
+    """
+    cache = obtener_cache_extracciones()
+    registro = obtener_registro()
+    marca = datetime.now().strftime("%Y%m%d_%H%M%S")
+    carpeta_respaldo = os.path.join(os.path.dirname(CARPETA_BASES_DATOS), f"bases_datos_respaldo_{marca}")
+    # Cerrar las conexiones del pool antes de mover los ficheros (incluidos -wal y -shm)
+    db_manager.cerrar_conexiones()
+    os.makedirs(CARPETA_BASES_DATOS, exist_ok=True)
+    bases_actuales = [f for f in os.listdir(CARPETA_BASES_DATOS) if f.endswith(".db")]
+    if bases_actuales:
+        os.makedirs(carpeta_respaldo, exist_ok=True)
+        for nombre_bd in os.listdir(CARPETA_BASES_DATOS):
+            if nombre_bd.endswith((".db", ".db-wal", ".db-shm")):
+                shutil.move(os.path.join(CARPETA_BASES_DATOS, nombre_bd), os.path.join(carpeta_respaldo, nombre_bd))
+        logging.info(f"🗄️ {len(bases_actuales)} BD movidas a: {carpeta_respaldo}")
+    # Las instantáneas son de las BD anteriores: se descartan y se generan de nuevo al final
+    if os.path.isdir(instantaneas.CARPETA_INSTANTANEAS):
+        for empresa in os.listdir(instantaneas.CARPETA_INSTANTANEAS):
+            instantaneas.eliminar_instantanea(empresa)
+
+    insertadas, omitidas, eliminadas, errores = 0, 0, 0, 0
+    for hash_txt, datos in cache.iterar_ultimas():
+        try:
+            nombre_empresa_normalizado = normalizar_nombre_empresa(datos.get("nombre_empresa", "empresa_desconocida"))
+            if registro.eliminada(nombre_empresa_normalizado, datos.get("numero_factura")):
+                eliminadas += 1
+                continue
+            if datos.get("productos"):
+                normalizar_productos_factura(datos["productos"], usar_ia=False, nombre_empresa_normalizado=nombre_empresa_normalizado)
+            if guardar_datos_en_bd(nombre_empresa_normalizado, datos):
+                insertadas += 1
+            else:
+                omitidas += 1
+        except Exception as e:
+            errores += 1
+            logging.error(f"❌ Error al reconstruir la extracción {hash_txt[:12]}: {e}")
+
+    for nombre_bd in sorted(os.listdir(CARPETA_BASES_DATOS)):
+        if nombre_bd.endswith(".db"):
+            actualizar_derivados(os.path.splitext(nombre_bd)[0])
+
+    resumen = (f"Reconstrucción completada: {insertadas} facturas insertadas, {omitidas} duplicadas, "
+               f"{eliminadas} eliminadas desde la aplicación, {errores} con error.")
+    logging.info(f"✅ {resumen}")
+    return resumen
+
+
+def reconstruir_agregados_demanda():
+    """Recalcula los agregados de demanda de todas las BD de empresa a partir de sus líneas de factura."""
+    if not os.path.isdir(CARPETA_BASES_DATOS):
+        return "No hay bases de datos de empresa."
+    bases = sorted(f for f in os.listdir(CARPETA_BASES_DATOS) if f.endswith(".db"))
+    for nombre_bd in bases:
+        with transaccion(os.path.join(CARPETA_BASES_DATOS, nombre_bd)) as conn:
+            db_manager.reconstruir_agregados(conn)
+        logging.info(f"📈 Agregados de demanda recalculados: {nombre_bd}")
+    return f"Agregados de demanda recalculados en {len(bases)} base(s) de datos."
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Procesamiento de facturas de Stock AI.")
+    parser.add_argument("--reconstruir", action="store_true",
+                        help="Regenera las BD de empresa desde la caché de extracciones, sin llamar a OpenAI.")
+    parser.add_argument("--reconstruir-agregados", action="store_true",
+                        help="Recalcula las tablas de demanda (punto de pedido) de todas las BD de empresa.")
+    parser.add_argument("--vigilar", action="store_true",
+                        help="Vigila la carpeta de facturas y procesa cada PDF nuevo en cuanto termina de escribirse.")
+    parser.add_argument("--concurrencia", type=int, default=None,
+                        help="Número máximo de facturas procesadas en paralelo.")
+    args = parser.parse_args()
+    configurar_proceso()
+
+    if args.reconstruir:
+        print(reconstruir_bases_desde_cache())
+    elif args.reconstruir_agregados:
+        print(reconstruir_agregados_demanda())
+    elif args.vigilar:
+        import cola_trabajos
+        from vigilante_facturas import VigilanteFacturas
+
+        cola = cola_trabajos.obtener_cola()
+        VigilanteFacturas(CARPETA_FACTURAS, al_detectar=cola.encolar).iniciar()
+        cola_trabajos.ejecutar_trabajador(args.concurrencia)
+    else:
+        print(procesar_facturas_en_carpeta(args.concurrencia))
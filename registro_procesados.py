@@ -0,0 +1,133 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Configuración
+CARPETA_CACHE = "data/cache"
+RUTA_REGISTRO = os.path.join(CARPETA_CACHE, "registro_procesados.db")
+
+TIPO_PDF = "pdf"
+TIPO_TEXTO = "texto"
+
+
+def hash_bytes(contenido):
+    """SHA-256 de los bytes del PDF."""
+    return hashlib.sha256(contenido).hexdigest()
+
+def hash_texto(texto):
+    """SHA-256 del texto extraído, ignorando diferencias de espacios y mayúsculas."""
+    normalizado = re.sub(r"\s+", " ", texto or "").strip().lower()
+    return hashlib.sha256(normalizado.encode("utf-8")).hexdigest()
+
+
+class RegistroProcesados:
+    """
+    Registro de documentos ya procesados, indexado por el hash de los bytes del PDF y por el hash de su texto.
+    Guarda la empresa (BD) y el número de factura que produjo cada hash, para poder omitir un documento
+    conocido antes de parsearlo o de llamar a OpenAI.
+    """
+
+    def __init__(self, ruta_bd=RUTA_REGISTRO):
+        carpeta = os.path.dirname(ruta_bd)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta_bd, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documentos_procesados (
+                hash TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                empresa TEXT NOT NULL,
+                numero_factura TEXT,
+                archivo TEXT,
+                procesado REAL NOT NULL,
+                PRIMARY KEY (hash, tipo)
+            );
+        """)
+        # Facturas eliminadas a mano: la reconstrucción desde la caché no las vuelve a insertar
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS facturas_eliminadas (
+                empresa TEXT NOT NULL,
+                numero_factura TEXT NOT NULL,
+                eliminada REAL NOT NULL,
+                PRIMARY KEY (empresa, numero_factura)
+            );
+        """)
+        self._conn.commit()
+
+    def buscar(self, hash_valor, tipo):
+        """Devuelve {'empresa', 'numero_factura', 'archivo', 'procesado'} si el hash ya se procesó, si no None."""
+        if not hash_valor:
+            return None
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT empresa, numero_factura, archivo, procesado FROM documentos_procesados WHERE hash = ? AND tipo = ?",
+                (hash_valor, tipo)
+            ).fetchone()
+        if fila is None:
+            return None
+        return {"empresa": fila[0], "numero_factura": fila[1], "archivo": fila[2], "procesado": fila[3]}
+
+    def registrar(self, empresa, numero_factura, archivo, hash_pdf=None, hash_txt=None):
+        ahora = time.time()
+        filas = [(h, tipo, empresa, str(numero_factura), archivo, ahora)
+                 for h, tipo in ((hash_pdf, TIPO_PDF), (hash_txt, TIPO_TEXTO)) if h]
+        with self._lock:
+            self._conn.executemany("""
+                INSERT OR REPLACE INTO documentos_procesados (hash, tipo, empresa, numero_factura, archivo, procesado)
+                VALUES (?, ?, ?, ?, ?, ?);
+            """, filas)
+            # Volver a subir una factura eliminada la recupera también para las reconstrucciones
+            self._conn.execute("DELETE FROM facturas_eliminadas WHERE empresa = ? AND numero_factura = ?",
+                               (empresa, str(numero_factura)))
+            self._conn.commit()
+
+    def olvidar(self, empresa, numero_factura):
+        """
+        Borra los hashes de una factura eliminada de la BD de su empresa, para que el mismo documento
+        se pueda volver a subir, y la marca como eliminada (ver eliminada). Devuelve el número de hashes borrados.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM documentos_procesados WHERE empresa = ? AND numero_factura = ?",
+                (empresa, str(numero_factura))
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO facturas_eliminadas (empresa, numero_factura, eliminada) VALUES (?, ?, ?)",
+                (empresa, str(numero_factura), time.time())
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def eliminada(self, empresa, numero_factura):
+        """True si la factura se eliminó de la BD de su empresa y no se ha vuelto a subir."""
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT 1 FROM facturas_eliminadas WHERE empresa = ? AND numero_factura = ?",
+                (empresa, str(numero_factura))
+            ).fetchone()
+        return fila is not None
+
+    def ingestas_por_dia(self, desde):
+        """Facturas registradas desde el instante `desde` (segundos epoch), por día y empresa: [(dia, empresa, n)]."""
+        with self._lock:
+            return self._conn.execute("""
+                SELECT date(procesado, 'unixepoch', 'localtime') AS dia, empresa, COUNT(DISTINCT numero_factura)
+                FROM documentos_procesados WHERE procesado >= ?
+                GROUP BY dia, empresa ORDER BY dia
+            """, (desde,)).fetchall()
+
+
+_registro = None
+_registro_lock = threading.Lock()
+
+def obtener_registro():
+    """Devuelve el registro compartido del proceso (se abre en el primer uso)."""
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            _registro = RegistroProcesados()
+        return _registro
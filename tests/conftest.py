@@ -0,0 +1,58 @@
+"""Configuración de pytest: los módulos de la aplicación se importan desde la raíz del repositorio."""
+import os
+import sys
+
+import pytest
+
+RAIZ_REPOSITORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if RAIZ_REPOSITORIO not in sys.path:
+    sys.path.insert(0, RAIZ_REPOSITORIO)
+
+import db_manager  # noqa: E402
+
+
+@pytest.fixture
+def empresa(tmp_path, monkeypatch):
+    """(nombre, ruta de la BD) de una empresa con la BD recién creada; las rutas data/ quedan en tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    nombre = f"empresa_{tmp_path.name}"
+    db_path = db_manager.asegurar_esquema(db_manager.ruta_bd_empresa(nombre))
+    yield nombre, db_path
+    db_manager.cerrar_conexiones()
+
+@pytest.fixture
+def registro(tmp_path, monkeypatch):
+    """Registro de procesados propio del test en lugar del compartido del proceso."""
+    import registro_procesados
+
+    nuevo = registro_procesados.RegistroProcesados(str(tmp_path / "registro_procesados.db"))
+    monkeypatch.setattr(registro_procesados, "_registro", nuevo)
+    return nuevo
+
+@pytest.fixture
+def cache_normalizacion(tmp_path, monkeypatch):
+    """Caché de normalizaciones propia del test en lugar de la compartida del proceso."""
+    import cache_ia
+
+    nueva = cache_ia.CacheNormalizacion(str(tmp_path / "normalizacion_productos.db"))
+    monkeypatch.setattr(cache_ia, "_cache_normalizacion", nueva)
+    return nueva
+
+@pytest.fixture
+def plantillas(tmp_path, monkeypatch):
+    """Almacén de plantillas de proveedor propio del test en lugar del compartido del proceso."""
+    import plantillas_proveedor
+
+    nuevo = plantillas_proveedor.AlmacenPlantillas(str(tmp_path / "plantillas"))
+    monkeypatch.setattr(plantillas_proveedor, "_almacen", nuevo)
+    return nuevo
+
+@pytest.fixture
+def cache_extracciones(tmp_path, monkeypatch):
+    """Caché de extracciones propia del test en lugar de la compartida del proceso."""
+    import cache_ia
+
+    nueva = cache_ia.CacheExtracciones(str(tmp_path / "extracciones.db"))
+    monkeypatch.setattr(cache_ia, "_cache_extracciones", nueva)
+    return nueva
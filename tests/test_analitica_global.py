@@ -0,0 +1,84 @@
+"""Vista global de administración (analitica_global.py): resúmenes por BD, alertas y recálculo incremental."""
+import os
+import sqlite3
+
+import pytest
+
+import analitica_global
+import db_manager
+from test_db_manager import _bd_plana
+
+HOY = "2024-06-30"
+
+
+@pytest.fixture
+def carpeta(tmp_path, monkeypatch, registro):
+    monkeypatch.setattr(analitica_global, "_cache", {})
+    carpeta = tmp_path / "bases_datos"
+    carpeta.mkdir()
+    yield str(carpeta)
+    db_manager.cerrar_conexiones()
+
+def _empresa(carpeta, nombre, facturas):
+    db_path = db_manager.inicializar_bd(os.path.join(carpeta, f"{nombre}.db"))
+    with db_manager.transaccion(db_path) as conn:
+        for numero, fecha, lineas in facturas:
+            db_manager.insertar_factura(conn, numero, fecha, sum(l[3] for l in lineas), lineas)
+    return db_path
+
+
+def test_totales_y_alertas_por_empresa(carpeta):
+    # Guantes cada 10 días, el último hace 8: con 5 días de reposición toca pedir
+    _empresa(carpeta, "clinica", [
+        (f"C-{n}", fecha, [("guante", 10.0, 1.0, 10.0)]) for n, fecha in enumerate(["2024-06-02", "2024-06-12", "2024-06-22"])])
+    _empresa(carpeta, "taller", [("T-1", "2024-01-10", [("aceite", 2.0, 5.0, 10.0), ("filtro", 1.0, None, 4.0)])])
+
+    resumen = analitica_global.resumen_global(tiempo_reposicion=5, hoy=HOY, carpeta=carpeta)
+    por_empresa = {e["empresa"]: e for e in resumen["empresas"]}
+    assert (por_empresa["clinica"]["facturas"], por_empresa["clinica"]["gasto_reciente"]) == (3, 30.0)
+    assert (por_empresa["taller"]["facturas_recientes"], por_empresa["taller"]["incidencias"]) == (0, 1)
+    assert [(a["empresa"], a["producto"], a["dias_sin_compra"]) for a in resumen["alertas"]] == [("clinica", "guante", 8)]
+    assert resumen["totales"]["facturas"] == 4 and resumen["totales"]["empresas"] == 2
+
+def test_solo_se_recalculan_las_bd_modificadas(carpeta):
+    clinica = _empresa(carpeta, "clinica", [("C-1", "2024-06-02", [("guante", 10.0, 1.0, 10.0)])])
+    _empresa(carpeta, "taller", [("T-1", "2024-06-10", [("aceite", 2.0, 5.0, 10.0)])])
+    assert analitica_global.resumen_global(5, HOY, carpeta)["recalculadas"] == 2
+    assert analitica_global.resumen_global(5, HOY, carpeta)["recalculadas"] == 0
+
+    with db_manager.transaccion(clinica) as conn:
+        db_manager.insertar_factura(conn, "C-2", "2024-06-20", 5.0, [("bata", 1.0, 5.0, 5.0)])
+    resumen = analitica_global.resumen_global(5, HOY, carpeta)
+    assert resumen["recalculadas"] == 1 and resumen["totales"]["facturas"] == 3
+    # Otro día cambian las alertas: se recalcula todo
+    assert analitica_global.resumen_global(5, "2024-07-01", carpeta)["recalculadas"] == 2
+
+def test_bd_sin_migrar_no_se_modifica(carpeta):
+    antigua = _bd_plana(os.path.join(carpeta, "antigua.db"), [(1, "A-1", "15/03/2024", "guante", 10, 2.0, 20.0, 20.0)])
+    _empresa(carpeta, "clinica", [("C-1", "2024-06-02", [("guante", 10.0, 1.0, 10.0)])])
+    with open(antigua, "rb") as f:
+        contenido = f.read()
+
+    resumen = analitica_global.resumen_global(5, HOY, carpeta)
+    error, = [e for e in resumen["empresas"] if "error" in e]
+    assert error["empresa"] == "antigua" and "v0" in error["error"]
+    assert resumen["totales"]["empresas"] == 2 and resumen["totales"]["facturas"] == 1
+    with open(antigua, "rb") as f:
+        assert f.read() == contenido
+    with sqlite3.connect(antigua) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+
+def test_pool_de_procesos_da_lo_mismo(carpeta, monkeypatch):
+    for n in range(3):
+        _empresa(carpeta, f"empresa_{n}", [(f"F-{n}", f"2024-06-0{n + 1}", [("guante", n + 1.0, 1.0, n + 1.0)])])
+    secuencial = analitica_global.resumen_global(5, HOY, carpeta)
+
+    monkeypatch.setattr(analitica_global, "_cache", {})
+    monkeypatch.setattr(analitica_global, "UMBRAL_BASES_PARALELO", 1)
+    monkeypatch.setattr(analitica_global, "MAX_PROCESOS_ANALITICA", 2)
+    monkeypatch.setattr(analitica_global, "_pool_procesos", None)
+    try:
+        paralelo = analitica_global.resumen_global(5, HOY, carpeta)
+    finally:
+        analitica_global._pool_procesos.shutdown()
+    assert paralelo == secuencial
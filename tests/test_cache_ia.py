@@ -0,0 +1,73 @@
+"""Caché de normalizaciones (cache_ia.py): una entrada por nombre y versión de prompt."""
+import cache_ia
+
+
+def test_cada_version_tiene_sus_entradas(cache_normalizacion):
+    cache_normalizacion.guardar("Guantes látex M", "v1", "guante de látex")
+    assert cache_normalizacion.obtener("Guantes látex M", "v1") == "guante de látex"
+    assert cache_normalizacion.obtener("Guantes látex M", "v2") is None
+
+def test_obtener_alguna_respeta_el_orden(tmp_path):
+    ruta = str(tmp_path / "cache.db")
+    cache = cache_ia.CacheNormalizacion(ruta)
+    cache.guardar("Guantes", "extraccion-v2", "guantes")
+    assert cache.obtener_alguna("Guantes", ("v1", "extraccion-v2")) == "guantes"
+    cache.guardar("Guantes", "v1", "guante")
+    assert cache.obtener_alguna("Guantes", ("v1", "extraccion-v2")) == "guante"
+
+    # Igual desde disco, sin la capa en memoria
+    desde_disco = cache_ia.CacheNormalizacion(ruta)
+    assert desde_disco.obtener_alguna("Guantes", ("v1", "extraccion-v2")) == "guante"
+    assert desde_disco.obtener_alguna("Guantes", ("extraccion-v2", "v1")) == "guantes"
+    assert desde_disco.obtener_alguna("Guantes", ("v9",)) is None
+    assert (desde_disco.hits_disco, desde_disco.hits_memoria, desde_disco.misses) == (1, 1, 1)
+
+def test_entradas_caducadas(tmp_path):
+    cache = cache_ia.CacheNormalizacion(str(tmp_path / "cache.db"), max_edad_dias=0)
+    cache.guardar("Guantes", "v1", "guante")
+    cache._memoria.clear()
+    assert cache.obtener_alguna("Guantes", ("v1",)) is None
+
+def test_persiste_entre_procesos(tmp_path):
+    ruta = str(tmp_path / "cache.db")
+    cache_ia.CacheNormalizacion(ruta).guardar("Guantes", "v1", "guante")
+    nueva = cache_ia.CacheNormalizacion(ruta)
+    assert nueva.obtener("Guantes", "v1") == "guante"
+    assert nueva.hits_disco == 1
+
+def test_memoria_acotada_lru(tmp_path):
+    cache = cache_ia.CacheNormalizacion(str(tmp_path / "cache.db"), max_memoria=2)
+    for nombre in ("a", "b", "c"):
+        cache.guardar(nombre, "v1", nombre.upper())
+        cache.obtener(nombre, "v1")
+    cache.obtener("b", "v1")
+    cache.obtener("d", "v1")
+    assert list(cache._memoria) == ["c", "b"]
+    assert cache.estadisticas()["entradas_memoria"] == 2
+
+def test_expulsion_en_disco_de_las_menos_usadas(tmp_path, monkeypatch):
+    reloj = iter(range(1_000_000_000, 1_000_000_100))
+    monkeypatch.setattr(cache_ia.time, "time", lambda: next(reloj))
+    cache = cache_ia.CacheNormalizacion(str(tmp_path / "cache.db"), max_entradas=2)
+    cache.guardar("a", "v1", "A")
+    cache.guardar("b", "v1", "B")
+    cache._memoria.clear()
+    assert cache.obtener("a", "v1") == "A"  # "a" pasa a ser la más reciente
+    cache.guardar("c", "v1", "C")
+
+    assert cache.purgar() == 1
+    cache._memoria.clear()
+    assert cache.obtener("b", "v1") is None
+    assert (cache.obtener("a", "v1"), cache.obtener("c", "v1")) == ("A", "C")
+
+def test_extracciones_la_ultima_de_cada_documento(cache_extracciones, monkeypatch):
+    reloj = iter(range(1_000_000_000, 1_000_000_100))
+    monkeypatch.setattr(cache_ia.time, "time", lambda: next(reloj))
+    cache_extracciones.guardar("texto-a", "gpt-4", "v1", {"numero_factura": "A", "version": 1})
+    cache_extracciones.guardar("texto-b", "gpt-4", "v1", {"numero_factura": "B"})
+    cache_extracciones.guardar("texto-a", "gpt-4", "v2", {"numero_factura": "A", "version": 2})
+
+    assert cache_extracciones.obtener("texto-a", "gpt-4", "v1") == {"numero_factura": "A", "version": 1}
+    assert cache_extracciones.obtener("texto-a", "gpt-3.5-turbo", "v1") is None
+    assert list(cache_extracciones.iterar_ultimas()) == [
+        ("texto-b", {"numero_factura": "B"}), ("texto-a", {"numero_factura": "A", "version": 2})]
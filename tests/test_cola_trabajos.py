@@ -0,0 +1,62 @@
+"""Cola duradera de facturas (cola_trabajos.py): orden, leases y reintentos."""
+import contextlib
+
+import pytest
+
+import cola_trabajos
+
+
+@pytest.fixture
+def cola(tmp_path):
+    return cola_trabajos.ColaTrabajos(str(tmp_path / "cola.db"))
+
+
+def test_interactivas_primero_y_sin_duplicados(cola):
+    assert cola.encolar("a.pdf") is not None
+    assert cola.encolar("a.pdf") is None
+    cola.encolar("b.pdf", prioridad=cola_trabajos.PRIORIDAD_INTERACTIVA)
+    # Subir de nuevo un PDF pendiente del lote lo adelanta
+    cola.encolar("c.pdf")
+    cola.encolar("c.pdf", prioridad=cola_trabajos.PRIORIDAD_INTERACTIVA)
+
+    orden = [cola.reclamar("t")["ruta"] for _ in range(3)]
+    assert orden == ["b.pdf", "c.pdf", "a.pdf"]
+    assert cola.reclamar("t") is None
+    assert cola.progreso()[cola_trabajos.EN_CURSO] == 3
+
+def test_lease_vencido_lo_reclama_otro_y_el_primero_no_puede_cerrarlo(cola):
+    cola.encolar("a.pdf")
+    primero = cola.reclamar("t1", duracion_lease=-1)
+    segundo = cola.reclamar("t2")
+    assert segundo["id"] == primero["id"] and segundo["intentos"] == 2
+
+    assert cola.completar(primero["id"], "t1", "resultado tardío") is False
+    assert cola.fallar(primero["id"], "t1", "error tardío") is None
+    assert cola.completar(segundo["id"], "t2", "✅") is True
+    assert cola.recientes()[0]["resultado"] == "✅"
+
+def test_reintentos_con_espera_hasta_agotarlos(cola, monkeypatch):
+    monkeypatch.setattr(cola_trabajos, "ESPERA_REINTENTO_SEGUNDOS", 0)
+    cola.encolar("a.pdf", max_intentos=2)
+    trabajo = cola.reclamar("t")
+    assert cola.fallar(trabajo["id"], "t", "fallo 1") == cola_trabajos.PENDIENTE
+    trabajo = cola.reclamar("t")
+    assert cola.fallar(trabajo["id"], "t", "fallo 2") == cola_trabajos.FALLIDO
+    assert cola.reclamar("t") is None
+    assert cola.recientes()[0]["error"] == "fallo 2"
+
+def test_resultado_descartado_si_se_pierde_el_lease(cola, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # las métricas de la ingesta se escriben en data/metricas
+    ruta = tmp_path / "a.pdf"
+    ruta.write_bytes(b"%PDF")
+    cola.encolar(str(ruta))
+    trabajo = cola.reclamar("t1")
+
+    def procesar(ruta_pdf, lanzar_errores):
+        # Mientras tanto, el lease de t1 caduca y otro trabajador reclama el trabajo
+        with cola._lock:
+            cola._conn.execute("UPDATE trabajos SET trabajador = 't2'")
+        return "✅"
+
+    cola_trabajos._procesar_trabajo(cola, trabajo, "t1", procesar, lambda prioridad: contextlib.nullcontext())
+    assert cola.progreso()[cola_trabajos.EN_CURSO] == 1
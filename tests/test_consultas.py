@@ -0,0 +1,18 @@
+"""Consultas de la pestaña de histórico (consultas.py)."""
+import db_manager
+import consultas
+
+
+def test_linea_existe_respeta_los_filtros_de_la_tabla(empresa):
+    nombre, db_path = empresa
+    with db_manager.transaccion(db_path) as conn:
+        db_manager.insertar_factura(conn, "F-1", "2024-01-15", 10.0, [("tornillos", 10.0, 1.0, 10.0)])
+        db_manager.insertar_factura(conn, "F-2", "2024-06-15", 5.0, [("tuercas", 5.0, 1.0, 5.0)])
+        ids = dict(conn.execute("""SELECT p.nombre, l.id FROM lineas_factura l
+                                   JOIN productos p ON p.id = l.producto_id""").fetchall())
+
+    assert consultas.linea_existe(nombre, ids["tornillos"])
+    assert consultas.linea_existe(nombre, ids["tornillos"], "2024-01-01", "2024-01-31", "tornillos")
+    assert not consultas.linea_existe(nombre, ids["tornillos"], "2024-06-01", "2024-06-30")
+    assert not consultas.linea_existe(nombre, ids["tornillos"], producto="tuercas")
+    assert not consultas.linea_existe(nombre, max(ids.values()) + 1)
@@ -0,0 +1,135 @@
+"""Esquema de las BD de empresa (db_manager.py): migraciones desde la tabla plana y altas de facturas."""
+import sqlite3
+
+import pytest
+
+import db_manager
+
+
+def _bd_plana(ruta, filas):
+    """BD con la tabla plana 'facturas' del esquema original (versión 0)."""
+    conn = sqlite3.connect(ruta)
+    conn.execute("""
+        CREATE TABLE facturas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero_factura TEXT,
+            fecha_emision TEXT,
+            nombre_producto TEXT,
+            cantidad INTEGER,
+            precio_unitario REAL,
+            total_producto REAL,
+            total_factura REAL
+        )
+    """)
+    conn.executemany("""
+        INSERT INTO facturas (id, numero_factura, fecha_emision, nombre_producto, cantidad, precio_unitario,
+                              total_producto, total_factura)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, filas)
+    conn.commit()
+    conn.close()
+    return ruta
+
+
+@pytest.fixture
+def bd_plana(tmp_path):
+    return _bd_plana(str(tmp_path / "plana.db"), [
+        (3, "F-1", "15/03/2024", "guante", 10, 2.0, 20.0, 35.0),
+        (7, "F-1", "15/03/2024", "bata", 5, 3.0, 15.0, 35.0),
+        (9, "F-2", "2024-04-01", "guante", 4, 2.0, 8.0, 8.0),
+    ])
+
+def test_migracion_desde_la_tabla_plana(bd_plana):
+    db_manager.inicializar_bd(bd_plana)
+    conn = sqlite3.connect(bd_plana)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == db_manager.VERSION_ESQUEMA
+    assert conn.execute("SELECT COUNT(*) FROM cabeceras_factura").fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM productos").fetchone()[0] == 2
+    # La vista conserva las columnas y los ids de la tabla plana (la fecha ya en ISO)
+    assert conn.execute("SELECT * FROM facturas ORDER BY id").fetchall() == [
+        (3, "F-1", "2024-03-15", "guante", 10, 2.0, 20.0, 35.0),
+        (7, "F-1", "2024-03-15", "bata", 5, 3.0, 15.0, 35.0),
+        (9, "F-2", "2024-04-01", "guante", 4, 2.0, 8.0, 8.0),
+    ]
+    indices = {fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_lineas_factura", "idx_lineas_producto", "idx_cabeceras_fecha_iso"} <= indices
+    conn.close()
+
+def test_migrar_dos_veces_no_cambia_nada(bd_plana):
+    db_manager.inicializar_bd(bd_plana)
+    with sqlite3.connect(bd_plana) as conn:
+        antes = conn.execute("SELECT * FROM facturas ORDER BY id").fetchall()
+    db_manager.inicializar_bd(bd_plana)
+    with sqlite3.connect(bd_plana) as conn:
+        assert conn.execute("SELECT * FROM facturas ORDER BY id").fetchall() == antes
+
+def test_factura_repetida_no_se_inserta(empresa):
+    _, db_path = empresa
+    with db_manager.transaccion(db_path) as conn:
+        assert db_manager.insertar_factura(conn, "F-1", "2024-01-15", 10.0, [("guante", 5.0, 2.0, 10.0)])
+        assert not db_manager.insertar_factura(conn, "F-1", "2024-02-01", 99.0, [("bata", 1.0, 1.0, 1.0)])
+        assert conn.execute("SELECT nombre_producto FROM facturas").fetchall() == [("guante",)]
+
+
+def _agregados(conn):
+    return (conn.execute("SELECT * FROM demanda_diaria ORDER BY producto_id, fecha").fetchall(),
+            conn.execute("SELECT * FROM demanda_producto ORDER BY producto_id").fetchall())
+
+def test_agregados_al_insertar_y_eliminar_como_recalculados(empresa):
+    _, db_path = empresa
+    with db_manager.transaccion(db_path) as conn:
+        db_manager.insertar_factura(conn, "F-1", "2024-01-15", 35.0, [("guante", 10.0, 2.0, 20.0), ("bata", 5.0, 3.0, 15.0)])
+        db_manager.insertar_factura(conn, "F-2", "2024-01-15", 8.0, [("guante", 4.0, 2.0, 8.0)])
+        db_manager.insertar_factura(conn, "F-3", "2024-02-01", 2.0, [("guante", 1.0, 2.0, 2.0), ("guante", None, 2.0, 2.0)])
+        db_manager.insertar_factura(conn, "F-4", "sin fecha", 2.0, [("bata", 1.0, 2.0, 2.0)])
+        db_manager.eliminar_linea(conn, conn.execute(
+            "SELECT id FROM facturas WHERE numero_factura = 'F-1' AND nombre_producto = 'bata'").fetchone()[0])
+        incrementales = _agregados(conn)
+        db_manager.reconstruir_agregados(conn)
+        assert _agregados(conn) == incrementales
+        guante = conn.execute("SELECT id FROM productos WHERE nombre = 'guante'").fetchone()[0]
+
+    diaria, por_producto = incrementales
+    assert diaria == [(guante, "2024-01-15", 14.0, 2), (guante, "2024-02-01", 1.0, 1)]
+    assert por_producto == [(guante, "2024-01-15", "2024-02-01", 15.0, 2)]
+
+def test_eliminar_la_ultima_linea_elimina_la_cabecera(empresa):
+    _, db_path = empresa
+    with db_manager.transaccion(db_path) as conn:
+        db_manager.insertar_factura(conn, "F-1", "2024-01-15", 20.0, [("guante", 10.0, 2.0, 20.0)])
+        linea_id = conn.execute("SELECT id FROM lineas_factura").fetchone()[0]
+        assert db_manager.eliminar_linea(conn, linea_id)
+        assert not db_manager.eliminar_linea(conn, linea_id)
+        assert not db_manager.factura_existe(conn, "F-1")
+        assert _agregados(conn) == ([], [])
+
+def test_la_vista_facturas_es_de_solo_lectura(empresa):
+    # Un DELETE sobre la vista no pasaría por los agregados: las bajas van por eliminar_linea
+    _, db_path = empresa
+    with db_manager.transaccion(db_path) as conn:
+        db_manager.insertar_factura(conn, "F-1", "2024-01-15", 20.0, [("guante", 10.0, 2.0, 20.0)])
+    with pytest.raises(sqlite3.OperationalError):
+        with db_manager.transaccion(db_path) as conn:
+            conn.execute("DELETE FROM facturas")
+
+def test_migracion_v5_convierte_importes_y_fechas_en_texto(tmp_path):
+    ruta = _bd_plana(str(tmp_path / "texto.db"), [
+        (1, "F-1", "15/03/2024", "guante", "10 unidades", "2,50", "25,00", "1.234,50"),
+        (2, "F-2", "fecha ilegible", "bata", "5", "3", "15", "sin total"),
+        (3, "F-3", "2024-04-01", "gel", "muchos", "1,5", "3,00", 3),
+    ])
+    db_manager.inicializar_bd(ruta)
+    conn = sqlite3.connect(ruta)
+    cabeceras = conn.execute("""SELECT numero_factura, fecha, total_factura, typeof(total_factura), incidencias
+                                FROM cabeceras_factura ORDER BY numero_factura""").fetchall()
+    assert cabeceras == [
+        ("F-1", "2024-03-15", 1234.5, "real", None),
+        ("F-2", None, None, "null", "fecha,total"),
+        ("F-3", "2024-04-01", 3.0, "real", None),
+    ]
+    lineas = conn.execute("""SELECT id, cantidad, precio_unitario, total_producto, incidencias
+                             FROM lineas_factura ORDER BY id""").fetchall()
+    assert lineas == [(1, 10.0, 2.5, 25.0, None), (2, 5.0, 3.0, 15.0, None), (3, None, 1.5, 3.0, "cantidad")]
+    # Los agregados solo cuentan las líneas con fecha y cantidad
+    assert conn.execute("SELECT fecha, unidades FROM demanda_diaria").fetchall() == [("2024-03-15", 10.0)]
+    conn.close()
@@ -0,0 +1,73 @@
+"""Dependencias entre módulos: cada uno importa solo lo que necesita (se comprueba en un intérprete nuevo)."""
+import os
+import json
+import subprocess
+import sys
+
+import pytest
+
+from conftest import RAIZ_REPOSITORIO
+
+
+def _modulos_cargados(modulo):
+    """Módulos del repositorio que quedan cargados después de importar `modulo`."""
+    codigo = (f"import sys, {modulo}; "
+              f"print('\\n'.join(n for n, m in sys.modules.items() if (getattr(m, '__file__', None) or '').startswith({RAIZ_REPOSITORIO!r})))")
+    salida = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ_REPOSITORIO, capture_output=True, text=True, check=True)
+    return set(salida.stdout.split())
+
+_EFECTOS = """
+import os, sys, json, logging, importlib
+for modulo in {modulos!r}:
+    importlib.import_module(modulo)
+print(json.dumps({{
+    "archivos": sorted(os.listdir(".")),
+    "logging_configurado": bool(logging.getLogger().handlers),
+    "env_cargado": "STOCKAI_PRUEBA_ENV" in os.environ,
+    "modulos": sorted(sys.modules),
+}}))
+"""
+
+def _efectos_de_importar(modulos, carpeta):
+    """Importa `modulos` en un intérprete nuevo con `carpeta` (que tiene un .env) como carpeta de trabajo."""
+    (carpeta / ".env").write_text("STOCKAI_PRUEBA_ENV=1\n")
+    entorno = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [RAIZ_REPOSITORIO, os.environ.get("PYTHONPATH")])))
+    entorno.pop("STOCKAI_PRUEBA_ENV", None)
+    salida = subprocess.run([sys.executable, "-c", _EFECTOS.format(modulos=modulos)], cwd=carpeta, env=entorno,
+                            capture_output=True, text=True, check=True)
+    return json.loads(salida.stdout)
+
+
+def test_el_planificador_no_carga_la_cola():
+    assert "cola_trabajos" not in _modulos_cargados("planificador_llm")
+
+def test_la_cola_y_el_planificador_comparten_prioridades():
+    import cola_trabajos
+    import planificador_llm
+
+    assert cola_trabajos.PRIORIDAD_LOTE == planificador_llm.prioridad_llm.get()
+    assert cola_trabajos.PRIORIDAD_INTERACTIVA < cola_trabajos.PRIORIDAD_LOTE
+
+def test_los_procesos_de_extraccion_solo_cargan_extraccion_pdf():
+    # Los procesos "spawn" del pool importan extraccion_pdf para ejecutar _texto_paginas
+    pytest.importorskip("fitz")
+    assert _modulos_cargados("extraccion_pdf") == {"extraccion_pdf"}
+
+@pytest.mark.parametrize("modulos", [
+    ["db_manager", "consultas", "punto_pedido", "registro_procesados"],
+    ["cola_trabajos", "vigilante_facturas", "metricas", "analitica_global"],
+    ["read_invoice"],
+])
+def test_importar_no_tiene_efectos_secundarios(modulos, tmp_path):
+    if "read_invoice" in modulos:
+        pytest.importorskip("fitz")
+    efectos = _efectos_de_importar(modulos, tmp_path)
+    assert efectos["archivos"] == [".env"]  # ni carpetas data/ ni BD
+    assert not efectos["logging_configurado"]
+    assert not efectos["env_cargado"]
+
+def test_el_dashboard_no_carga_la_ingesta(tmp_path):
+    cargados = set(_efectos_de_importar(["db_manager", "consultas", "punto_pedido", "registro_procesados"], tmp_path)["modulos"])
+    assert not cargados & {"read_invoice", "cola_trabajos", "vigilante_facturas", "metricas", "openai", "fitz"}
+    # El servidor de métricas solo se importa al arrancarlo
+    assert "http.server" not in _efectos_de_importar(["metricas"], tmp_path)["modulos"]
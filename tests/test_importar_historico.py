@@ -0,0 +1,58 @@
+"""Importación masiva (importar_historico.py): facturas ya guardadas con otro PDF."""
+import pytest
+
+import db_manager
+
+pytest.importorskip("fitz")
+import importar_historico  # noqa: E402
+
+
+@pytest.fixture
+def extraccion(monkeypatch):
+    """Sustituye la extracción con IA por unos datos fijos y anota las normalizaciones pedidas."""
+    normalizadas = []
+    datos = {}
+    monkeypatch.setattr(importar_historico, "extraer_texto_pdf", lambda contenido: contenido.decode())
+    monkeypatch.setattr(importar_historico, "extraer_datos_factura", lambda texto: {**datos, "productos": [
+        {"nombre_producto": "Guantes", "cantidad": "2", "precio_unitario": "1", "total_por_producto": "2"}]})
+
+    def normalizar(productos, **kwargs):
+        normalizadas.append(productos)
+        for producto in productos:
+            producto["nombre_normalizado"] = producto["nombre_producto"].lower()
+
+    monkeypatch.setattr(importar_historico, "normalizar_productos_factura", normalizar)
+    return datos, normalizadas
+
+def _pdf(tmp_path, nombre, texto):
+    ruta = tmp_path / nombre
+    ruta.write_bytes(texto.encode())
+    return str(ruta)
+
+
+def test_numero_de_factura_existente_se_omite_sin_normalizar(empresa, registro, extraccion, tmp_path):
+    nombre, db_path = empresa
+    datos, normalizadas = extraccion
+    with db_manager.transaccion(db_path) as conn:
+        db_manager.insertar_factura(conn, "F-1", "2024-01-01", 2.0, [("guante", 2.0, 1.0, 2.0)])
+    datos.update(nombre_empresa=nombre, numero_factura="F-1")
+
+    resultado = importar_historico._preparar(_pdf(tmp_path, "copia.pdf", "factura F-1 escaneada otra vez"))
+    assert resultado["estado"] == importar_historico.OMITIDO
+    assert normalizadas == []
+
+    # Se anota en el registro: la próxima vez se omite por el hash, sin extraer
+    importar_historico._guardar_lote([resultado])
+    assert registro.buscar(resultado["hash_pdf"], "pdf")["numero_factura"] == "F-1"
+
+def test_factura_nueva_se_normaliza_y_guarda(empresa, registro, extraccion, tmp_path):
+    nombre, db_path = empresa
+    datos, normalizadas = extraccion
+    datos.update(nombre_empresa=nombre, numero_factura="F-2", fecha_emision="2024-02-01", total_factura="2")
+
+    resultado = importar_historico._preparar(_pdf(tmp_path, "nueva.pdf", "factura F-2"))
+    assert resultado["estado"] is None and len(normalizadas) == 1
+    importar_historico._guardar_lote([resultado])
+    assert resultado["estado"] == importar_historico.HECHO
+    with db_manager.conexion(db_path) as conn:
+        assert db_manager.factura_existe(conn, "F-2")
@@ -0,0 +1,56 @@
+"""Reconocimiento de variantes de un nombre de producto con el índice de trigramas (indice_productos.py)."""
+import pytest
+
+from indice_productos import IndiceProductos, plegar, distintivos
+
+
+def _indice(*canonicos):
+    indice = IndiceProductos()
+    for canonico in canonicos:
+        indice.anadir(canonico)
+    return indice
+
+
+@pytest.mark.parametrize("variante", ["GUANTES LÁTEX", "Guantes de latex", "guante  latex."])
+def test_variantes_del_mismo_producto(variante):
+    assert _indice("Guante de látex").buscar(variante) == ("Guante de látex", 1.0)
+
+def test_variante_con_errata():
+    encontrado = _indice("Papel higiénico doble capa").buscar("Papel higienico dobel capa")
+    assert encontrado is not None and encontrado[0] == "Papel higiénico doble capa"
+
+@pytest.mark.parametrize("existente, nuevo", [
+    ("Guante látex talla S", "Guante látex talla M"),
+    ("Guante látex talla M", "Guante látex talla L"),
+    ("Guante látex T-S", "Guante látex XL"),
+    ("Lejía 1L", "Lejía 5L"),
+    ("Lejía 1L", "Lejía"),
+    ("Bolsa basura 100 litros", "Bolsa basura 30 litros"),
+    ("Mascarilla FFP2", "Mascarilla FFP3"),
+])
+def test_medidas_y_tallas_distintas_no_se_mezclan(existente, nuevo):
+    assert _indice(existente).buscar(nuevo) is None
+
+@pytest.mark.parametrize("existente, nuevo", [
+    ("Guante látex talla M", "GUANTES LATEX T-M"),
+    ("Lejía 1L", "lejia 1 litro"),
+    ("Gel hidroalcohólico 1,5 l", "Gel hidroalcoholico 1.5L"),
+])
+def test_misma_medida_escrita_de_otra_forma(existente, nuevo):
+    assert _indice(existente).buscar(nuevo) == (existente, 1.0)
+
+def test_tallas_quedan_separadas_en_el_indice():
+    indice = _indice("Guante nitrilo talla S", "Guante nitrilo talla M", "Guante nitrilo talla L")
+    for talla in "SML":
+        assert indice.buscar(f"guantes de nitrilo t-{talla}") == (f"Guante nitrilo talla {talla}", 1.0)
+
+def test_plegado_y_distintivos():
+    assert plegar("GUANTES LÁTEX T-M") == plegar("Guante de latex") == "guante latex"
+    assert distintivos("GUANTES LÁTEX T-M") == {"m"}
+    assert distintivos("Bolsa basura 30 litros") == {"30l"}
+    assert distintivos("Cartucho HP 305A") == {"305a"}
+
+def test_alias_apunta_al_canonico():
+    indice = IndiceProductos()
+    indice.anadir("Guante de látex", alias="GLOVES LATEX BOX")
+    assert indice.buscar("gloves latex box") == ("Guante de látex", 1.0)
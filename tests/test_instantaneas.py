@@ -0,0 +1,82 @@
+"""Instantáneas columnares (instantaneas.py): vigencia frente a la BD y páginas iguales a las de SQLite."""
+import os
+
+import pandas as pd
+import pytest
+
+import db_manager
+import consultas
+import instantaneas
+
+pytest.importorskip("pyarrow")
+
+
+def _factura(db_path, numero, fecha, lineas, total=100.0):
+    with db_manager.transaccion(db_path) as conn:
+        db_manager.insertar_factura(conn, numero, fecha, total, lineas)
+
+def _rellenar(db_path, num_facturas, prefijo="F"):
+    for n in range(num_facturas):
+        _factura(db_path, f"{prefijo}-{n}", f"2024-{n % 12 + 1:02d}-{n % 28 + 1:02d}", [
+            (f"producto {n % 5}", float(n + 1), 2.0, 2.0 * (n + 1)),
+            (f"producto {(n + 1) % 5}", None if n % 7 == 0 else 3.0, 1.5, 4.5),  # línea con incidencia
+        ])
+
+def _sin_nulos(df):
+    return df.astype(object).where(df.notna(), None)
+
+def _desde_sqlite(monkeypatch, funcion, *args):
+    with monkeypatch.context() as m:
+        m.setattr(instantaneas, "INSTANTANEAS_ACTIVAS", False)
+        return funcion(*args)
+
+
+@pytest.mark.parametrize("filtros", [
+    (None, None, None),
+    ("2024-03-01", "2024-08-31", None),
+    (None, None, "producto 2"),
+    ("2024-02-01", "2024-02-28", "producto 1"),
+    (None, None, "no existe"),
+])
+def test_paginas_iguales_que_en_sqlite(empresa, monkeypatch, filtros):
+    nombre, db_path = empresa
+    _rellenar(db_path, 60)
+    _factura(db_path, "SIN-FECHA", "fecha ilegible", [("producto 0", 1.0, 1.0, 1.0)], total=None)
+    assert instantaneas.actualizar_instantanea(nombre) is not None
+
+    for desplazamiento in (0, 7, 200):
+        obtenida = consultas.consultar_lineas(nombre, *filtros, limite=15, desplazamiento=desplazamiento)
+        esperada = _desde_sqlite(monkeypatch, consultas.consultar_lineas, nombre, *filtros, 15, desplazamiento)
+        pd.testing.assert_frame_equal(_sin_nulos(obtenida), _sin_nulos(esperada), check_dtype=False)
+    assert consultas.contar_lineas(nombre, *filtros) == _desde_sqlite(monkeypatch, consultas.contar_lineas, nombre, *filtros)
+
+def test_nueva_factura_desfasa_la_instantanea_hasta_actualizarla(empresa):
+    nombre, db_path = empresa
+    _rellenar(db_path, 10)
+    instantaneas.actualizar_instantanea(nombre)
+    _factura(db_path, "NUEVA", "2024-12-31", [("producto 9", 1.0, 1.0, 1.0)])
+
+    with db_manager.conexion(db_path) as conn:
+        assert instantaneas.leer_instantanea(nombre, conn=conn) is None
+    # Solo ha habido altas: se añade un segmento con la factura nueva
+    meta = instantaneas.actualizar_instantanea(nombre)
+    assert meta["filas"] == 21 and meta["segmentos"][-1]["ultimo_id"] == meta["ultimo_id"]
+    with db_manager.conexion(db_path) as conn:
+        assert len(instantaneas.leer_instantanea(nombre, conn=conn)) == 21
+
+def test_bd_regenerada_con_el_mismo_contador(empresa):
+    nombre, db_path = empresa
+    _rellenar(db_path, 5, prefijo="A")
+    instantaneas.actualizar_instantanea(nombre)
+
+    # Otra BD con el mismo número de altas (mismo version_datos) pero otras facturas
+    db_manager.cerrar_conexiones()
+    for sufijo in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + sufijo):
+            os.remove(db_path + sufijo)
+    db_manager.inicializar_bd(db_path)
+    _rellenar(db_path, 5, prefijo="B")
+
+    with db_manager.conexion(db_path) as conn:
+        assert instantaneas.leer_instantanea(nombre, conn=conn) is None
+    assert set(consultas.consultar_lineas(nombre, limite=100)["numero_factura"]) == {f"B-{n}" for n in range(5)}
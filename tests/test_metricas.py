@@ -0,0 +1,69 @@
+"""Métricas de la ingesta (metricas.py): mediciones por etapa, resumen y exportación a Prometheus."""
+import os
+import threading
+
+import pytest
+
+import metricas
+from metricas import medir, anotar
+
+
+@pytest.fixture(autouse=True)
+def metricas_del_test(tmp_path, monkeypatch):
+    monkeypatch.setattr(metricas, "CARPETA_METRICAS", str(tmp_path / "metricas"))
+    monkeypatch.setattr(metricas, "METRICAS_ACTIVAS", True)
+    monkeypatch.setattr(metricas, "_histogramas", {})
+    monkeypatch.setattr(metricas, "_contadores", {})
+
+
+def test_valores_anotados_en_la_medicion_en_curso():
+    anotar(tokens_entrada=100)  # sin medición en curso: se ignora
+    with medir("extraer_datos", bytes_pdf=10) as medicion:
+        anotar(tokens_entrada=3)
+        with medir("normalizar_productos"):
+            anotar(aciertos_cache=1)  # va a la medición más interna
+        anotar(tokens_entrada=2, modelo="gpt-4")
+        medicion["filas"] = 4
+
+    normalizar, extraer = metricas.leer_metricas()
+    assert normalizar["etapa"] == "normalizar_productos" and normalizar["aciertos_cache"] == 1
+    assert {k: extraer[k] for k in ("etapa", "bytes_pdf", "tokens_entrada", "modelo", "filas", "ok")} == {
+        "etapa": "extraer_datos", "bytes_pdf": 10, "tokens_entrada": 5, "modelo": "gpt-4", "filas": 4, "ok": True}
+    assert "aciertos_cache" not in extraer
+
+def test_cada_hilo_anota_en_su_medicion():
+    def otro_hilo():
+        with medir("mover_factura_procesada"):
+            anotar(filas=1)
+
+    with medir("guardar_datos_en_bd"):
+        hilo = threading.Thread(target=otro_hilo)
+        hilo.start()
+        hilo.join()
+        anotar(filas=10)
+    assert {r["etapa"]: r["filas"] for r in metricas.leer_metricas()} == {
+        "mover_factura_procesada": 1, "guardar_datos_en_bd": 10}
+
+def test_errores_resumen_y_prometheus():
+    for _ in range(3):
+        with medir("extraer_texto_pdf"):
+            anotar(caracteres=100)
+    with pytest.raises(ValueError):
+        with medir("extraer_texto_pdf"):
+            raise ValueError("PDF dañado")
+
+    fila, = metricas.resumen_por_etapa(metricas.leer_metricas())
+    assert (fila["etapa"], fila["ejecuciones"], fila["errores"], fila["caracteres"]) == ("extraer_texto_pdf", 4, 1, 300)
+    texto = metricas.exportar_prometheus()
+    assert 'stockai_etapa_segundos_count{etapa="extraer_texto_pdf"} 4' in texto
+    assert 'stockai_etapa_errores_total{etapa="extraer_texto_pdf"} 1' in texto
+    assert 'stockai_caracteres_total{etapa="extraer_texto_pdf"} 300' in texto
+
+def test_lineas_a_medio_escribir_se_ignoran():
+    with medir("procesar_factura"):
+        pass
+    nombre, = os.listdir(metricas.CARPETA_METRICAS)
+    ruta = os.path.join(metricas.CARPETA_METRICAS, nombre)
+    with open(ruta, "a", encoding="utf-8") as f:
+        f.write('{"etapa": "procesar_fac')
+    assert [r["etapa"] for r in metricas.leer_metricas()] == ["procesar_factura"]
@@ -0,0 +1,34 @@
+"""Conversión de importes y fechas de las facturas (normalizacion_datos.py y db_manager.fecha_a_iso)."""
+import math
+
+import pytest
+
+from db_manager import fecha_a_iso
+from normalizacion_datos import limpiar_numero, limpiar_numeros, incidencias_linea
+
+TEXTOS = ["1.234,50", "1,000.25", "12,5", "1.000.000", "25 €", "3 unidades", "sin importe", "", 7, 2.5, None]
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("1.234,50", 1234.5), ("1,000.25", 1000.25), ("12,5", 12.5), ("1.000.000", 1_000_000.0),
+    ("25 €", 25.0), (7, 7.0), ("sin importe", None), (None, None),
+])
+def test_limpiar_numero(texto, esperado):
+    assert limpiar_numero(texto, por_defecto=None) == esperado
+
+def test_version_vectorizada_igual_que_la_escalar():
+    vectorizada = limpiar_numeros(TEXTOS).tolist()
+    escalar = [limpiar_numero(t, por_defecto=math.nan) for t in TEXTOS]
+    assert [None if v != v else v for v in vectorizada] == [None if v != v else v for v in escalar]
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("15/03/2024", "2024-03-15"), ("2024-03-15", "2024-03-15"), ("15-03-2024 10:30", "2024-03-15"),
+    ("15/03/24", "2024-03-15"), ("", None), ("31/02/2024", None), ("ilegible", None), (None, None),
+])
+def test_fecha_a_iso(texto, esperado):
+    assert fecha_a_iso(texto) == esperado
+
+def test_incidencias_linea():
+    assert incidencias_linea(2.0, 3.0, 6.0) is None
+    assert incidencias_linea(None, 3.0, 6.0) == "cantidad"
+    assert incidencias_linea(2.0, 3.0, 7.0) == "importe"
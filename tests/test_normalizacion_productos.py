@@ -0,0 +1,83 @@
+"""Normalización de los productos de una factura (read_invoice.normalizar_productos_factura)."""
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fitz")
+import read_invoice  # noqa: E402
+
+
+def test_nombres_propuestos_por_la_extraccion_con_su_version(cache_normalizacion):
+    productos = [{"nombre": "Guantes nitrilo T-M", "nombre_normalizado": "Guante de nitrilo"}]
+    read_invoice.normalizar_productos_factura(productos)
+
+    assert productos[0]["nombre_normalizado"] == "guante de nitrilo"
+    assert cache_normalizacion.obtener("Guantes nitrilo T-M", read_invoice.VERSION_NORMALIZACION_EXTRACCION) == "guante de nitrilo"
+    assert cache_normalizacion.obtener("Guantes nitrilo T-M", read_invoice.VERSION_PROMPT_NORMALIZACION) is None
+
+def test_se_mantiene_el_nombre_ya_normalizado_por_otro_prompt(cache_normalizacion):
+    cache_normalizacion.guardar("Guantes nitrilo T-M", read_invoice.VERSION_PROMPT_NORMALIZACION, "guante nitrilo")
+    productos = [{"nombre": "Guantes nitrilo T-M", "nombre_normalizado": "Guante de nitrilo"}]
+    read_invoice.normalizar_productos_factura(productos)
+
+    assert productos[0]["nombre_normalizado"] == "guante nitrilo"
+    assert cache_normalizacion.obtener("Guantes nitrilo T-M", read_invoice.VERSION_NORMALIZACION_EXTRACCION) is None
+
+def test_lote_solo_pide_los_nombres_sin_cache_y_los_guarda_con_su_version(cache_normalizacion, monkeypatch):
+    pedidos = []
+
+    def normalizar_lote(nombres):
+        pedidos.append(list(nombres))
+        return {nombre: nombre.lower() for nombre in nombres if nombre != "Ilegible"}
+
+    monkeypatch.setattr(read_invoice, "_normalizar_lote_ia", normalizar_lote)
+    cache_normalizacion.guardar("Bata azul", read_invoice.VERSION_PROMPT_NORMALIZACION, "bata desechable")
+
+    resultado = read_invoice.normalizar_nombres_productos_ia(["Bata azul", "Gel 500ml", "Gel 500ml", "Ilegible", ""])
+    assert pedidos == [["Gel 500ml", "Ilegible"]]  # una sola petición, sin repetidos ni nombres en caché
+    assert resultado == {"Bata azul": "bata desechable", "Gel 500ml": "gel 500ml",
+                         "Ilegible": "ilegible", "": "Producto Desconocido"}
+    assert cache_normalizacion.obtener("Gel 500ml", read_invoice.VERSION_PROMPT_NORMALIZACION_LOTES) == "gel 500ml"
+    assert cache_normalizacion.obtener("Gel 500ml", read_invoice.VERSION_PROMPT_NORMALIZACION) is None
+    # La normalización básica de un nombre sin respuesta no se guarda: se volverá a pedir
+    assert cache_normalizacion.obtener_alguna("Ilegible", read_invoice.VERSIONES_NORMALIZACION) is None
+
+    read_invoice.normalizar_nombres_productos_ia(["Gel 500ml"])
+    assert len(pedidos) == 1
+
+def test_lotes_de_como_mucho_max_nombres(cache_normalizacion, monkeypatch):
+    pedidos = []
+    monkeypatch.setattr(read_invoice, "_normalizar_lote_ia", lambda nombres: pedidos.append(len(nombres)) or {})
+    read_invoice.normalizar_nombres_productos_ia([f"producto {i}" for i in range(read_invoice.MAX_NOMBRES_POR_LOTE + 1)])
+    assert pedidos == [read_invoice.MAX_NOMBRES_POR_LOTE, 1]
+
+class _PlanificadorFalso:
+    """Responde a cada petición con el contenido indicado y cuenta las peticiones."""
+
+    def __init__(self, contenido):
+        self.contenido = contenido
+        self.peticiones = 0
+
+    def completar(self, **kwargs):
+        self.peticiones += 1
+        if isinstance(self.contenido, Exception):
+            raise self.contenido
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.contenido))])
+
+def test_un_nombre_se_pide_a_la_ia_una_sola_vez(cache_normalizacion, monkeypatch):
+    planificador = _PlanificadorFalso('"Guante de látex"')
+    monkeypatch.setattr(read_invoice, "obtener_planificador", lambda: planificador)
+
+    assert read_invoice.normalizar_nombre_producto_ia("Guantes de latex talla M") == "guante de látex"
+    assert read_invoice.normalizar_nombre_producto_ia("Guantes de latex talla M") == "guante de látex"
+    assert planificador.peticiones == 1
+    assert cache_normalizacion.obtener("Guantes de latex talla M", read_invoice.VERSION_PROMPT_NORMALIZACION) == "guante de látex"
+
+def test_error_de_la_ia_no_se_guarda(cache_normalizacion, monkeypatch):
+    planificador = _PlanificadorFalso(RuntimeError("límite de peticiones"))
+    monkeypatch.setattr(read_invoice, "obtener_planificador", lambda: planificador)
+
+    read_invoice.normalizar_nombre_producto_ia("Batas desechables")
+    read_invoice.normalizar_nombre_producto_ia("Batas desechables")
+    assert planificador.peticiones == 2
+    assert cache_normalizacion.estadisticas()["entradas_disco"] == 0
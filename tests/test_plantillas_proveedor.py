@@ -0,0 +1,60 @@
+"""Plantillas de extracción por proveedor (plantillas_proveedor.py)."""
+import pytest
+
+import plantillas_proveedor
+from plantillas_proveedor import AlmacenPlantillas, validar_factura
+
+MEMBRETE = "SUMINISTROS MEDICOS DEL NORTE S.L.\nPolígono Industrial Sur\nFacturación y pedidos\n"
+
+
+def _texto(numero, fecha, lineas, total):
+    return (MEMBRETE + f"Cliente: Clinica Dental Sonrisa\nFactura nº: {numero}\nFecha: {fecha}\n"
+            "Descripción Cantidad Precio Total\n" + "\n".join(lineas) + f"\nTotal factura: {total}\n")
+
+TEXTO = _texto("FA-2024-001", "15/03/2024", ["Guantes nitrilo 10 2,50 25,00", "Mascarilla FFP2 20 1,00 20,00"], "45,00")
+DATOS = {"nombre_empresa": "Clinica Dental Sonrisa", "numero_factura": "FA-2024-001", "fecha_emision": "15/03/2024",
+         "total_factura": "45,00", "productos": [
+             {"nombre": "Guantes nitrilo", "cantidad": "10", "precio_unitario": "2,50", "total_por_producto": "25,00"},
+             {"nombre": "Mascarilla FFP2", "cantidad": "20", "precio_unitario": "1,00", "total_por_producto": "20,00"}]}
+
+
+def test_validar_factura():
+    assert validar_factura(DATOS) == (True, "")
+    descuadrada = {**DATOS, "total_factura": "60,00"}
+    assert validar_factura(descuadrada)[0] is False
+    linea_mal = {**DATOS, "productos": [{**DATOS["productos"][0], "total_por_producto": "24,00"}, DATOS["productos"][1]]}
+    assert validar_factura(linea_mal)[0] is False
+    assert validar_factura({**DATOS, "fecha_emision": "ayer"})[0] is False
+
+def test_plantilla_aprendida_extrae_otra_factura_del_proveedor(plantillas, tmp_path):
+    assert plantillas.aprender(TEXTO, DATOS) is not None
+    otra = _texto("FA-2024-002", "02/04/2024", ["Bata desechable 4 3,00 12,00"], "14,52")  # con IVA del 21 %
+
+    datos = plantillas.extraer(otra)
+    assert datos["numero_factura"] == "FA-2024-002" and datos["fecha_emision"] == "02/04/2024"
+    assert datos["productos"] == [{"nombre": "Bata desechable", "cantidad": "4", "precio_unitario": "3,00",
+                                   "total_por_producto": "12,00"}]
+    # Se guarda en disco: otro proceso la carga al abrir la carpeta
+    assert AlmacenPlantillas(plantillas.carpeta).extraer(otra) == datos
+
+def test_sin_plantilla_o_resultado_invalido_va_a_la_ia(plantillas):
+    assert plantillas.extraer(TEXTO) is None
+    plantillas.aprender(TEXTO, DATOS)
+    descuadrada = _texto("FA-2024-003", "02/04/2024", ["Bata desechable 4 3,00 12,00"], "99,00")
+    assert plantillas.extraer(descuadrada) is None
+    assert plantillas.estadisticas()["fallos"] == 2
+
+def test_extraccion_con_plantilla_queda_en_la_cache(plantillas, cache_extracciones, tmp_path, monkeypatch):
+    pytest.importorskip("fitz")
+    monkeypatch.chdir(tmp_path)
+    import read_invoice
+    from registro_procesados import hash_texto
+
+    plantillas.aprender(TEXTO, DATOS)
+    monkeypatch.setattr(read_invoice, "extraer_datos_structurados", lambda texto: pytest.fail("no debería llamarse a la IA"))
+    otra = _texto("FA-2024-002", "02/04/2024", ["Bata desechable 4 3,00 12,00"], "12,00")
+
+    datos = read_invoice.extraer_datos_factura(otra)
+    assert cache_extracciones.obtener(hash_texto(otra), read_invoice.MODELO_PLANTILLA,
+                                      read_invoice.VERSION_PROMPT_EXTRACCION) == datos
+    assert [h for h, _ in cache_extracciones.iterar_ultimas()] == [hash_texto(otra)]
@@ -0,0 +1,49 @@
+"""Preparación del texto de la factura para el prompt de extracción (preprocesado_texto.py)."""
+import pytest
+
+pytest.importorskip("fitz")  # preprocesado_texto usa el separador de páginas de extraccion_pdf
+import preprocesado_texto  # noqa: E402
+from preprocesado_texto import SEPARADOR_PAGINA, preparar_texto, combinar_extracciones  # noqa: E402
+
+
+def _pagina(n, total, productos):
+    return "\n".join(["SUMINISTROS MEDICOS DEL NORTE S.L.", "CIF B12345678", "Factura nº: FA-1",
+                      "Descripción    Cantidad   Precio   Total", *productos,
+                      "Registro Mercantil de Bilbao, tomo 1234", f"Página {n} de {total}"])
+
+def _productos(inicio, cantidad):
+    return [f"Producto {i}   {i}   1,00   {i},00" for i in range(inicio, inicio + cantidad)]
+
+
+def test_cabeceras_y_pies_repetidos_una_sola_vez():
+    texto = SEPARADOR_PAGINA.join(_pagina(n, 3, _productos(10 * n, 3)) for n in range(1, 4)) + "\nTotal factura: 999,00"
+    fragmento, = preparar_texto(texto)
+    lineas = fragmento.splitlines()
+
+    assert lineas.count("SUMINISTROS MEDICOS DEL NORTE S.L.") == 1
+    assert lineas.count("Registro Mercantil de Bilbao, tomo 1234") == 1
+    assert not any(linea.startswith("Página") for linea in lineas)
+    # Ninguna línea de producto se pierde y la tabla queda marcada antes de los totales
+    assert [l for l in lineas if l.startswith("Producto")] == [
+        " ".join(p.split()) for n in range(1, 4) for p in _productos(10 * n, 3)]
+    assert lineas.index("--- LÍNEAS DE PRODUCTO ---") < lineas.index("--- FIN DE LÍNEAS DE PRODUCTO ---") \
+        < lineas.index("Total factura: 999,00")
+
+def test_factura_larga_en_fragmentos_con_cabecera():
+    texto = _pagina(1, 1, _productos(1, 200)) + "\nTotal factura: 999,00"
+    fragmentos = preparar_texto(texto, max_tokens=400)
+
+    assert len(fragmentos) > 1
+    assert all(f.startswith("SUMINISTROS MEDICOS DEL NORTE S.L.") for f in fragmentos)
+    assert ["Total factura: 999,00" in f for f in fragmentos] == [False] * (len(fragmentos) - 1) + [True]
+    productos = [l for f in fragmentos for l in f.splitlines() if l.startswith("Producto")]
+    assert len(productos) == 200
+    assert all(preprocesado_texto._contar_tokens(f) <= 400 for f in fragmentos)
+
+def test_combinar_extracciones_de_fragmentos():
+    combinado = combinar_extracciones([
+        {"nombre_empresa": "Acme", "numero_factura": "FA-1", "total_factura": "", "productos": [{"nombre": "a"}]},
+        {"nombre_empresa": "", "numero_factura": "FA-1", "total_factura": "30,00", "productos": [{"nombre": "b"}]},
+    ])
+    assert combinado == {"productos": [{"nombre": "a"}, {"nombre": "b"}], "nombre_empresa": "Acme",
+                         "numero_factura": "FA-1", "total_factura": "30,00"}
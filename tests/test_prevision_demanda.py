@@ -0,0 +1,108 @@
+"""Previsión de demanda intermitente (Croston-SBA) y punto de pedido calculado con ella."""
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+import db_manager
+import consultas
+import punto_pedido
+import prevision_demanda
+
+
+def _factura(db_path, numero, dia, lineas):
+    with db_manager.transaccion(db_path) as conn:
+        db_manager.insertar_factura(conn, numero, dia.isoformat(), None, lineas)
+
+def _tabla(nombre):
+    consultas.actualizar_prevision_empresa(nombre)
+    tabla = punto_pedido.calcular_desde_prevision(consultas.prevision_demanda_empresa(nombre), tiempo_reposicion=5)
+    return tabla.set_index("Producto")
+
+def _series_en_lotes(num_productos, num_dias, semilla):
+    """Compras cada 2-8 semanas con ±20 % de ruido en el intervalo y en el tamaño, desfasadas entre productos."""
+    rng = np.random.default_rng(semilla)
+    series = np.zeros((num_productos, num_dias))
+    intervalo = rng.integers(14, 57, num_productos)
+    tamano = rng.gamma(2.0, 150.0, num_productos)
+    dia = rng.integers(0, intervalo)
+    filas = np.arange(num_productos)
+    while (dia < num_dias).any():
+        activa = dia < num_dias
+        series[filas[activa], dia[activa]] += np.round(tamano[activa] * rng.uniform(0.8, 1.2, activa.sum()))
+        dia = dia + np.maximum(1, np.round(intervalo * rng.uniform(0.8, 1.2, num_productos))).astype(int)
+    return series
+
+
+def test_compras_periodicas_en_lotes():
+    # 300 unidades cada 30 días: 10 al día, con la corrección SBA (1 - α/2)
+    series = np.zeros((1, 181))
+    series[0, ::30] = 300
+    estado = prevision_demanda.ajustar_series(series)
+    assert estado["tamano"][0] == pytest.approx(300)
+    assert estado["intervalo"][0] == pytest.approx(30)
+    assert prevision_demanda.demanda_diaria(estado)[0] == pytest.approx(10 * (1 - estado["alfa"][0] / 2))
+    # En 5 días cae una compra con probabilidad 1/6 > 5 %: el punto de pedido cubre el lote entero
+    assert prevision_demanda.cuantil_plazo(estado, [5.0], 0.95)[0] == pytest.approx(300, abs=0.01)
+
+def test_punto_de_pedido_no_depende_del_punto_del_ciclo(empresa):
+    nombre, db_path = empresa
+    inicio = date(2024, 1, 1)
+    for n in range(7):
+        _factura(db_path, f"L-{n}", inicio + timedelta(days=30 * n), [("lejia", 300.0, 1.0, 300.0)])
+    _factura(db_path, "G-0", inicio, [("guante", 10.0, 1.0, 10.0)])
+    ultima_lejia = inicio + timedelta(days=180)
+
+    filas = []
+    # Facturas de otro producto mueven la fecha de la empresa por todo el ciclo de compras de la lejía
+    for dias in (1, 10, 20, 29):
+        _factura(db_path, f"G-{dias}", ultima_lejia + timedelta(days=dias), [("guante", 10.0, 1.0, 10.0)])
+        filas.append(_tabla(nombre).loc["lejia"].to_dict())
+    assert all(fila == filas[0] for fila in filas)
+    assert filas[0]["Punto de pedido (unidades)"] == 300
+    assert filas[0]["Demanda diaria estimada"] == pytest.approx(9.75, abs=0.3)
+
+def test_reajuste_tras_eliminar_una_compra(empresa):
+    nombre, db_path = empresa
+    inicio = date(2024, 1, 1)
+    for n in range(4):
+        _factura(db_path, f"F-{n}", inicio + timedelta(days=10 * n), [("papel", 50.0, 1.0, 50.0)])
+    antes = _tabla(nombre).loc["papel", "Demanda diaria estimada"]
+    with db_manager.transaccion(db_path) as conn:
+        linea_id = conn.execute("""
+            SELECT l.id FROM lineas_factura l JOIN cabeceras_factura c ON c.id = l.factura_id
+            WHERE c.numero_factura = 'F-1'
+        """).fetchone()[0]
+        db_manager.eliminar_linea(conn, linea_id)
+
+    # Quedan compras los días 0, 20 y 30: el modelo guardado se descarta y se ajusta de nuevo
+    series = np.zeros((1, 31))
+    series[0, [0, 20, 30]] = 50
+    esperada = prevision_demanda.demanda_diaria(prevision_demanda.ajustar_series(series))[0]
+    despues = _tabla(nombre).loc["papel", "Demanda diaria estimada"]
+    assert despues != antes
+    assert despues == round(esperada, 2)
+
+def test_roturas_cerca_del_nivel_de_servicio_con_compras_en_lotes():
+    plazo = 5
+    series = _series_en_lotes(4_000, 365, semilla=11)
+    entrenamiento, real = series[:, :-plazo], series[:, -plazo:].sum(axis=1)
+    validos = (entrenamiento > 0).sum(axis=1) >= 2
+    estado = prevision_demanda.ajustar_series(entrenamiento[validos])
+    punto = prevision_demanda.cuantil_plazo(estado, np.full(validos.sum(), float(plazo)), 0.95)
+    assert (real[validos] > punto).mean() <= 0.08
+
+def test_la_lectura_no_reajusta(empresa):
+    nombre, db_path = empresa
+    for n in range(3):
+        _factura(db_path, f"F-{n}", date(2024, 1, 1) + timedelta(days=10 * n), [("papel", 50.0, 1.0, 50.0)])
+    assert consultas.prevision_demanda_empresa(nombre).empty
+    assert consultas.actualizar_prevision_empresa(nombre) == 1
+    assert consultas.actualizar_prevision_empresa(nombre) == 0
+
+    # Una factura nueva no cambia lo leído hasta el siguiente reajuste
+    antes = consultas.prevision_demanda_empresa(nombre)
+    _factura(db_path, "F-3", date(2024, 1, 12), [("papel", 500.0, 1.0, 500.0)])
+    assert consultas.prevision_demanda_empresa(nombre).equals(antes)
+    assert consultas.actualizar_prevision_empresa(nombre) == 1
+    assert not consultas.prevision_demanda_empresa(nombre).equals(antes)
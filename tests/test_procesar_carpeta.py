@@ -0,0 +1,47 @@
+"""Procesamiento de la carpeta de facturas pendientes (read_invoice.procesar_facturas_en_carpeta)."""
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("fitz")
+import read_invoice  # noqa: E402
+
+
+@pytest.fixture
+def pendientes(tmp_path, monkeypatch, cache_normalizacion, plantillas):
+    """Ocho PDF en la carpeta de pendientes y un procesar_factura que anota cuántos hilos lo ejecutan a la vez."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(read_invoice.CARPETA_FACTURAS)
+    for n in range(8):
+        (tmp_path / read_invoice.CARPETA_FACTURAS / f"factura_{n}.pdf").write_bytes(b"%PDF")
+    estado = {"activas": 0, "maximo": 0}
+    lock = threading.Lock()
+
+    def procesar(ruta_pdf):
+        with lock:
+            estado["activas"] += 1
+            estado["maximo"] = max(estado["maximo"], estado["activas"])
+        time.sleep(0.05)
+        with lock:
+            estado["activas"] -= 1
+        return f"✅ {os.path.basename(ruta_pdf)}"
+
+    monkeypatch.setattr(read_invoice, "procesar_factura", procesar)
+    return estado
+
+
+@pytest.mark.parametrize("max_concurrencia", [1, 3])
+def test_pool_limitado_y_resumen_en_orden(pendientes, max_concurrencia):
+    archivos = [f for f in os.listdir(read_invoice.CARPETA_FACTURAS) if f.endswith(".pdf")]
+    resumen = read_invoice.procesar_facturas_en_carpeta(max_concurrencia=max_concurrencia)
+
+    assert resumen.splitlines() == [f"✅ {archivo}" for archivo in archivos]
+    assert 1 <= pendientes["maximo"] <= max_concurrencia
+    if max_concurrencia > 1:
+        assert pendientes["maximo"] > 1
+
+def test_carpeta_vacia(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert read_invoice.procesar_facturas_en_carpeta() == "No se encontraron facturas pendientes de procesar."
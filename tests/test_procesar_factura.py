@@ -0,0 +1,66 @@
+"""Procesamiento de una factura (read_invoice.procesar_factura) con la extracción sustituida por datos fijos."""
+import os
+
+import pytest
+
+import db_manager
+import indice_productos
+
+pytest.importorskip("fitz")
+import read_invoice  # noqa: E402
+
+
+@pytest.fixture
+def ingesta(tmp_path, monkeypatch, registro, cache_normalizacion):
+    """Cuenta las extracciones de texto y de datos; la factura extraída es siempre la F-1 de 'Acme'."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(indice_productos, "_indices", {})
+    llamadas = {"texto": 0, "datos": 0}
+
+    def extraer_texto(contenido):
+        llamadas["texto"] += 1
+        return contenido.decode().strip()
+
+    def extraer_datos(texto):
+        llamadas["datos"] += 1
+        return {"nombre_empresa": "Acme", "numero_factura": "F-1", "fecha_emision": "2024-01-15",
+                "total_factura": "20", "productos": [
+                    {"nombre": "Guantes nitrilo", "nombre_normalizado": "guante de nitrilo",
+                     "cantidad": "10", "precio_unitario": "2", "total_por_producto": "20"}]}
+
+    monkeypatch.setattr(read_invoice, "extraer_texto_pdf", extraer_texto)
+    monkeypatch.setattr(read_invoice, "extraer_datos_factura", extraer_datos)
+    yield llamadas
+    db_manager.cerrar_conexiones()
+
+def _pdf(nombre, contenido):
+    os.makedirs(read_invoice.CARPETA_FACTURAS, exist_ok=True)
+    ruta = os.path.join(read_invoice.CARPETA_FACTURAS, nombre)
+    with open(ruta, "wb") as f:
+        f.write(contenido)
+    return ruta
+
+
+def test_documentos_conocidos_se_omiten_antes_de_extraer(ingesta):
+    assert read_invoice.procesar_factura(_pdf("a.pdf", b"factura F-1")).startswith("✅")
+
+    # Mismos bytes: ni siquiera se extrae el texto
+    assert "omitida" in read_invoice.procesar_factura(_pdf("copia.pdf", b"factura F-1"))
+    assert ingesta == {"texto": 1, "datos": 1}
+    # Mismo texto con otros bytes: no se llama a la extracción de datos
+    assert "omitida" in read_invoice.procesar_factura(_pdf("reexportada.pdf", b"factura F-1\n"))
+    assert ingesta == {"texto": 2, "datos": 1}
+    assert not os.listdir(read_invoice.CARPETA_FACTURAS)
+
+def test_factura_eliminada_se_vuelve_a_procesar(ingesta, registro):
+    read_invoice.procesar_factura(_pdf("a.pdf", b"factura F-1"))
+    db_path = db_manager.ruta_bd_empresa("acme")
+    with db_manager.transaccion(db_path) as conn:
+        db_manager.eliminar_linea(conn, conn.execute("SELECT id FROM lineas_factura").fetchone()[0])
+    registro.olvidar("acme", "F-1")
+
+    assert read_invoice.procesar_factura(_pdf("a.pdf", b"factura F-1")).startswith("✅")
+    assert ingesta["datos"] == 2
+    with db_manager.conexion(db_path) as conn:
+        assert db_manager.factura_existe(conn, "F-1")
+    assert not registro.eliminada("acme", "F-1")
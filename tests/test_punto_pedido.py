@@ -0,0 +1,97 @@
+"""El punto de pedido vectorizado debe dar exactamente la misma tabla que el cálculo original de app.py."""
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import punto_pedido
+
+TIEMPO_REPOSICION_DIAS = 5  # estándar
+
+
+# Copia literal de calcular_punto_pedido de app.py en la versión de partida (antes de punto_pedido.py)
+def calcular_punto_pedido(df):
+    if df.empty:
+        return pd.DataFrame()
+
+    df["fecha_emision"] = pd.to_datetime(df["fecha_emision"], errors="coerce")
+    df["cantidad"] = pd.to_numeric(df["cantidad"].str.extract(r"([\d,.]+)")[0].str.replace(".", "").str.replace(",", "."), errors='coerce')
+    df = df.dropna(subset=["fecha_emision", "nombre_producto", "cantidad"])
+
+    df_grouped = df.groupby(["nombre_producto", "fecha_emision"]).agg({"cantidad": "sum"}).reset_index()
+
+    resultados = []
+    for producto, grupo in df_grouped.groupby("nombre_producto"):
+        grupo = grupo.sort_values("fecha_emision")
+        if len(grupo) < 2:
+            continue
+
+        total_dias = (grupo["fecha_emision"].max() - grupo["fecha_emision"].min()).days
+        total_unidades = grupo["cantidad"].sum()
+
+        if total_dias == 0:
+            demanda_diaria = total_unidades
+        else:
+            demanda_diaria = total_unidades / total_dias
+
+        stock_seguridad = demanda_diaria * 7 * 0.2
+        punto_pedido = (demanda_diaria * TIEMPO_REPOSICION_DIAS) + stock_seguridad
+
+        resultados.append({
+            "Producto": producto,
+            "Demanda diaria estimada": round(demanda_diaria, 2),
+            "Stock de seguridad": int(round(stock_seguridad)),
+            "Punto de pedido (unidades)": int(round(punto_pedido))
+        })
+
+    return pd.DataFrame(resultados)
+
+
+# Valores a medias: 2953 unidades en 200 días son 14.765 al día (14.76 con el round() original sobre np.float64);
+# 105 unidades en 60 días dan un stock de seguridad de 2.45 y 75 unidades en 2 días, 52.5
+A_MEDIAS = pd.DataFrame({
+    "nombre_producto": ["a", "a", "b", "b", "c", "c"],
+    "fecha_emision": ["2024-01-01", "2024-07-19", "2024-01-01", "2024-03-01", "2024-05-01", "2024-05-03"],
+    "cantidad": ["1000 unidades", "1953 unidades", "100 unidades", "5 unidades", "50 unidades", "25 unidades"],
+})
+
+def _lineas(num_productos, semilla, lineas_por_producto=6):
+    """Líneas con la forma de la vista 'facturas': cantidad como texto, con separador de miles en algunas."""
+    rng = np.random.default_rng(semilla)
+    n = num_productos * lineas_por_producto
+    fechas = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D")
+    return pd.DataFrame({
+        "nombre_producto": np.repeat([f"producto {i}" for i in range(num_productos)], lineas_por_producto),
+        "fecha_emision": fechas.strftime("%Y-%m-%d"),
+        "cantidad": [f"{c:,} unidades".replace(",", ".") for c in rng.integers(1, 5_000, n)],
+    })
+
+def _comparar(obtenido, df, tiempo_reposicion, monkeypatch):
+    monkeypatch.setattr(sys.modules[__name__], "TIEMPO_REPOSICION_DIAS", tiempo_reposicion)
+    esperado = calcular_punto_pedido(df.copy()).reset_index(drop=True)
+    pd.testing.assert_frame_equal(obtenido.reset_index(drop=True), esperado, check_dtype=False)
+    return obtenido
+
+
+def test_valores_a_medias_como_el_original(monkeypatch):
+    tabla = _comparar(punto_pedido.calcular_punto_pedido(A_MEDIAS), A_MEDIAS, 5, monkeypatch).set_index("Producto")
+    assert tabla.loc["a", "Demanda diaria estimada"] == 14.76
+
+@pytest.mark.parametrize("tiempo_reposicion", [1, 5, 12])
+def test_paridad_con_el_calculo_original(tiempo_reposicion, monkeypatch):
+    lineas = _lineas(2_000, semilla=3)
+    _comparar(punto_pedido.calcular_punto_pedido(lineas, tiempo_reposicion), lineas, tiempo_reposicion, monkeypatch)
+
+def test_paridad_desde_resumen(monkeypatch):
+    lineas = pd.concat([A_MEDIAS, _lineas(500, semilla=5)], ignore_index=True)
+    fechas = pd.to_datetime(lineas["fecha_emision"])
+    cantidades = lineas["cantidad"].str.extract(r"([\d.]+)")[0].str.replace(".", "").astype(float)
+    por_dia = lineas.assign(fecha=fechas, cantidad=cantidades).groupby(["nombre_producto", "fecha"])["cantidad"].sum().reset_index()
+    resumen = por_dia.groupby("nombre_producto").agg(
+        dias_con_compra=("fecha", "size"), primera_fecha=("fecha", "min"),
+        ultima_fecha=("fecha", "max"), total_unidades=("cantidad", "sum")).reset_index()
+    resumen["primera_fecha"] = resumen["primera_fecha"].dt.strftime("%Y-%m-%d")
+    resumen["ultima_fecha"] = resumen["ultima_fecha"].dt.strftime("%Y-%m-%d")
+
+    _comparar(punto_pedido.calcular_desde_resumen(resumen), lineas, 5, monkeypatch)
@@ -0,0 +1,51 @@
+"""Extracciones reutilizadas desde la caché y reconstrucción de las BD sin llamar a OpenAI (read_invoice.py)."""
+import pytest
+
+import db_manager
+import indice_productos
+from registro_procesados import hash_texto
+
+pytest.importorskip("fitz")
+import read_invoice  # noqa: E402
+
+
+def _factura(numero):
+    return {"nombre_empresa": "Acme", "numero_factura": numero, "fecha_emision": "2024-01-15", "total_factura": "20",
+            "productos": [{"nombre": "Guantes nitrilo", "nombre_normalizado": "guante de nitrilo",
+                           "cantidad": "10", "precio_unitario": "2", "total_por_producto": "20"}]}
+
+class _SinIA:
+    def completar(self, **kwargs):
+        raise AssertionError("no debería llamarse a OpenAI")
+
+@pytest.fixture
+def sin_ia(tmp_path, monkeypatch, registro, cache_normalizacion, cache_extracciones):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(indice_productos, "_indices", {})
+    monkeypatch.setattr(read_invoice, "obtener_planificador", lambda: _SinIA())
+    yield
+    db_manager.cerrar_conexiones()
+
+
+def test_el_mismo_texto_reutiliza_la_extraccion(sin_ia, cache_extracciones):
+    cache_extracciones.guardar(hash_texto("FACTURA  F-1\nAcme"), read_invoice.MODELO_EXTRACCION,
+                               read_invoice.VERSION_PROMPT_EXTRACCION, _factura("F-1"))
+    # El hash ignora espacios y mayúsculas
+    assert read_invoice.extraer_datos_structurados("factura f-1 acme")["numero_factura"] == "F-1"
+
+def test_reconstruccion_sin_las_facturas_eliminadas(sin_ia, registro, cache_extracciones):
+    for numero in ("F-1", "F-2"):
+        cache_extracciones.guardar(hash_texto(numero), read_invoice.MODELO_EXTRACCION,
+                                   read_invoice.VERSION_PROMPT_EXTRACCION, _factura(numero))
+    registro.olvidar("acme", "F-2")  # eliminada desde la aplicación
+
+    resumen = read_invoice.reconstruir_bases_desde_cache()
+    assert "1 facturas insertadas" in resumen and "1 eliminadas" in resumen
+    with db_manager.conexion(db_manager.ruta_bd_empresa("acme")) as conn:
+        assert db_manager.factura_existe(conn, "F-1")
+        assert not db_manager.factura_existe(conn, "F-2")
+
+    # La BD anterior queda en la carpeta de respaldo y la nueva tiene lo mismo
+    read_invoice.reconstruir_bases_desde_cache()
+    with db_manager.conexion(db_manager.ruta_bd_empresa("acme")) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM lineas_factura").fetchone()[0] == 1
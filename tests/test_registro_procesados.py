@@ -0,0 +1,27 @@
+"""Registro de documentos procesados (registro_procesados.py)."""
+import db_manager
+from registro_procesados import hash_bytes, TIPO_PDF
+
+PDF = b"%PDF-1.4 factura F-1"
+
+
+def test_factura_eliminada_se_puede_volver_a_subir(empresa, registro):
+    nombre, db_path = empresa
+    with db_manager.transaccion(db_path) as conn:
+        db_manager.insertar_factura(conn, "F-1", "2024-01-15", 10.0, [("tornillos", 10.0, 1.0, 10.0)])
+    registro.registrar(nombre, "F-1", "f1.pdf", hash_pdf=hash_bytes(PDF))
+    assert registro.buscar(hash_bytes(PDF), TIPO_PDF)["numero_factura"] == "F-1"
+
+    # Lo que hace eliminar_factura_de_db al borrar la última línea de la factura
+    with db_manager.transaccion(db_path) as conn:
+        linea_id = conn.execute("SELECT id FROM lineas_factura").fetchone()[0]
+        db_manager.eliminar_linea(conn, linea_id)
+        assert not db_manager.factura_existe(conn, "F-1")
+    assert registro.olvidar(nombre, "F-1") == 1
+
+    assert registro.buscar(hash_bytes(PDF), TIPO_PDF) is None
+    assert registro.eliminada(nombre, "F-1")
+    # Al volver a subirla deja de estar marcada como eliminada
+    registro.registrar(nombre, "F-1", "f1.pdf", hash_pdf=hash_bytes(PDF))
+    assert registro.buscar(hash_bytes(PDF), TIPO_PDF) is not None
+    assert not registro.eliminada(nombre, "F-1")
@@ -0,0 +1,62 @@
+"""Vigilante de la carpeta de facturas pendientes (vigilante_facturas.py)."""
+import os
+import threading
+
+import pytest
+
+import vigilante_facturas
+from vigilante_facturas import VigilanteFacturas
+
+
+def _escribir(carpeta, nombre, contenido):
+    with open(os.path.join(carpeta, nombre), "wb") as f:
+        f.write(contenido)
+
+
+def test_cada_pdf_completo_se_notifica_una_vez(tmp_path):
+    detectados = []
+    vigilante = VigilanteFacturas(str(tmp_path), al_detectar=detectados.append, espera_estable=0)
+    _escribir(tmp_path, "a.pdf", b"%PDF a")
+    _escribir(tmp_path, "vacio.pdf", b"")
+    _escribir(tmp_path, "notas.txt", b"no es una factura")
+
+    for _ in range(2):
+        vigilante._escanear()
+        vigilante._confirmar_estables()
+    assert detectados == [str(tmp_path / "a.pdf")]
+    assert vigilante.pendientes == 2
+
+    # Si se sobrescribe, vuelve a notificarse; si desaparece, deja de contar
+    _escribir(tmp_path, "a.pdf", b"%PDF a corregida")
+    os.remove(tmp_path / "vacio.pdf")
+    vigilante._escanear()
+    vigilante._confirmar_estables()
+    assert detectados == [str(tmp_path / "a.pdf")] * 2
+    assert vigilante.pendientes == 1
+
+def test_pdf_a_medio_escribir_espera(tmp_path):
+    detectados = []
+    vigilante = VigilanteFacturas(str(tmp_path), al_detectar=detectados.append, espera_estable=3600)
+    _escribir(tmp_path, "a.pdf", b"%PDF a")
+    vigilante._escanear()
+    vigilante._confirmar_estables()
+    assert detectados == [] and vigilante.pendientes == 1
+
+@pytest.mark.parametrize("modo", ["inotify", "sondeo"])
+def test_detecta_pdf_nuevos_en_segundo_plano(tmp_path, monkeypatch, modo):
+    if modo == "sondeo":
+        monkeypatch.setattr(vigilante_facturas, "_abrir_inotify", lambda carpeta: None)
+    else:
+        fd = vigilante_facturas._abrir_inotify(str(tmp_path))
+        if fd is None:
+            pytest.skip("inotify no está disponible")
+        os.close(fd)
+    detectado = threading.Event()
+    vigilante = VigilanteFacturas(str(tmp_path), al_detectar=lambda ruta: detectado.set(),
+                                  espera_estable=0.1, intervalo_sondeo=0.05).iniciar()
+    try:
+        _escribir(tmp_path, "nueva.pdf", b"%PDF nueva")
+        assert detectado.wait(10)
+        assert vigilante.modo == modo
+    finally:
+        vigilante.detener()
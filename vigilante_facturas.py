@@ -0,0 +1,190 @@
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+
+# Configuración
+ESPERA_ESTABLE_SEGUNDOS = 2.0   # un PDF se considera completo cuando su tamaño no cambia durante este tiempo
+INTERVALO_SONDEO_SEGUNDOS = 2.0  # solo en modo sondeo (sin inotify)
+
+# Constantes de inotify (linux/inotify.h)
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_CABECERA_EVENTO = struct.Struct("iIII")
+
+
+def _abrir_inotify(carpeta):
+    """Devuelve un descriptor inotify que vigila `carpeta`, o None si inotify no está disponible."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            return None
+        mascara = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+        if libc.inotify_add_watch(fd, os.fsencode(carpeta), mascara) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+def _leer_eventos(fd):
+    """Lee los eventos disponibles del descriptor inotify. Devuelve una lista de (mascara, nombre)."""
+    try:
+        datos = os.read(fd, 64 * 1024)
+    except BlockingIOError:
+        return []
+    eventos = []
+    desplazamiento = 0
+    while desplazamiento < len(datos):
+        _, mascara, _, longitud = _CABECERA_EVENTO.unpack_from(datos, desplazamiento)
+        desplazamiento += _CABECERA_EVENTO.size
+        nombre = datos[desplazamiento:desplazamiento + longitud].rstrip(b"\0").decode("utf-8", "replace")
+        desplazamiento += longitud
+        eventos.append((mascara, nombre))
+    return eventos
+
+
+class VigilanteFacturas:
+    """
+    Vigila la carpeta de facturas pendientes y llama a `al_detectar(ruta)` cuando aparece un PDF completo.
+    Usa inotify en Linux y, si no está disponible, sondea la carpeta. Un PDF se da por completo cuando su
+    tamaño y fecha de modificación no cambian durante `espera_estable` segundos (evita leer escrituras a medias).
+    Mantiene en memoria el número de PDF presentes en la carpeta (propiedad `pendientes`).
+    """
+
+    def __init__(self, carpeta, al_detectar=None, espera_estable=ESPERA_ESTABLE_SEGUNDOS,
+                 intervalo_sondeo=INTERVALO_SONDEO_SEGUNDOS):
+        self.carpeta = carpeta
+        self.al_detectar = al_detectar
+        self.espera_estable = espera_estable
+        self.intervalo_sondeo = intervalo_sondeo
+        self._presentes = set()
+        self._candidatos = {}  # nombre -> (tamaño, mtime, instante del último cambio)
+        self._notificados = {}  # nombre -> (tamaño, mtime) con el que se notificó
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._hilo = None
+        self.modo = None
+
+    @property
+    def pendientes(self):
+        with self._lock:
+            return len(self._presentes)
+
+    def iniciar(self):
+        os.makedirs(self.carpeta, exist_ok=True)
+        self._hilo = threading.Thread(target=self._ejecutar, name="vigilante-facturas", daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._parar.set()
+        if self._hilo:
+            self._hilo.join()
+
+    def _ejecutar(self):
+        fd = _abrir_inotify(self.carpeta)
+        self.modo = "inotify" if fd is not None else "sondeo"
+        logging.info(f"👀 Vigilando '{self.carpeta}' ({self.modo}).")
+        # Los PDF que ya estaban en la carpeta también se procesan
+        self._escanear()
+        try:
+            while not self._parar.is_set():
+                if fd is not None:
+                    listos, _, _ = select.select([fd], [], [], min(self.espera_estable, 1.0))
+                    if listos:
+                        for mascara, nombre in _leer_eventos(fd):
+                            if mascara & _IN_Q_OVERFLOW:
+                                self._escanear()  # se perdieron eventos: volver a mirar la carpeta entera
+                            else:
+                                self._registrar_evento(mascara, nombre)
+                else:
+                    self._parar.wait(self.intervalo_sondeo)
+                    self._escanear()
+                self._confirmar_estables()
+        except Exception as e:
+            logging.error(f"❌ El vigilante de facturas se ha detenido por un error: {e}")
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def _registrar_evento(self, mascara, nombre):
+        if not nombre.lower().endswith(".pdf"):
+            return
+        if mascara & (_IN_DELETE | _IN_MOVED_FROM):
+            with self._lock:
+                self._presentes.discard(nombre)
+                self._candidatos.pop(nombre, None)
+                self._notificados.pop(nombre, None)
+        else:
+            self._observar(nombre)
+
+    def _escanear(self):
+        try:
+            nombres = {e.name for e in os.scandir(self.carpeta) if e.is_file() and e.name.lower().endswith(".pdf")}
+        except FileNotFoundError:
+            nombres = set()
+        with self._lock:
+            for desaparecido in self._presentes - nombres:
+                self._candidatos.pop(desaparecido, None)
+                self._notificados.pop(desaparecido, None)
+            self._presentes &= nombres
+        for nombre in nombres:
+            self._observar(nombre)
+
+    def _observar(self, nombre):
+        """Anota el tamaño y mtime actuales del archivo; si han cambiado, reinicia su espera."""
+        try:
+            estado = os.stat(os.path.join(self.carpeta, nombre))
+        except FileNotFoundError:
+            return
+        firma = (estado.st_size, estado.st_mtime)
+        with self._lock:
+            self._presentes.add(nombre)
+            previo = self._candidatos.get(nombre)
+            if previo is None and self._notificados.get(nombre) == firma:
+                return  # ya se notificó y no ha vuelto a cambiar
+            if previo is None or previo[:2] != firma:
+                self._candidatos[nombre] = (*firma, time.monotonic())
+
+    def _confirmar_estables(self):
+        ahora = time.monotonic()
+        listos = []
+        with self._lock:
+            for nombre, (tamano, mtime, cambio) in list(self._candidatos.items()):
+                if ahora - cambio < self.espera_estable:
+                    continue
+                try:
+                    estado = os.stat(os.path.join(self.carpeta, nombre))
+                except FileNotFoundError:
+                    self._candidatos.pop(nombre)
+                    self._presentes.discard(nombre)
+                    continue
+                if (estado.st_size, estado.st_mtime) != (tamano, mtime):
+                    self._candidatos[nombre] = (estado.st_size, estado.st_mtime, ahora)
+                elif estado.st_size > 0:
+                    self._candidatos.pop(nombre)
+                    self._notificados[nombre] = (tamano, mtime)
+                    listos.append(nombre)
+        for nombre in listos:
+            logging.info(f"📄 Nueva factura detectada: {nombre}")
+            if self.al_detectar:
+                try:
+                    self.al_detectar(os.path.join(self.carpeta, nombre))
+                except Exception as e:
+                    logging.error(f"❌ Error al encolar la factura detectada '{nombre}': {e}")